@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基于asyncio的电费查询
+
+与ElectricityQuery的步骤完全一致（访问首页、选择校区、社区、楼栋、查询电费），
+但所有请求都通过aiohttp在同一个事件循环中完成，
+大量房间的查询可以共享一个进程，而不必每个房间占用一个线程。
+"""
+
+import asyncio
+import functools
+import json
+import time
+from urllib.parse import urlencode
+
+import aiohttp
+
+from dedup import DedupIndex
+from electricity_cli import (
+    absolute_url, month_form, next_page_form, normalize_base_url, postback_form, print_table_cells, room_form,
+    total_usage,
+)
+from page_model import Page, PageResponse, decode_body
+from record_store import room_key, month_range
+from resilience import RETRY_STATUS_CODES, RequestFailed, RetryPolicy, SessionExpired, is_login_redirect
+
+DEFAULT_CONCURRENCY = 100
+
+
+class AsyncElectricityQuery:
+    def __init__(self, vpn_cookie=None, store=None, connector=None, base_url=None, metrics=None,
+                 retry_policy=None):
+        self.base_url = normalize_base_url(base_url)
+        # RequestMetrics，为None时不记录性能指标
+        self.metrics = metrics
+        self.retry_policy = retry_policy or RetryPolicy()
+        cookies = json.loads(vpn_cookie) if vpn_cookie else None
+        # 传入connector时多个查询共用连接池，由调用方负责关闭
+        # 默认的CookieJar会丢弃IP地址主机（例如本地的stand_in_server.py）设置的cookie，
+        # 那样ASP.NET_SessionId不会被保存，之后的回发都没有登录的房间
+        self.session = aiohttp.ClientSession(cookies=cookies, connector=connector,
+                                             connector_owner=connector is None,
+                                             cookie_jar=aiohttp.CookieJar(unsafe=True))
+        self.session.headers.update({
+            'Cache-Control': 'max-age=0',
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/144.0.0.0 Safari/537.36',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
+            'Accept-Language': 'zh-CN,zh;q=0.9',
+        })
+        self.store = store
+        self.selection = {}
+        self.form_values = {}
+
+    async def close(self):
+        await self.session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def _request(self, step, method, url, data=None):
+        """
+        发送一次请求并读取完整响应，step为所属的查询步骤（用于性能指标）
+        连接错误、超时和网关错误按重试策略退避重试；被跳转到VPN登录页面时抛出SessionExpired
+        """
+        for attempt in range(self.retry_policy.max_attempts):
+            if attempt:
+                if self.metrics is not None:
+                    self.metrics.observe_retry(step)
+                await asyncio.sleep(self.retry_policy.delay(attempt - 1))
+
+            start = time.perf_counter()
+            try:
+                async with self.session.request(method, url, data=data, ssl=False) as response:
+                    body = await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if self.metrics is not None:
+                    self.metrics.observe_request(step, time.perf_counter() - start, error=str(e))
+                error = str(e)
+                continue
+            if self.metrics is not None:
+                bytes_sent = len(urlencode(data).encode('utf-8')) if data else 0
+                self.metrics.observe_request(step, time.perf_counter() - start, bytes_sent,
+                                             len(body), response.status)
+
+            if is_login_redirect(response.url.path) or any(
+                    is_login_redirect(previous.headers.get('Location')) for previous in response.history):
+                raise SessionExpired("VPN票据已失效")
+            if response.status in RETRY_STATUS_CODES:
+                error = f"状态码{response.status}"
+                continue
+            text = decode_body(body, response.headers.get('Content-Type'))
+            return PageResponse(response.status, text, str(response.url))
+
+        raise RequestFailed(f"{step}请求失败：{error}")
+
+    async def _get(self, url, step=None):
+        return await self._request(step, 'GET', url)
+
+    async def _post(self, url, data, step=None):
+        return await self._request(step, 'POST', url, data)
+
+    def _room_key(self, room_number):
+        return room_key(self.selection.get('campus', ''), self.selection.get('community', ''),
+                        self.selection.get('building', ''), room_number)
+
+    async def query_room(self, campus, community, building, room_number, password, start_date, end_date):
+        """
+        依次完成访问系统、选择校区、社区、楼栋并查询电费
+        """
+        response = await self.get_electricity_page()
+        if not response:
+            print("\n❌ 无法访问电费查询系统")
+            return None
+
+        response = await self.select_campus(response, campus)
+        if not response:
+            print("\n❌ 无法选择校区")
+            return None
+
+        response = await self.select_community(response, community)
+        if not response:
+            print("\n❌ 无法选择社区")
+            return None
+
+        response = await self.select_building(response, building)
+        if not response:
+            print("\n❌ 无法选择楼栋")
+            return None
+
+        return await self.query_electricity(response, room_number, password, start_date, end_date)
+
+    async def get_electricity_page(self):
+        print(f"正在访问电费查询系统：{self.base_url}")
+
+        try:
+            response = await self._get(self.base_url, 'landing')
+            print(f"响应状态码：{response.status_code}")
+            return Page.from_response(response)
+        except Exception as e:
+            print(f"访问失败：{str(e)}")
+            return None
+
+    async def select_campus(self, response, campus_name):
+        print(f"\n正在选择校区：{campus_name}")
+
+        try:
+            form_state = Page.from_response(response).form_state
+            if not form_state:
+                print("未找到表单参数，无法选择校区")
+                return None
+
+            data = postback_form(form_state, 'ddlXiaoQu', {'ddlXiaoQu': campus_name})
+
+            response = await self._post(self.base_url, data, 'campus')
+            print(f"选择校区响应状态码：{response.status_code}")
+            self.selection = {'campus': campus_name}
+            self.form_values = {'ddlXiaoQu': campus_name}
+            return Page.from_response(response)
+        except Exception as e:
+            print(f"选择校区失败：{str(e)}")
+            return None
+
+    async def select_community(self, response, community_name):
+        print(f"\n正在选择社区：{community_name}")
+
+        try:
+            page = Page.from_response(response)
+
+            form_state = page.form_state
+            if not form_state:
+                print("未找到表单参数，无法选择社区")
+                return None
+
+            community_options = page.options.get('ddlQuYu')
+            if community_options is None:
+                print("未找到社区选择下拉框")
+                return None
+            community_value = community_options.get(community_name)
+            if not community_value:
+                print(f"未找到匹配的社区选项：{community_name}")
+                return None
+
+            data = postback_form(form_state, 'ddlQuYu', {
+                'ddlXiaoQu': self.form_values.get('ddlXiaoQu', '校本部'),
+                'ddlQuYu': community_value
+            })
+
+            response = await self._post(self.base_url, data, 'community')
+            print(f"选择社区响应状态码：{response.status_code}")
+            self.selection['community'] = community_name
+            self.form_values['ddlQuYu'] = community_value
+            return Page.from_response(response)
+        except Exception as e:
+            print(f"选择社区失败：{str(e)}")
+            return None
+
+    async def select_building(self, response, building_number):
+        print(f"\n正在选择楼栋：{building_number}")
+
+        try:
+            page = Page.from_response(response)
+
+            form_state = page.form_state
+            if not form_state:
+                print("未找到表单参数，无法选择楼栋")
+                return None
+
+            building_options = page.options.get('ddlLouDong')
+            if building_options is None:
+                print("未找到楼栋选择下拉框")
+                return None
+            building_value = building_options.get(building_number)
+            if not building_value:
+                print(f"未找到匹配的楼栋选项：{building_number}")
+                return None
+
+            data = postback_form(form_state, 'ddlLouDong', {
+                'ddlXiaoQu': self.form_values.get('ddlXiaoQu', '校本部'),
+                'ddlQuYu': self.form_values.get('ddlQuYu', ''),
+                'ddlLouDong': building_value
+            })
+
+            response = await self._post(self.base_url, data, 'building')
+            print(f"选择楼栋响应状态码：{response.status_code}")
+            self.selection['building'] = building_number
+            self.form_values['ddlLouDong'] = building_value
+            return Page.from_response(response)
+        except Exception as e:
+            print(f"选择楼栋失败：{str(e)}")
+            return None
+
+    async def query_electricity(self, response, room_number, password, start_date, end_date):
+        print(f"\n正在查询房间 {room_number} 的电费")
+
+        try:
+            if response is None:
+                print("响应对象为None，无法查询电费")
+                return None
+
+            if response.status_code != 200:
+                print(f"响应状态码异常：{response.status_code}")
+                return None
+
+            page = Page.from_response(response)
+
+            form_state = page.form_state
+            if not form_state:
+                print("未找到表单参数，无法查询电费")
+                return None
+
+            room_options = page.options.get('ddlFangJian')
+            if room_options is None:
+                print("未找到房间选择下拉框")
+                return None
+            room_value = room_options.get(room_number)
+            if not room_value:
+                print(f"未找到房间 {room_number}")
+                return None
+
+            data = room_form(form_state, self.form_values, room_value, password)
+
+            response = await self._post(self.base_url, data, 'room')
+            print(f"查询电费响应状态码：{response.status_code}")
+
+            page = Page.from_response(response)
+
+            # 异步模式用于无人值守的批量查询，无法等待用户在浏览器中完成初次设置
+            if page.needs_setup:
+                print("\n⚠️ 检测到初次使用，请先在命令行版中完成房间密码和信息设置")
+                return None
+
+            main_frame_src = page.frames.get('stuMainFrame') if page.is_frameset else None
+            if not main_frame_src:
+                print_table_cells(page.table_rows, "\n未找到电费信息，请手动检查查询结果。")
+                return None
+
+            main_frame_response = await self._get(absolute_url(main_frame_src, self.base_url), 'frames')
+            print(f"获取stuMainFrame响应状态码：{main_frame_response.status_code}")
+
+            top_frame_response = await self._get(self.base_url + "stuTop.htm", 'frames')
+            print(f"获取stuTopFrame响应状态码：{top_frame_response.status_code}")
+
+            electricity_info_link = Page.from_response(top_frame_response).electricity_info_link()
+            if not electricity_info_link:
+                print("\n未找到'用电信息'标签")
+                return None
+
+            electricity_info_response = await self._get(absolute_url(electricity_info_link, self.base_url), 'frames')
+            print(f"获取用电信息页面响应状态码：{electricity_info_response.status_code}")
+
+            return await self._collect_months(Page.from_response(electricity_info_response),
+                                              room_number, start_date, end_date)
+
+        except Exception as e:
+            print(f"查询电费失败：{str(e)}")
+            return None
+
+    async def _store_call(self, method, *args):
+        """
+        在线程池中调用本地存储（RecordStore）的方法，磁盘读写期间事件循环中的其他房间继续查询
+        （asyncio.to_thread需要Python 3.9，这里用run_in_executor）
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, functools.partial(method, *args))
+
+    async def _collect_months(self, info_page, room_number, start_date, end_date):
+        """
+        逐月查询用电记录并处理分页，已结束的月份优先使用本地存储
+        """
+        info_form_state = info_page.form_state
+
+        all_electricity_records = []
+        headers = []
+        # 同一读数日期的记录只保留第一次出现的，避免分页异常时重复计入总用电量
+        dedup = DedupIndex()
+
+        store_key = self._room_key(room_number) if self.store is not None else None
+
+        for current_year, current_month in month_range(start_date, end_date):
+            if store_key and await self._store_call(self.store.is_month_closed, store_key, current_year,
+                                                    current_month):
+                month_headers, month_records = await self._store_call(self.store.load_month, store_key,
+                                                                      current_year, current_month)
+                if not headers:
+                    headers = month_headers
+                all_electricity_records.extend(dedup.filter(store_key, month_records))
+                continue
+
+            print(f"\n正在处理月份：{current_year}-{current_month:02d}")
+            month_records = []
+
+            current_page_response = await self._post(self.base_url + "HouseElec.aspx",
+                                                     month_form(info_form_state, current_year, current_month), 'month')
+            has_next_page = True
+
+            while has_next_page:
+                if current_page_response.status_code != 200:
+                    raise RequestFailed(f"查询{current_year}-{current_month:02d}的用电记录失败："
+                                        f"状态码{current_page_response.status_code}")
+                page = Page.from_response(current_page_response)
+
+                if not headers:
+                    headers = page.grid_headers
+                month_records.extend(page.grid_rows)
+
+                has_next_page = page.has_next_page
+                if has_next_page:
+                    current_page_response = await self._post(
+                        self.base_url + "HouseElec.aspx",
+                        next_page_form(page.form_state, current_year, current_month), 'page')
+
+            all_electricity_records.extend(dedup.filter(store_key, month_records))
+            if store_key:
+                await self._store_call(self.store.save_month, store_key, current_year, current_month, headers,
+                                       month_records)
+
+        return {
+            'records': all_electricity_records,
+            'headers': headers,
+            'total_electricity': total_usage(all_electricity_records)
+        }
+
+
+async def iter_room_results(vpn_cookie, rooms, start_date, end_date, concurrency=DEFAULT_CONCURRENCY, store=None,
+                            base_url=None, metrics=None):
+    """
+    在同一个事件循环中并发查询多个房间，最多concurrency个房间同时进行，
+    每个房间完成后立即产出(room, result, error)
+
+    每个房间使用独立的ClientSession（独立的cookie和__VIEWSTATE链），所有房间共用一个连接池
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency, ssl=False)
+
+    async def run(room):
+        async with semaphore:
+            try:
+                async with AsyncElectricityQuery(vpn_cookie, store=store, connector=connector,
+                                                 base_url=base_url, metrics=metrics) as eq:
+                    result = await eq.query_room(room.get('campus', '校本部'), room['community'], room['building'],
+                                                 room['room'], room.get('password', '111'), start_date, end_date)
+            except Exception as e:
+                return room, None, str(e)
+            return room, result, None if result else "查询失败"
+
+    try:
+        for task in asyncio.as_completed([run(room) for room in rooms]):
+            yield await task
+    finally:
+        await connector.close()
+
+
+async def query_rooms(vpn_cookie, rooms, start_date, end_date, concurrency=DEFAULT_CONCURRENCY, store=None,
+                      base_url=None, metrics=None):
+    """
+    并发查询多个房间，全部完成后返回(room, result, error)列表
+    """
+    return [item async for item in iter_room_results(vpn_cookie, rooms, start_date, end_date,
+                                                     concurrency=concurrency, store=store, base_url=base_url,
+                                                     metrics=metrics)]
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多房间并发查询
+
+在ElectricityQuery之上提供批量接口：用固定大小的线程池同时查询多个房间，
+每个工作线程持有自己的ElectricityQuery（即自己的requests.Session），
+每个房间从首页开始走一条独立的__VIEWSTATE链，互不干扰。
+所有会话共用一个连接池（http_pool），连接数与工作线程数一致，避免重复和VPN网关握手。
+查询结果按完成顺序逐个返回。
+
+main()是不需要任何输入的批量入口（python electricity_cli.py batch rooms.json），
+按配置文件（room_config）查询所有房间，写出JSON格式的结果摘要，并用退出码表示结果：
+0为全部成功，1为有房间查询失败，2为配置错误或没有可用的VPN会话。
+"""
+
+import argparse
+import contextlib
+import json
+import sys
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from dedup import DedupIndex
+from electricity_cli import SESSION_FILE, ElectricityQuery
+from exporters import open_exporter
+from http_pool import shared_pool
+import profiling
+from memory_budget import MemoryBudget, peak_rss_bytes
+from metrics import RequestMetrics
+from record_store import DEFAULT_DB_PATH, RecordStore, room_key
+from topology import DEFAULT_TOPOLOGY_PATH, TopologyIndex
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_SUMMARY_PATH = "batch_summary.json"
+
+EXIT_OK, EXIT_FAILED, EXIT_CONFIG = 0, 1, 2
+
+
+def make_room(community, building, room, password="111", campus="校本部"):
+    """
+    构造一个房间描述字典
+    """
+    return {
+        'campus': campus,
+        'community': community,
+        'building': building,
+        'room': room,
+        'password': password
+    }
+
+
+class BatchQuery:
+    def __init__(self, vpn_cookie, max_workers=DEFAULT_MAX_WORKERS, store=None, topology=None, base_url=None,
+                 metrics=None, pool=None, exporter=None, relogin=None, rate_limiter=None, memory_budget=None,
+                 skip_unchanged=False):
+        self.vpn_cookie = vpn_cookie
+        self.base_url = base_url
+        # 所有工作线程共用一个RequestMetrics
+        self.metrics = metrics
+        self.max_workers = max_workers
+        # 每个工作线程同时占用一个连接，连接池至少与线程数一样大
+        if pool is not None:
+            pool.ensure_size(max_workers)
+        self.pool = pool or shared_pool(max_workers)
+        self.store = store
+        # 所有工作线程共用一个导出器，每取得一页记录就写入；
+        # 每个房间的结果各自去重，配置中同一房间的日期范围重叠时，重叠部分的读数只在导出文件中去重
+        self.exporter = exporter
+        if exporter is not None and exporter.dedup is None:
+            exporter.dedup = DedupIndex()
+        # 所有工作线程共用一个拓扑索引，同一楼栋的房间只需导航一次
+        self.topology = topology
+        # 票据失效时调用，返回新的VPN cookie；多个线程同时失效时只重新登录一次
+        self.relogin = relogin
+        # 所有工作线程共用的请求速率限制（resilience.RateLimiter）
+        self.rate_limiter = rate_limiter
+        # 所有工作线程共用的内存预算（memory_budget.MemoryBudget），按线程数平分
+        self.memory_budget = memory_budget
+        if memory_budget is not None:
+            memory_budget.concurrency = max_workers
+        # 为True时内容与上次抓取时相同的页面不再解析，记录从本地存储读取（需要本地存储）
+        self.skip_unchanged = skip_unchanged
+        self._local = threading.local()
+        self._relogin_lock = threading.Lock()
+        # 各工作线程的ElectricityQuery，线程结束后自动移除
+        self._queries = weakref.WeakSet()
+        self._cookie_lock = threading.Lock()
+        self._cookie_updated_at = 0.0
+
+    def update_vpn_cookie(self, vpn_cookie):
+        """
+        换用新的VPN cookie，已经创建的工作线程查询也一并更新
+        """
+        with self._cookie_lock:
+            self.vpn_cookie = vpn_cookie
+            self._cookie_updated_at = time.monotonic()
+            queries = list(self._queries)
+        for eq in queries:
+            eq.use_vpn_cookie(vpn_cookie)
+
+    def _relogin(self):
+        """
+        工作线程的票据失效时调用：等待其他线程的重新登录完成，已经换过cookie时直接使用新cookie
+        """
+        expired_at = time.monotonic()
+        with self._relogin_lock:
+            if self._cookie_updated_at > expired_at:
+                return self.vpn_cookie
+            vpn_cookie = self.relogin()
+            if vpn_cookie:
+                self.update_vpn_cookie(vpn_cookie)
+            return vpn_cookie
+
+    def _worker_query(self):
+        """
+        返回当前工作线程专用的ElectricityQuery，首次调用时创建
+        """
+        eq = getattr(self._local, 'eq', None)
+        if eq is None:
+            eq = ElectricityQuery(self.vpn_cookie, store=self.store, topology=self.topology,
+                                  base_url=self.base_url, metrics=self.metrics, pool=self.pool)
+            eq.exporter = self.exporter
+            # 工作线程不能打开浏览器或等待输入
+            eq.interactive = False
+            eq.rate_limiter = self.rate_limiter
+            eq.memory_budget = self.memory_budget
+            eq.skip_unchanged = self.skip_unchanged
+            if self.relogin is not None:
+                eq.relogin = self._relogin
+            with self._cookie_lock:
+                self._queries.add(eq)
+            self._local.eq = eq
+        return eq
+
+    def query_one(self, room, start_date, end_date):
+        """
+        在当前线程中查询一个房间；房间字典中的start/end优先于传入的日期范围
+        """
+        eq = self._worker_query()
+        return eq.query_room(room.get('campus', '校本部'), room['community'], room['building'],
+                             room['room'], room.get('password', '111'),
+                             room.get('start') or start_date, room.get('end') or end_date)
+
+    def iter_results(self, rooms, start_date, end_date):
+        """
+        并发查询多个房间，每个房间完成后立即返回(room, result, error)
+        查询失败时result为None，error为失败原因
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.query_one, room, start_date, end_date): room
+                       for room in rooms}
+            for future in as_completed(futures):
+                room = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    yield room, None, str(e)
+                    continue
+                yield room, result, None if result else "查询失败"
+
+
+def query_rooms(vpn_cookie, rooms, start_date, end_date, max_workers=DEFAULT_MAX_WORKERS, store=None, topology=None,
+                base_url=None, metrics=None):
+    """
+    并发查询多个房间的便捷函数，返回按完成顺序产出结果的生成器
+    """
+    return BatchQuery(vpn_cookie, max_workers=max_workers, store=store,
+                      topology=topology, base_url=base_url, metrics=metrics).iter_results(rooms, start_date, end_date)
+
+
+def room_summary(room, result, error):
+    """
+    一个房间的查询结果摘要
+    """
+    return {
+        'room': room_key(room.get('campus', '校本部'), room['community'], room['building'], room['room']),
+        'start': room.get('start'),
+        'end': room.get('end'),
+        'status': 'ok' if error is None else 'failed',
+        'records': result.get('record_count', len(result['records'])) if result else 0,
+        'total_electricity': round(result['total_electricity'], 2) if result else None,
+        'error': error
+    }
+
+
+def run_batch(batch, rooms, end_date):
+    """
+    查询配置中的所有房间，返回按配置顺序排列的结果摘要列表
+    房间未设置end时查询到end_date
+    """
+    rooms = [dict(room, end=room.get('end') or end_date) for room in rooms]
+    positions = {id(room): index for index, room in enumerate(rooms)}
+    summaries = [None] * len(rooms)
+    for done, (room, result, error) in enumerate(batch.iter_results(rooms, None, end_date), 1):
+        summaries[positions[id(room)]] = room_summary(room, result, error)
+        print(f"\n[{done}/{len(rooms)}] {summaries[positions[id(room)]]['room']}："
+              f"{'✅ 完成' if error is None else '❌ ' + error}")
+    return summaries
+
+
+def write_summary(summary, path, stdout=None):
+    """
+    保存结果摘要，path为'-'时输出到stdout（默认为标准输出）
+    """
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    if path == '-':
+        stdout = stdout or sys.stdout
+        stdout.write(text + '\n')
+        stdout.flush()
+        return
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text + '\n')
+    print(f"\n📁 结果摘要已保存到：{path}")
+
+
+def add_profile_arguments(parser):
+    """
+    添加--profile和--flamegraph参数（batch和sharded_sweep共用）
+    """
+    parser.add_argument('--profile', metavar='PATH',
+                        help="记录每个阶段的耗时、CPU时间和内存峰值，结束时打印并保存（JSON）")
+    parser.add_argument('--flamegraph', metavar='PATH',
+                        help="采样调用栈并保存为折叠格式，可用flamegraph.pl或speedscope生成火焰图")
+
+
+def start_profiler(args):
+    """
+    按--profile/--flamegraph启用profiling，都没有指定时返回None
+    """
+    if not (args.profile or args.flamegraph):
+        return None
+    return profiling.enable(trace_memory=bool(args.profile),
+                            sample_interval=profiling.DEFAULT_SAMPLE_INTERVAL if args.flamegraph else None)
+
+
+def finish_profiler(profiler, args):
+    """
+    停止profiling，打印各阶段的统计并保存
+    """
+    if profiler is None:
+        return
+    profiling.disable()
+    profiler.print_summary()
+    if args.profile:
+        profiler.dump(args.profile)
+    if args.flamegraph:
+        profiler.write_collapsed(args.flamegraph)
+
+
+def _batch(args):
+    # room_config依赖本模块的make_room，在这里导入
+    from room_config import load_config, open_session
+
+    try:
+        config = load_config(args.config)
+    except ValueError as e:
+        print(f"❌ {str(e)}")
+        return EXIT_CONFIG, None
+    rooms = config['rooms']
+    missing = [room['room'] for room in rooms if not room['start']]
+    if missing:
+        print(f"❌ 以下房间没有设置start（开始月份）：{', '.join(missing)}")
+        return EXIT_CONFIG, None
+
+    # 无人值守运行时不能扫码登录，只使用配置中的cookie或保存的会话
+    vpn_cookie = open_session(config, args.session, interactive=False)
+    if not vpn_cookie:
+        print("❌ 没有可用的VPN会话：请先运行一次 python electricity_cli.py 登录并保存会话，"
+              "或在配置文件中设置vpn_cookie")
+        return EXIT_CONFIG, None
+
+    exporter = None
+    if args.export:
+        try:
+            exporter = open_exporter(args.export)
+        except ValueError as e:
+            print(f"❌ {str(e)}")
+            return EXIT_CONFIG, None
+
+    metrics = RequestMetrics() if args.metrics else None
+    memory_budget = MemoryBudget(args.memory_budget) if args.memory_budget else None
+    profiler = start_profiler(args)
+    started = time.time()
+    with RecordStore(config.get('db_file', DEFAULT_DB_PATH)) as store:
+        topology = TopologyIndex(config.get('topology_file', DEFAULT_TOPOLOGY_PATH))
+        batch = BatchQuery(vpn_cookie, max_workers=args.workers or config.get('max_workers', DEFAULT_MAX_WORKERS),
+                           store=store, topology=topology, base_url=config.get('base_url'),
+                           metrics=metrics, exporter=exporter, memory_budget=memory_budget,
+                           skip_unchanged=args.skip_unchanged)
+        summaries = run_batch(batch, rooms, config.get('end') or datetime.now().strftime('%Y-%m'))
+        topology.save()
+
+    if exporter is not None:
+        exporter.close()
+    if metrics is not None:
+        metrics.dump(args.metrics)
+    finish_profiler(profiler, args)
+
+    failed = sum(1 for summary in summaries if summary['status'] != 'ok')
+    summary = {
+        'config': args.config,
+        'started_at': datetime.fromtimestamp(started).isoformat(timespec='seconds'),
+        'finished_at': datetime.now().isoformat(timespec='seconds'),
+        'elapsed_seconds': round(time.time() - started, 3),
+        'total': len(summaries),
+        'succeeded': len(summaries) - failed,
+        'failed': failed,
+        'export': args.export,
+        'peak_rss_bytes': peak_rss_bytes(),
+        'rooms': summaries
+    }
+    if memory_budget is not None:
+        summary['memory'] = memory_budget.to_dict()
+    print(f"\n{'✅' if not failed else '⚠️'} {summary['succeeded']}/{summary['total']}个房间查询成功")
+    return (EXIT_FAILED if failed else EXIT_OK), summary
+
+
+def main(argv=None):
+    """
+    批量查询入口，返回退出码
+    """
+    parser = argparse.ArgumentParser(prog='electricity_cli.py batch',
+                                     description="按配置文件批量查询多个房间，运行过程中不需要任何输入")
+    parser.add_argument('config', help="房间配置文件（JSON，格式见room_config.py）")
+    parser.add_argument('--summary', default=DEFAULT_SUMMARY_PATH,
+                        help="结果摘要（JSON）的保存路径，'-'为输出到标准输出（进度信息改为输出到标准错误）")
+    parser.add_argument('--workers', type=int, help="并发查询的房间数，默认使用配置中的max_workers")
+    parser.add_argument('--export', help="把所有房间的记录写入一个文件（.csv、.jsonl、.parquet、.arrow、.npz）")
+    parser.add_argument('--metrics', help="性能指标文件（.prom为Prometheus格式，其余为JSON）")
+    parser.add_argument('--session', default=SESSION_FILE, help="VPN会话文件")
+    parser.add_argument('--memory-budget', type=float, metavar='MB',
+                        help="内存预算（MB）：限制缓存的页面和待写入的记录，摘要中只保留每个房间的条数和总用电量")
+    add_profile_arguments(parser)
+    parser.add_argument('--skip-unchanged', action='store_true',
+                        help="不再解析内容与上次抓取时相同的页面，这些页面的记录从本地存储读取")
+    args = parser.parse_args(argv)
+
+    # 摘要输出到标准输出时，进度信息不能混在其中
+    stdout = sys.stdout
+    progress = contextlib.redirect_stdout(sys.stderr) if args.summary == '-' else contextlib.nullcontext()
+    with progress:
+        code, summary = _batch(args)
+        if summary is not None:
+            write_summary(summary, args.summary, stdout)
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
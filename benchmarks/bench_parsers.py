@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+页面解析后端对比
+
+用page_parsers中的每个可用后端解析查询流程中的每一步页面，检查输出是否与bs4完全一致，
+并比较各后端的解析耗时。默认使用site_fixtures生成的页面，指定 --fixtures 时使用
+ResponseRecorder保存的真实页面。任一后端的输出与bs4不一致时以状态码1退出。
+
+使用方法：
+python benchmarks/bench_parsers.py
+python benchmarks/bench_parsers.py --fixtures fixtures --runs 50
+python benchmarks/bench_parsers.py --rows-per-page 200 --parsers stdlib,lxml
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from page_parsers import PARSERS, PageFields, available_parsers  # noqa: E402
+from site_fixtures import SyntheticSite, load_recorded  # noqa: E402
+
+REFERENCE_PARSER = 'bs4'
+
+
+def compare(pages, parsers):
+    """
+    返回 [(步骤, 后端, 不一致的字段)]
+    """
+    mismatches = []
+    for step, text in pages:
+        reference = PARSERS[REFERENCE_PARSER](text)
+        for name in parsers:
+            fields = PARSERS[name](text)
+            different = [field for field in PageFields._fields
+                         if getattr(fields, field) != getattr(reference, field)]
+            if different:
+                mismatches.append((step, name, different))
+    return mismatches
+
+
+def bench(pages, parsers, runs):
+    """
+    返回 {后端: {步骤: 中位数耗时(秒)}}，同一步骤出现多次（分页表格）时耗时累加
+    """
+    results = {}
+    for name in parsers:
+        parse = PARSERS[name]
+        samples = {}
+        for _ in range(runs):
+            run_totals = {}
+            for step, text in pages:
+                start = time.perf_counter()
+                parse(text)
+                run_totals[step] = run_totals.get(step, 0.0) + time.perf_counter() - start
+            for step, seconds in run_totals.items():
+                samples.setdefault(step, []).append(seconds)
+        results[name] = {step: statistics.median(values) for step, values in samples.items()}
+    return results
+
+
+def report(results, parsers):
+    steps = list(results[parsers[0]])
+    print(f"\n{'步骤':<12}" + ''.join(f"{name + '(ms)':>14}" for name in parsers))
+    print("-" * (12 + 14 * len(parsers)))
+    for step in steps:
+        print(f"{step:<12}" + ''.join(f"{results[name][step] * 1000:>14.3f}" for name in parsers))
+
+    totals = {name: sum(results[name].values()) for name in parsers}
+    print(f"{'合计':<12}" + ''.join(f"{totals[name] * 1000:>14.3f}" for name in parsers))
+    if REFERENCE_PARSER in totals:
+        print(f"{'相对bs4':<12}" + ''.join(f"{totals[REFERENCE_PARSER] / totals[name]:>13.1f}x"
+                                          for name in parsers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="页面解析后端对比")
+    parser.add_argument('--runs', type=int, default=20, help="测量次数")
+    parser.add_argument('--fixtures', help="ResponseRecorder保存的页面目录，默认使用生成的页面")
+    parser.add_argument('--rows-per-page', type=int, default=10, help="生成的用电记录表格每页的行数")
+    parser.add_argument('--parsers', help="要比较的后端，逗号分隔，默认为全部可用的后端")
+    args = parser.parse_args()
+
+    parsers = args.parsers.split(',') if args.parsers else available_parsers()
+    unavailable = [name for name in parsers if name not in available_parsers()]
+    if unavailable:
+        print(f"❌ 解析后端不可用：{', '.join(unavailable)}")
+        sys.exit(1)
+    if REFERENCE_PARSER not in available_parsers():
+        print("❌ 需要安装beautifulsoup4作为对照")
+        sys.exit(1)
+
+    if args.fixtures:
+        pages = load_recorded(args.fixtures)
+        if not pages:
+            print(f"❌ 目录中没有保存的页面：{args.fixtures}")
+            sys.exit(1)
+        print(f"📁 使用 {args.fixtures} 中的 {len(pages)} 个页面")
+    else:
+        pages = SyntheticSite(rows_per_page=args.rows_per_page).step_pages()
+        print(f"使用生成的 {len(pages)} 个页面")
+
+    mismatches = compare(pages, [name for name in parsers if name != REFERENCE_PARSER])
+    for step, name, fields in mismatches:
+        print(f"❌ {step}：{name}的输出与bs4不一致（{', '.join(fields)}）")
+    if not mismatches:
+        print(f"✅ {', '.join(parsers)} 的输出完全一致")
+
+    report(bench(pages, parsers, args.runs), parsers)
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+查询流程离线基准
+
+对查询流程中的每一步（首页、校区/社区/楼栋回发、框架页面、stuTop.htm、HouseElec.aspx和分页表格）
+分别测量页面解析、表单提取和记录汇总的耗时，并用FixtureSession完整运行一次多月份查询。
+默认使用site_fixtures生成的页面，指定 --fixtures 时回放ResponseRecorder保存的真实页面。
+全程不访问网络。用 --save 保存结果，之后用 --compare 对比，耗时增加超过阈值的步骤会被标出。
+
+使用方法：
+python benchmarks/bench_query.py
+python benchmarks/bench_query.py --fixtures fixtures --runs 50
+python benchmarks/bench_query.py --save bench.json
+python benchmarks/bench_query.py --compare bench.json --threshold 0.2
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from electricity_cli import (ElectricityQuery, month_form, next_page_form, postback_form,  # noqa: E402
+                             room_form, total_usage)
+from page_model import Page  # noqa: E402
+from site_fixtures import FixtureSession, SyntheticSite, load_recorded  # noqa: E402
+from usage_table import UsageTable  # noqa: E402
+
+FORM_VALUES = {'ddlXiaoQu': '校本部', 'ddlQuYu': 'A区', 'ddlLouDong': '1'}
+
+
+def extract_form(step, page):
+    """
+    提取该步骤之后的请求需要的表单数据
+    """
+    form_state = page.form_state
+    if step == 'landing':
+        return postback_form(form_state, 'ddlXiaoQu', {'ddlXiaoQu': next(iter(page.options.get('ddlXiaoQu', {'': ''}).values()))})
+    if step == 'campus':
+        return postback_form(form_state, 'ddlQuYu', {'ddlQuYu': next(iter(page.options.get('ddlQuYu', {'': ''}).values()))})
+    if step == 'community':
+        return postback_form(form_state, 'ddlLouDong', {'ddlLouDong': next(iter(page.options.get('ddlLouDong', {'': ''}).values()))})
+    if step == 'building':
+        rooms = page.options.get('ddlFangJian', {})
+        return room_form(form_state, FORM_VALUES, next(iter(rooms.values()), ''), '111')
+    if step == 'frameset':
+        return page.frames.get('stuMainFrame')
+    if step == 'stu_top':
+        return page.electricity_info_link()
+    if step == 'house_elec':
+        return month_form(form_state, 2025, 3)
+    if step == 'grid':
+        return next_page_form(form_state, 2025, 3) if page.has_next_page else None
+    return None
+
+
+def assemble(step, page, records, table):
+    """
+    汇总表格页面中的记录：累积记录、计算合计并追加到列式表
+    """
+    if step != 'grid':
+        return
+    records.extend(page.grid_rows)
+    total_usage(records)
+    table.append_rows(page.grid_rows, 'bench')
+
+
+def time_call(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def bench_steps(pages, runs):
+    """
+    返回 {步骤: {'parse': [...], 'form': [...], 'assemble': [...], 'bytes': n}}
+    同一步骤出现多次（分页表格）时耗时累加
+    """
+    results = {}
+    for _ in range(runs):
+        records = []
+        table = UsageTable()
+        run_totals = {}
+        for step, text in pages:
+            parse_time, page = time_call(Page, text)
+            form_time, _ = time_call(extract_form, step, page)
+            assemble_time, _ = time_call(assemble, step, page, records, table)
+
+            totals = run_totals.setdefault(step, [0.0, 0.0, 0.0, 0])
+            totals[0] += parse_time
+            totals[1] += form_time
+            totals[2] += assemble_time
+            totals[3] += len(text.encode('utf-8'))
+
+        for step, (parse_time, form_time, assemble_time, size) in run_totals.items():
+            entry = results.setdefault(step, {'parse': [], 'form': [], 'assemble': [], 'bytes': size})
+            entry['parse'].append(parse_time)
+            entry['form'].append(form_time)
+            entry['assemble'].append(assemble_time)
+    return results
+
+
+def bench_end_to_end(runs, months):
+    """
+    用FixtureSession完整运行query_room，返回每次的耗时和请求次数
+    """
+    site = SyntheticSite()
+    timings = []
+    request_count = 0
+    for _ in range(runs):
+        eq = ElectricityQuery(base_url='http://fixtures.local/')
+        eq.session = FixtureSession(site)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = eq.query_room(site.campuses[0], site.communities[0], site.buildings[0],
+                                   site.rooms[0], '111', '2025-01', f"2025-{months:02d}")
+        timings.append(time.perf_counter() - start)
+        request_count = len(eq.session.requests)
+        if not result:
+            raise RuntimeError("离线查询失败")
+    return timings, request_count
+
+
+def summarize(step_results, end_to_end):
+    summary = {'steps': {}, 'end_to_end': end_to_end}
+    for step, entry in step_results.items():
+        summary['steps'][step] = {
+            'bytes': entry['bytes'],
+            'parse_ms': statistics.median(entry['parse']) * 1000,
+            'form_ms': statistics.median(entry['form']) * 1000,
+            'assemble_ms': statistics.median(entry['assemble']) * 1000,
+        }
+    return summary
+
+
+def step_total(entry):
+    return entry['parse_ms'] + entry['form_ms'] + entry['assemble_ms']
+
+
+def report(summary, baseline=None, threshold=0.2):
+    print(f"\n{'步骤':<12}{'大小':>10}{'解析(ms)':>12}{'表单(ms)':>12}{'汇总(ms)':>12}{'合计(ms)':>12}")
+    print("-" * 70)
+    regressions = []
+    for step, entry in summary['steps'].items():
+        total = step_total(entry)
+        line = (f"{step:<12}{entry['bytes']:>10}{entry['parse_ms']:>12.3f}{entry['form_ms']:>12.3f}"
+                f"{entry['assemble_ms']:>12.3f}{total:>12.3f}")
+        previous = baseline['steps'].get(step) if baseline else None
+        if previous:
+            change = total / step_total(previous) - 1 if step_total(previous) else 0
+            line += f"  {change:+.1%}"
+            if change > threshold:
+                line += " ⚠️"
+                regressions.append(step)
+        print(line)
+
+    end_to_end = summary['end_to_end']
+    line = (f"\n完整查询（{end_to_end['months']}个月，{end_to_end['requests']}次请求）："
+            f"中位数 {end_to_end['median_ms']:.1f} ms")
+    if baseline:
+        change = end_to_end['median_ms'] / baseline['end_to_end']['median_ms'] - 1
+        line += f"  {change:+.1%}"
+        if change > threshold:
+            line += " ⚠️"
+            regressions.append('end_to_end')
+    print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询流程离线基准")
+    parser.add_argument('--runs', type=int, default=20, help="测量次数")
+    parser.add_argument('--months', type=int, default=6, help="完整查询的月份数")
+    parser.add_argument('--fixtures', help="ResponseRecorder保存的页面目录，默认使用生成的页面")
+    parser.add_argument('--save', help="把结果保存为JSON")
+    parser.add_argument('--compare', help="与之前保存的JSON结果对比")
+    parser.add_argument('--threshold', type=float, default=0.2, help="判定为性能退化的耗时增幅")
+    args = parser.parse_args()
+
+    if args.fixtures:
+        pages = load_recorded(args.fixtures)
+        if not pages:
+            print(f"❌ 目录中没有保存的页面：{args.fixtures}")
+            sys.exit(1)
+        print(f"📁 回放 {args.fixtures} 中的 {len(pages)} 个页面")
+    else:
+        pages = SyntheticSite().step_pages()
+        print(f"使用生成的 {len(pages)} 个页面")
+
+    step_results = bench_steps(pages, args.runs)
+    timings, request_count = bench_end_to_end(max(args.runs // 4, 1), args.months)
+    summary = summarize(step_results, {
+        'months': args.months,
+        'requests': request_count,
+        'median_ms': statistics.median(timings) * 1000
+    })
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    regressions = report(summary, baseline, args.threshold)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"\n✅ 结果已保存到 {args.save}")
+
+    if regressions:
+        print(f"\n⚠️ 以下步骤耗时增加超过{args.threshold:.0%}：{', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+冷启动导入耗时基准
+
+每次都在新的Python进程中导入模块，统计导入耗时的中位数，并列出被加载的重型依赖
+（bs4、selenium等）。指定 --baseline 时会从git中取出对应版本的代码做同样的测量，用于对比改动前后的差异。
+
+使用方法：
+python benchmarks/bench_startup.py
+python benchmarks/bench_startup.py --baseline HEAD~1 --runs 20
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ['electricity_cli', 'vpn_access']
+HEAVY_MODULES = ['bs4', 'selenium', 'lxml', 'webdriver_manager', 'aiohttp']
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(elapsed, ','.join(heavy))
+"""
+
+
+def measure(module, cwd, runs):
+    """
+    在cwd下用新进程导入module runs次，返回(耗时列表, 被加载的重型依赖)
+    导入失败（例如缺少依赖）时返回(None, 错误信息)
+    """
+    timings = []
+    heavy = ''
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                                cwd=cwd, capture_output=True, text=True)
+        if result.returncode != 0:
+            return None, result.stderr.strip().splitlines()[-1]
+        parts = result.stdout.split()
+        timings.append(float(parts[0]))
+        heavy = parts[1] if len(parts) > 1 else ''
+    return timings, heavy
+
+
+def export_revision(revision, target):
+    archive = subprocess.run(['git', 'archive', revision], cwd=REPO_ROOT, capture_output=True, check=True)
+    subprocess.run(['tar', '-x', '-C', target], input=archive.stdout, check=True)
+
+
+def report(label, cwd, runs):
+    print(f"\n[{label}]")
+    for module in MODULES:
+        if not os.path.exists(os.path.join(cwd, module + '.py')):
+            continue
+        timings, heavy = measure(module, cwd, runs)
+        if timings is None:
+            print(f"  {module:<18} 导入失败：{heavy}")
+            continue
+        print(f"  {module:<18} 中位数 {statistics.median(timings) * 1000:8.1f} ms  "
+              f"最小 {min(timings) * 1000:8.1f} ms  重型依赖：{heavy or '无'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动导入耗时基准")
+    parser.add_argument('--runs', type=int, default=10, help="每个模块的测量次数")
+    parser.add_argument('--baseline', help="用于对比的git版本，例如 HEAD~1")
+    args = parser.parse_args()
+
+    report("当前代码", REPO_ROOT, args.runs)
+
+    if args.baseline:
+        with tempfile.TemporaryDirectory() as tmp:
+            export_revision(args.baseline, tmp)
+            report(f"基线 {args.baseline}", tmp, args.runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分片遍历的扩展性基准
+
+在单独的进程中启动stand_in_server.py（可以设置每个请求的延迟），用sharded_sweep按不同的进程数
+遍历同一批房间，比较吞吐量（房间/秒）、相对单进程的加速比和并行效率，并检查各次导出的文件是否完全相同。
+模拟服务本身也占用CPU，测量多进程扩展性时机器的核心数应多于最大进程数。
+导出文件不一致时以状态码1退出。
+
+使用方法：
+python benchmarks/bench_sweep.py
+python benchmarks/bench_sweep.py --processes 1,2,4,8 --buildings 8 --rooms-per-building 20 --latency 20
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from electricity_cli import ElectricityQuery  # noqa: E402
+from exporters import open_exporter  # noqa: E402
+from sharded_sweep import discover_rooms, shards_from_rooms, sweep  # noqa: E402
+from topology import TopologyIndex  # noqa: E402
+
+VPN_COOKIE = json.dumps({'wengine_vpn_ticketwebvpn_ujs_edu_cn': 'bench'})
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, args):
+    """
+    在单独的进程中启动模拟服务，等到可以连接时返回进程对象
+    """
+    command = [sys.executable, os.path.join(REPO_ROOT, 'stand_in_server.py'), '--port', str(port),
+               '--latency', str(args.latency), '--pages', str(args.pages),
+               '--buildings', str(args.buildings), '--rooms', str(args.rooms_per_building)]
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        with contextlib.suppress(OSError), socket.create_connection(('127.0.0.1', port), timeout=0.5):
+            return server
+        time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("模拟服务启动失败")
+
+
+def digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def run(shards, processes, args, base_url, topology, path):
+    exporter = open_exporter(path)
+    started = time.perf_counter()
+    rooms = failed = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _, outcomes in sweep(shards, VPN_COOKIE, args.start, args.end, processes, args.threads, base_url,
+                                 topology=topology, exporter=exporter):
+            rooms += len(outcomes)
+            failed += sum(1 for summary in outcomes if summary['status'] != 'ok')
+    elapsed = time.perf_counter() - started
+    exporter.close()
+    return elapsed, rooms, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分片遍历的扩展性基准")
+    parser.add_argument('--processes', default='1,2,4', help="要比较的进程数，逗号分隔")
+    parser.add_argument('--threads', type=int, default=2, help="每个进程同时查询的房间数")
+    parser.add_argument('--buildings', type=int, default=4, help="模拟服务每个社区的楼栋数")
+    parser.add_argument('--rooms-per-building', type=int, default=10, help="模拟服务每栋楼的房间数")
+    parser.add_argument('--pages', type=int, default=3, help="每个月的分页数")
+    parser.add_argument('--latency', type=float, default=10, help="每个请求的延迟（毫秒）")
+    parser.add_argument('--start', default='2026-01')
+    parser.add_argument('--end', default='2026-03')
+    args = parser.parse_args()
+
+    port = free_port()
+    server = start_server(port, args)
+    base_url = f"http://127.0.0.1:{port}/"
+    try:
+        topology = TopologyIndex(None)
+        with contextlib.redirect_stdout(io.StringIO()):
+            rooms = discover_rooms(ElectricityQuery(VPN_COOKIE, topology=topology, base_url=base_url), '校本部')
+        shards = shards_from_rooms(rooms)
+        print(f"{len(shards)}个楼栋，{len(rooms)}个房间，{args.start}到{args.end}，每个进程{args.threads}个线程，"
+              f"本机{os.cpu_count()}个CPU核心")
+
+        results = []
+        with tempfile.TemporaryDirectory() as directory:
+            for processes in [int(value) for value in args.processes.split(',')]:
+                path = os.path.join(directory, f"sweep_{processes}.csv")
+                elapsed, count, failed = run(shards, processes, args, base_url, topology, path)
+                results.append((processes, elapsed, count, failed, digest(path)))
+    finally:
+        server.terminate()
+        server.wait()
+
+    baseline = results[0][2] / results[0][1]
+    print(f"\n{'进程数':<8}{'耗时(秒)':>10}{'房间/秒':>10}{'加速比':>8}{'效率':>8}{'失败':>6}")
+    print("-" * 50)
+    for processes, elapsed, count, failed, _ in results:
+        throughput = count / elapsed
+        speedup = throughput / baseline
+        print(f"{processes:<8}{elapsed:>10.2f}{throughput:>10.1f}{speedup:>8.2f}{speedup / processes * results[0][0]:>8.0%}"
+              f"{failed:>6}")
+
+    if len({result[4] for result in results}) > 1:
+        print("\n❌ 不同进程数的导出文件不一致")
+        sys.exit(1)
+    print("\n✅ 不同进程数的导出文件完全一致")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+浏览器环境检测与安装
+
+自动获取VPN cookie需要Selenium和Chrome。检测结果缓存在browser_probe.json中，
+日常启动只读取缓存，不再启动无头Chrome；安装Selenium、webdriver-manager
+以及下载ChromeDriver都放在显式的 python electricity_cli.py setup 命令中完成。
+"""
+
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+BROWSER_PROBE_FILE = "browser_probe.json"
+
+# 检测结果的有效期，过期后重新检测（只检查文件和模块，不启动浏览器）
+PROBE_MAX_AGE = 7 * 24 * 3600
+
+
+def find_chrome_executable():
+    """
+    在系统路径和常见安装位置中查找Chrome可执行文件，找不到时返回None
+    """
+    for name in ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome"):
+        path = shutil.which(name)
+        if path:
+            return path
+
+    system = platform.system()
+    chrome_paths = []
+
+    if system == "Windows":
+        # Windows系统可能的Chrome路径
+        chrome_paths = [
+            os.path.join(os.environ.get("PROGRAMFILES", r"C:\Program Files"), r"Google\Chrome\Application\chrome.exe"),
+            os.path.join(os.environ.get("PROGRAMFILES(X86)", r"C:\Program Files (x86)"), r"Google\Chrome\Application\chrome.exe"),
+            os.path.join(os.environ.get("LOCALAPPDATA", r"C:\Users\Default\AppData\Local"), r"Google\Chrome\Application\chrome.exe")
+        ]
+    elif system == "Darwin":
+        # macOS系统可能的Chrome路径
+        chrome_paths = ["/Applications/Google Chrome.app/Contents/MacOS/Google Chrome"]
+    elif system == "Linux":
+        # Linux系统可能的Chrome路径
+        chrome_paths = ["/usr/bin/google-chrome", "/usr/bin/chromium", "/usr/bin/chromium-browser"]
+
+    for path in chrome_paths:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def probe_browser(refresh=False, path=BROWSER_PROBE_FILE):
+    """
+    返回浏览器能力检测结果：{'selenium': bool, 'chrome': bool, 'chrome_path': str或None, 'checked_at': 时间戳}
+    优先使用缓存；检测时只查找模块和可执行文件，不导入Selenium也不启动浏览器
+    """
+    if not refresh and os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                capability = json.load(f)
+            if time.time() - capability.get('checked_at', 0) < PROBE_MAX_AGE:
+                return capability
+        except Exception:
+            pass
+
+    chrome_path = find_chrome_executable()
+    capability = {
+        'selenium': importlib.util.find_spec('selenium') is not None,
+        'chrome': chrome_path is not None,
+        'chrome_path': chrome_path,
+        'checked_at': time.time()
+    }
+    _save_probe(capability, path)
+    return capability
+
+
+def invalidate_browser_probe(path=BROWSER_PROBE_FILE):
+    """
+    删除缓存的检测结果，下次获取cookie时重新检测
+    """
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _save_probe(capability, path):
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(capability, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        print(f"\n⚠️ 保存浏览器检测结果失败：{str(e)}")
+
+
+def setup_environment(path=BROWSER_PROBE_FILE):
+    """
+    安装自动获取cookie所需的依赖，下载ChromeDriver并实际启动一次无头Chrome进行验证
+    验证结果写入检测缓存，成功时返回True
+    """
+    print("\n🔧 正在配置自动获取cookie所需的环境...")
+
+    for package, module in (("selenium", "selenium"), ("webdriver-manager", "webdriver_manager")):
+        if importlib.util.find_spec(module) is None:
+            print(f"正在安装{package}...")
+            try:
+                subprocess.check_call([sys.executable, "-m", "pip", "install", package])
+                print(f"✅ {package}安装成功！")
+            except Exception as e:
+                print(f"\n❌ 自动安装{package}失败：{str(e)}")
+                print(f"请手动安装：pip install {package}")
+                return False
+
+    importlib.invalidate_caches()
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")  # 无头模式，不显示浏览器窗口
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--ignore-certificate-errors")
+
+    chrome_ok = False
+    try:
+        from webdriver_manager.chrome import ChromeDriverManager
+        from selenium.webdriver.chrome.service import Service
+
+        print("正在下载ChromeDriver...")
+        service = Service(ChromeDriverManager().install())
+        driver = webdriver.Chrome(service=service, options=chrome_options)
+        driver.quit()
+        chrome_ok = True
+        print("✅ ChromeDriver安装成功，Chrome浏览器检测成功")
+    except Exception as e:
+        print(f"⚠️ Chrome浏览器检测失败：{str(e)}")
+
+    capability = {
+        'selenium': True,
+        'chrome': chrome_ok,
+        'chrome_path': find_chrome_executable(),
+        'checked_at': time.time()
+    }
+    _save_probe(capability, path)
+
+    if chrome_ok:
+        print("\n✅ 环境配置完成，之后可以自动获取VPN cookie")
+    else:
+        print("\n❌ 未能启动Chrome浏览器，请确认已安装Chrome，之后仍可手动获取cookie")
+    return chrome_ok
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+定时轮询守护进程
+
+按配置文件（room_config）中的房间列表定时查询电费，结果保存在本地存储（RecordStore）中：
+- 每个房间独立排期，首次查询时间在 [0, jitter_seconds) 内随机分散，之后每隔interval_minutes
+  （加减jitter_seconds的随机抖动）查询一次，避免所有房间同时访问服务器
+- 同时进行的查询不超过max_workers个，所有请求共用一个速率限制（max_requests_per_minute）
+- 每次只查询最新一条本地记录所在的月份到当前月份；已结束并抓取过的月份直接使用本地数据
+- 查询失败的房间按指数退避提前重试，但间隔不超过interval_minutes
+- 没有查询进行时每隔keepalive_minutes检查一次VPN会话；票据失效时默认不弹出扫码登录（没有人扫码时会一直阻塞），
+  而是提示运行一次交互式查询更新会话文件，之后按指数退避检查，会话文件更新后直接使用新的会话
+- 查询结果不在内存中累积，每个房间只保留最近一次的状态，写入status_file
+
+使用方法：
+python daemon.py rooms.json
+python daemon.py rooms.json --once
+"""
+
+import argparse
+import heapq
+import json
+import math
+import os
+import random
+import signal
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from batch_query import BatchQuery
+from electricity_cli import SESSION_FILE, ElectricityQuery
+from metrics import RequestMetrics
+from record_store import DEFAULT_DB_PATH, RecordStore, month_range, room_key
+from resilience import RateLimiter
+from room_config import load_config, open_session
+from topology import DEFAULT_TOPOLOGY_PATH, TopologyIndex
+
+DEFAULT_INTERVAL_MINUTES = 60
+DEFAULT_JITTER_SECONDS = 300
+DEFAULT_MAX_WORKERS = 2
+DEFAULT_KEEPALIVE_MINUTES = 10
+DEFAULT_MAX_REQUESTS_PER_MINUTE = 60
+DEFAULT_STATUS_PATH = "daemon_status.json"
+
+# 查询失败后第一次重试的等待时间（秒），之后每次失败翻倍
+FAILURE_BACKOFF = 60
+
+# 调度循环最长的等待时间（秒），保证能及时响应停止信号
+MAX_IDLE_WAIT = 30
+
+# VPN会话失效后检查间隔的上限（秒）
+MAX_KEEPALIVE_BACKOFF = 3600
+
+
+def current_month(now=None):
+    return (now or datetime.now()).strftime('%Y-%m')
+
+
+class PollingDaemon:
+    def __init__(self, config, vpn_cookie, store, relogin=None, metrics=None, metrics_path=None,
+                 session_path=SESSION_FILE):
+        self.rooms = config['rooms']
+        self.interval = float(config.get('interval_minutes', DEFAULT_INTERVAL_MINUTES)) * 60
+        self.jitter = float(config.get('jitter_seconds', DEFAULT_JITTER_SECONDS))
+        self.keepalive_interval = float(config.get('keepalive_minutes', DEFAULT_KEEPALIVE_MINUTES)) * 60
+        self.max_workers = int(config.get('max_workers', DEFAULT_MAX_WORKERS))
+        self.status_path = config.get('status_file', DEFAULT_STATUS_PATH)
+        self.session_path = session_path
+        self.store = store
+        # 每次有房间查询完成后把指标写入metrics_path
+        self.metrics = metrics
+        self.metrics_path = metrics_path
+        # 票据失效时调用，返回新的VPN cookie；为None时（默认）不重新登录，只等待会话文件被更新
+        self.relogin = relogin
+        # VPN会话连续检查失败的次数，用于退避
+        self.session_failures = 0
+
+        rate = config.get('max_requests_per_minute', DEFAULT_MAX_REQUESTS_PER_MINUTE)
+        self.batch = BatchQuery(vpn_cookie, max_workers=self.max_workers, store=store,
+                                topology=TopologyIndex(config.get('topology_file', DEFAULT_TOPOLOGY_PATH)),
+                                base_url=config.get('base_url'), metrics=metrics,
+                                relogin=self._relogin if relogin is not None else None,
+                                rate_limiter=RateLimiter(rate / 60) if rate else None,
+                                skip_unchanged=True)
+        # 用于检查会话的查询，与工作线程共用连接池和速率限制
+        self.control = ElectricityQuery(vpn_cookie, base_url=config.get('base_url'), pool=self.batch.pool)
+        self.control.rate_limiter = self.batch.rate_limiter
+
+        # 房间键 -> 最近一次查询的状态
+        self.status = {}
+        for room in self.rooms:
+            key = self.room_key(room)
+            self.status[key] = {'last_poll': None, 'last_success': None, 'last_reading': None,
+                                'records': 0, 'new_records': 0, 'failures': 0, 'error': None}
+        self._status_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    @staticmethod
+    def room_key(room):
+        return room_key(room.get('campus', '校本部'), room['community'], room['building'], room['room'])
+
+    def stop(self):
+        self._stop.set()
+
+    def _relogin(self):
+        """
+        重新登录并保存会话；工作线程的票据失效时由BatchQuery调用（多个线程只会调用一次）
+        """
+        vpn_cookie = self.relogin()
+        if vpn_cookie:
+            self.control.use_vpn_cookie(vpn_cookie)
+            self.control.save_session(self.session_path)
+        return vpn_cookie
+
+    def keepalive(self):
+        """
+        检查VPN会话，返回会话是否可用
+        票据失效时：设置了relogin则重新登录；否则只尝试使用会话文件中（交互式查询保存的）新会话，不会等待扫码
+        """
+        if self.control.check_session():
+            self.session_failures = 0
+            return True
+        print("\n⚠️ VPN会话已失效")
+        if self.relogin is None:
+            vpn_cookie = open_session({'base_url': self.batch.base_url}, self.session_path, interactive=False)
+            if vpn_cookie:
+                self.control.use_vpn_cookie(vpn_cookie)
+        else:
+            vpn_cookie = self._relogin()
+        if not vpn_cookie:
+            self.session_failures += 1
+            print(f"❌ 没有可用的VPN会话，请运行一次交互式查询（python electricity_cli.py）更新{self.session_path}；"
+                  f"{self.keepalive_delay() / 60:g}分钟后再检查")
+            return False
+        self.session_failures = 0
+        self.batch.update_vpn_cookie(vpn_cookie)
+        print("✅ 已换用新的VPN会话")
+        return True
+
+    def keepalive_delay(self):
+        """
+        距离下一次检查VPN会话的时间（秒）：会话失效后按指数退避，不超过MAX_KEEPALIVE_BACKOFF
+        """
+        if not self.session_failures:
+            return self.keepalive_interval
+        return min(self.keepalive_interval * 2 ** self.session_failures,
+                   max(MAX_KEEPALIVE_BACKOFF, self.keepalive_interval))
+
+    def poll_range(self, room, now=None):
+        """
+        本次需要查询的月份范围：从最新一条本地记录所在的月份（没有记录时为配置的start，
+        都没有时为当前月份）到配置的end（默认为当前月份）
+        """
+        end = room.get('end') or current_month(now)
+        latest = self.store.latest_record_date(self.room_key(room))
+        start = latest[:7] if latest else (room.get('start') or end)
+        return min(start, end), end
+
+    def stored_readings(self, key, start, end):
+        """
+        本地存储中该房间start到end之间月份的读数条数
+        """
+        return self.store.count_records(key, list(month_range(start, end)))
+
+    def poll_room(self, room):
+        """
+        查询一个房间的新数据，返回是否成功；不抛出异常
+        """
+        key = self.room_key(room)
+        start, end = self.poll_range(room)
+        started = time.time()
+        error = None
+        records = new_records = 0
+        try:
+            if not self.store.missing_months(key, start, end):
+                print(f"\n✅ {key}：{start}到{end}的记录已是最新")
+            else:
+                # 本地存储按(房间, 读数日期)保存，查询前后的读数之差即本次轮询新增的读数
+                known = self.stored_readings(key, start, end)
+                result = self.batch.query_one(dict(room, start=start, end=end), start, end)
+                if result is None:
+                    error = "查询失败"
+                else:
+                    records = self.stored_readings(key, start, end)
+                    new_records = max(records - known, 0)
+        except Exception as e:
+            error = str(e)
+
+        try:
+            last_reading = self.store.latest_record_date(key)
+        except Exception as e:
+            print(f"\n⚠️ 读取{key}的本地记录失败：{str(e)}")
+            last_reading = None
+
+        with self._status_lock:
+            status = self.status[key]
+            status['last_reading'] = last_reading or status['last_reading']
+            status['last_poll'] = datetime.fromtimestamp(started).isoformat(timespec='seconds')
+            status['error'] = error
+            if error is None:
+                status['last_success'] = status['last_poll']
+                status['records'] = records
+                status['new_records'] = new_records
+                status['failures'] = 0
+            else:
+                status['failures'] += 1
+            failures = status['failures']
+
+        if error is None:
+            print(f"\n✅ {key}：{start}到{end}查询完成（{records}条记录，新增{new_records}条，{time.time() - started:.1f}秒）")
+        else:
+            print(f"\n❌ {key}：{error}（连续失败{failures}次）")
+        return error is None
+
+    def next_delay(self, room):
+        """
+        距离下一次查询该房间的时间（秒）
+        """
+        failures = self.status[self.room_key(room)]['failures']
+        if failures:
+            return min(self.interval, FAILURE_BACKOFF * 2 ** (failures - 1))
+        return max(0.0, self.interval + random.uniform(-self.jitter, self.jitter))
+
+    def write_status(self):
+        """
+        把各房间的状态写入status_file（先写临时文件再替换，读取方不会看到写了一半的文件）
+        """
+        if self.status_path:
+            with self._status_lock:
+                snapshot = {'updated_at': datetime.now().isoformat(timespec='seconds'),
+                            'rooms': {key: dict(status) for key, status in self.status.items()}}
+            try:
+                tmp_path = self.status_path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.status_path)
+            except Exception as e:
+                print(f"\n⚠️ 保存状态文件失败：{str(e)}")
+        self.batch.topology.save()
+
+    def run_once(self):
+        """
+        依次（最多max_workers个并发）查询所有房间一次，返回成功的房间数
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            succeeded = sum(executor.map(self.poll_room, self.rooms))
+        self.write_status()
+        return succeeded
+
+    def run(self):
+        """
+        持续轮询，直到调用stop()（或收到SIGINT/SIGTERM）；停止时等待进行中的查询完成
+        """
+        now = time.monotonic()
+        # (下一次查询的时间, 房间序号)
+        due = [(now + random.uniform(0, self.jitter), index) for index in range(len(self.rooms))]
+        heapq.heapify(due)
+        next_keepalive = now + self.keepalive_interval
+        in_flight = {}
+
+        print(f"\n✅ 守护进程已启动：{len(self.rooms)}个房间，每{self.interval / 60:g}分钟查询一次，"
+              f"最多{self.max_workers}个并发")
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='poll') as executor:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                while due and due[0][0] <= now and len(in_flight) < self.max_workers:
+                    _, index = heapq.heappop(due)
+                    in_flight[executor.submit(self.poll_room, self.rooms[index])] = index
+
+                # 有查询进行时会话一直在使用，不需要单独保活
+                if not in_flight and now >= next_keepalive:
+                    self.keepalive()
+                    next_keepalive = time.monotonic() + self.keepalive_delay()
+
+                wake_at = next_keepalive if not in_flight else math.inf
+                if due and len(in_flight) < self.max_workers:
+                    wake_at = min(wake_at, due[0][0])
+                timeout = min(max(wake_at - time.monotonic(), 0), MAX_IDLE_WAIT)
+
+                if not in_flight:
+                    self._stop.wait(timeout)
+                    continue
+                done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = in_flight.pop(future)
+                    heapq.heappush(due, (time.monotonic() + self.next_delay(self.rooms[index]), index))
+                if done:
+                    next_keepalive = time.monotonic() + self.keepalive_delay()
+                    self.write_status()
+                    if self.metrics is not None and self.metrics_path:
+                        self.metrics.dump(self.metrics_path)
+
+            if in_flight:
+                print(f"\n正在等待{len(in_flight)}个进行中的查询完成...")
+        self.write_status()
+        print("\n守护进程已停止")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="定时轮询房间电费的守护进程")
+    parser.add_argument('config', help="房间配置文件（JSON）")
+    parser.add_argument('--once', action='store_true', help="所有房间各查询一次后退出")
+    parser.add_argument('--db', default=None, help="本地存储的SQLite文件，默认使用配置中的db_file")
+    parser.add_argument('--session', default=SESSION_FILE, help="VPN会话文件")
+    parser.add_argument('--metrics', help="性能指标文件（.prom为Prometheus格式，其余为JSON），每次查询后更新")
+    args = parser.parse_args()
+
+    try:
+        config = load_config(args.config)
+    except ValueError as e:
+        print(f"❌ {str(e)}")
+        raise SystemExit(1)
+
+    vpn_cookie = open_session(config, args.session)
+    if not vpn_cookie:
+        print("\n❌ 获取VPN cookie失败，程序退出")
+        raise SystemExit(1)
+
+    metrics = RequestMetrics() if args.metrics else None
+    with RecordStore(args.db or config.get('db_file', DEFAULT_DB_PATH)) as store:
+        # 扫码登录会阻塞调度循环直到有人扫码，只有配置中明确设置了"relogin": true时才使用
+        relogin = None
+        if config.get('relogin', False):
+            relogin = ElectricityQuery(base_url=config.get('base_url')).get_vpn_cookie
+        daemon = PollingDaemon(config, vpn_cookie, store, relogin=relogin, metrics=metrics,
+                               metrics_path=args.metrics, session_path=args.session)
+
+        if args.once:
+            succeeded = daemon.run_once()
+            print(f"\n{succeeded}/{len(daemon.rooms)}个房间查询成功")
+        else:
+            # Ctrl+C和SIGTERM都只设置停止标志，等进行中的查询完成后退出
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda signum, frame: daemon.stop())
+            daemon.run()
+
+    if metrics is not None:
+        metrics.dump(args.metrics)
+    if args.once and succeeded < len(daemon.rooms):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
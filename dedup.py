@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用电记录去重
+
+日期范围重叠、重新查询同一个月份（中断后继续）或分页异常时，同一行gvElecInfo记录可能出现多次，
+使总用电量偏大。DedupIndex按 (房间, 读数日期) 建立哈希索引，逐页处理时每条记录只需一次集合查找，
+不需要收集全部记录后再排序去重；没有日期的记录按整行内容判断。
+
+一个索引只用于一次查询的结果，或者一个导出文件（Exporter.dedup）：多个房间条目共用同一个索引时，
+配置中重复的房间只有第一个条目能得到记录，总用电量就不对了。
+"""
+
+import threading
+
+from record_store import record_date
+
+
+def record_key(record):
+    """
+    一条记录的去重键：读数日期（YYYY-MM-DD），没有日期时为整行内容
+    """
+    return record_date(record) or tuple(cell.strip() for cell in record)
+
+
+class DedupIndex:
+    """
+    (房间, 去重键) 的集合，多个线程可以共用（例如共用同一个导出器的工作线程）
+    """
+
+    def __init__(self):
+        # 房间 -> 已出现过的去重键
+        self._keys = {}
+        self._lock = threading.Lock()
+        # 放行的记录数和丢弃的重复记录数
+        self.accepted = 0
+        self.duplicates = 0
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(keys) for keys in self._keys.values())
+
+    def add(self, room, record):
+        """
+        登记一条记录，第一次出现时返回True，重复时返回False
+        """
+        key = record_key(record)
+        with self._lock:
+            keys = self._keys.setdefault(room, set())
+            if key in keys:
+                self.duplicates += 1
+                return False
+            keys.add(key)
+            self.accepted += 1
+            return True
+
+    def filter(self, room, records):
+        """
+        返回records中第一次出现的记录，保持原有顺序
+        """
+        keys = [record_key(record) for record in records]
+        unique = []
+        with self._lock:
+            seen = self._keys.setdefault(room, set())
+            for key, record in zip(keys, records):
+                if key in seen:
+                    continue
+                seen.add(key)
+                unique.append(record)
+            self.accepted += len(unique)
+            self.duplicates += len(records) - len(unique)
+        return unique
@@ -4,7 +4,8 @@
 江苏大学宿舍电费查询系统 - 命令行版
 
 使用方法：
-python electricity_cli.py
+python electricity_cli.py          # 交互式查询
+python electricity_cli.py setup    # 安装Selenium并下载ChromeDriver（自动获取cookie时需要）
 
 功能：
 - 获取VPN cookie（自动/手动）
@@ -14,19 +15,166 @@ python electricity_cli.py
 """
 
 import requests
-from bs4 import BeautifulSoup
 import time
 import json
 import os
-import pickle
 from datetime import datetime, timedelta
 import sys
+from collections import namedtuple
+
+from browser_setup import invalidate_browser_probe, probe_browser, setup_environment
+from dedup import DedupIndex
+from exporters import open_exporter
+from http_pool import shared_pool
+from memory_budget import DEFAULT_BUDGET_MB, MemoryBudget, batch_size, page_size
+from metrics import InstrumentedSession, RequestMetrics
+from page_model import (Page, PageResponse, extract_hidden_fields, form_state_of, has_next_page_link,
+                        page_fingerprint, response_text)
+from page_parsers import set_default_parser
+from pipeline import DEFAULT_PREFETCH_DEPTH, SinkThread, prefetch
+import profiling
+from record_store import RecordStore, room_key, month_range
+from resilience import RETRY_STATUS_CODES, RequestFailed, RetryPolicy, SessionExpired, is_login_response
+from topology import TopologyIndex
+
+ELECTRICITY_URL = "https://webvpn.ujs.edu.cn/http/77726476706e69737468656265737421f8e6429b3e296c1e6b029ae29d51367b6885/"
+
+# 已登录VPN会话（cookie、请求头、票据获取时间）的保存位置
+SESSION_FILE = "vpn_session.json"
+
+# 流式查询产出的一页用电记录；from_store为True时是从本地存储读取的整月记录
+PageBatch = namedtuple('PageBatch', ['year', 'month', 'page', 'headers', 'records', 'from_store'])
+
+def total_usage(records):
+    """
+    计算记录列表中日用电量（第4列）的合计
+    """
+    total_electricity = 0
+    for record in records:
+        if len(record) > 3 and record[3].strip():
+            try:
+                total_electricity += float(record[3])
+            except ValueError:
+                pass
+    return total_electricity
+
+def postback_form(form_state, event_target, form_values):
+    """
+    构建下拉框联动的postback表单数据
+    """
+    data = {
+        '__EVENTTARGET': event_target,
+        '__EVENTARGUMENT': '',
+    }
+    data.update(form_state)
+    data.update(form_values)
+    return data
+
+def room_form(form_state, form_values, room_value, password):
+    """
+    构建选择房间并输入密码后的登录表单数据
+    """
+    data = dict(form_state)
+    data.update({
+        'ddlXiaoQu': form_values.get('ddlXiaoQu', '校本部'),
+        'ddlQuYu': form_values.get('ddlQuYu', ''),
+        'ddlLouDong': form_values.get('ddlLouDong', ''),
+        'ddlFangJian': room_value,
+        'txtStuPwd': password,
+        'btnEnter.x': '1',
+        'btnEnter.y': '1'
+    })
+    return data
+
+def month_form(form_state, year, month):
+    """
+    构建HouseElec.aspx中选择年月的表单数据
+    """
+    data = dict(form_state)
+    data.update({
+        'ddlYear': str(year),
+        'ddlMonth': f"{month:02d}",
+        'btnSelect': '查 看'
+    })
+    return data
+
+def next_page_form(form_state, year, month):
+    """
+    构建gvElecInfo表格翻到下一页的表单数据
+    """
+    data = dict(form_state)
+    data.update({
+        'ddlYear': str(year),
+        'ddlMonth': f"{month:02d}",
+        '__EVENTTARGET': 'gvElecInfo',
+        '__EVENTARGUMENT': 'Page$Next'
+    })
+    return data
+
+def normalize_base_url(base_url):
+    """
+    电费查询系统的根地址，未指定时使用环境变量ELECTRICITY_URL或默认的webvpn地址
+    """
+    base_url = base_url or os.environ.get('ELECTRICITY_URL') or ELECTRICITY_URL
+    return base_url if base_url.endswith('/') else base_url + '/'
+
+def absolute_url(link, base_url=None):
+    if not link.startswith('http'):
+        return (base_url or ELECTRICITY_URL) + link
+    return link
+
+def print_table_cells(electricity_info, missing_message):
+    if electricity_info:
+        print("\n电费查询结果：")
+        for info in electricity_info:
+            print(' | '.join(info))
+    else:
+        print(missing_message)
 
 class ElectricityQuery:
-    def __init__(self, vpn_cookie=None):
-        self.session = requests.Session()
+    def __init__(self, vpn_cookie=None, store=None, topology=None, base_url=None, metrics=None,
+                 retry_policy=None, relogin=None, pool=None):
+        # 传入RequestMetrics时记录每次请求的耗时、字节数和所属步骤
+        self.metrics = metrics
+        self.session = InstrumentedSession(metrics) if metrics is not None else requests.Session()
+        # 与同一进程中的其他查询共用keep-alive连接（http_pool.SharedPool），默认使用进程内共享的连接池
+        self.pool = pool or shared_pool()
+        self.pool.mount(self.session)
+        if metrics is not None:
+            metrics.pool_stats = self.pool.stats
+        # 电费查询系统的根地址，可以指向本地的stand_in_server.py
+        self.base_url = normalize_base_url(base_url)
+        # 本地记录存储（RecordStore），为None时每次都从服务器查询
+        self.store = store
+        # 宿舍拓扑索引（TopologyIndex），为None时每次都从首页开始逐级选择
+        self.topology = topology
+        # 当前选择的校区、社区、楼栋名称，以及对应的下拉框表单值
+        self.selection = {}
+        self.form_values = {}
+        # VPN票据的获取时间（时间戳），未知时为None
+        self.ticket_obtained_at = None
+        # 请求失败时的重试策略（RetryPolicy）
+        self.retry_policy = retry_policy or RetryPolicy()
+        # 票据失效时调用，返回新的VPN cookie（JSON字符串），为None时票据失效即查询失败
+        self.relogin = relogin
+        # 导出器（exporters.Exporter），设置后每取得一页记录就写入导出文件
+        self.exporter = None
+        # 月份和分页请求的预取深度，0为请求和解析依次进行
+        self.prefetch_depth = DEFAULT_PREFETCH_DEPTH
+        # 请求速率限制（resilience.RateLimiter），为None时不限制
+        self.rate_limiter = None
+        # 内存预算（memory_budget.MemoryBudget），设置后各阶段之间的队列按字节数限制，结果中不保留记录
+        self.memory_budget = None
+        # 为False时（批量查询、守护进程等无人值守的运行）不打开浏览器也不等待输入，需要初次设置的房间直接失败
+        self.interactive = True
+        # 为True时（需要本地存储）内容与上次抓取时相同的页面不再解析，该月份的记录合并后从本地存储整月产出
+        self.skip_unchanged = False
+        # 最近一次查询是否成功进入了用电信息页面
+        self._entered_room = False
+        # 最近一次查询跳过的重复记录数
+        self._duplicates = 0
         if vpn_cookie:
-            self.session.cookies.update(json.loads(vpn_cookie))
+            self.use_vpn_cookie(vpn_cookie)
         
         self.headers = {
             'Cache-Control': 'max-age=0',
@@ -38,133 +186,176 @@ class ElectricityQuery:
         }
         self.session.headers.update(self.headers)
     
+    def _request(self, step, method, url, retry=True, **kwargs):
+        """
+        发送一次请求，step为所属的查询步骤（用于性能指标）
+        连接错误、超时和网关错误按重试策略退避重试，重试用完后抛出RequestFailed；
+        被跳转到VPN登录页面时抛出SessionExpired
+        """
+        if self.metrics is not None:
+            self.session.step = step
+        max_attempts = self.retry_policy.max_attempts if retry else 1
+        
+        for attempt in range(max_attempts):
+            if attempt:
+                delay = self.retry_policy.delay(attempt - 1)
+                print(f"⚠️ {step}请求失败（{error}），{delay:.1f}秒后第{attempt}次重试...")
+                if self.metrics is not None:
+                    self.metrics.observe_retry(step)
+                time.sleep(delay)
+            
+            if self.rate_limiter is not None:
+                self.rate_limiter.wait()
+            try:
+                response = self.session.request(method, url, verify=False, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = str(e)
+                continue
+            
+            if is_login_response(response):
+                raise SessionExpired("VPN票据已失效")
+            if response.status_code in RETRY_STATUS_CODES:
+                error = f"状态码{response.status_code}"
+                continue
+            return response
+        
+        raise RequestFailed(f"{step}请求失败：{error}")
+    
+    def reauthenticate(self):
+        """
+        票据失效后通过relogin重新获取VPN cookie，成功时返回True
+        """
+        if self.relogin is None:
+            return False
+        print("\n⚠️ VPN票据已失效，正在重新登录...")
+        vpn_cookie = self.relogin()
+        if not vpn_cookie:
+            return False
+        self.use_vpn_cookie(vpn_cookie)
+        print("✅ 重新登录成功")
+        return True
+    
+    def _parse(self, response, step):
+        """
+        解析响应为Page，记录解析耗时
+        """
+        if self.metrics is None or isinstance(response, Page):
+            return Page.from_response(response)
+        start = time.perf_counter()
+        page = Page.from_response(response)
+        self.metrics.observe_parse(step, time.perf_counter() - start)
+        return page
+    
+    def use_vpn_cookie(self, vpn_cookie):
+        """
+        使用新获取的VPN cookie（JSON字符串）
+        """
+        self.session.cookies.update(json.loads(vpn_cookie))
+        self.ticket_obtained_at = time.time()
+    
+    def record_responses(self, directory):
+        """
+        把之后的每个响应按查询步骤保存到directory，用于离线基准测试回放
+        """
+        from site_fixtures import ResponseRecorder
+        self.session.hooks['response'].append(ResponseRecorder(directory))
+        print(f"📁 响应将保存到：{directory}")
+    
+    def save_session(self, path=SESSION_FILE):
+        """
+        保存已登录的VPN会话，下次启动时可以直接复用
+        与vpn_cookie.json一样保存为JSON（cookie为普通字典），加载时不会执行文件中的任何代码
+        """
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'cookies': self.session.cookies.get_dict(),
+                    'headers': dict(self.session.headers),
+                    'ticket_obtained_at': self.ticket_obtained_at,
+                    'saved_at': time.time()
+                }, f, ensure_ascii=False, indent=2)
+            print(f"\n📁 VPN会话已保存到 {path}")
+        except Exception as e:
+            print(f"\n⚠️ 保存VPN会话失败：{str(e)}")
+    
+    def load_session(self, path=SESSION_FILE):
+        """
+        加载保存的VPN会话，文件不存在或损坏时返回False
+        """
+        if not os.path.exists(path):
+            return False
+        
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            self.session.cookies.update(saved['cookies'])
+            self.session.headers.update(saved['headers'])
+            self.ticket_obtained_at = saved.get('ticket_obtained_at')
+            return True
+        except Exception as e:
+            print(f"\n⚠️ 加载VPN会话失败：{str(e)}")
+            return False
+    
+    def check_session(self, timeout=5):
+        """
+        用一次轻量请求检查VPN票据是否仍然有效：
+        只读取响应头，不跟随跳转；票据失效时webvpn会跳转到登录页面
+        """
+        try:
+            response = self._request('session_check', 'GET', self.base_url, retry=False, allow_redirects=False,
+                                     stream=True, timeout=timeout)
+            response.close()
+        except SessionExpired:
+            return False
+        except Exception as e:
+            print(f"\n⚠️ 检查VPN会话失败：{str(e)}")
+            return False
+        
+        location = response.headers.get('Location', '')
+        return response.status_code == 200 and 'login' not in location
+    
+    def restore_session(self, path=SESSION_FILE):
+        """
+        加载保存的VPN会话并检查票据是否有效，有效时返回True
+        """
+        if not self.load_session(path):
+            return False
+        
+        if self.ticket_obtained_at:
+            age_hours = (time.time() - self.ticket_obtained_at) / 3600
+            print(f"\n📁 找到保存的VPN会话（票据已使用 {age_hours:.1f} 小时），正在检查是否有效...")
+        else:
+            print("\n📁 找到保存的VPN会话，正在检查是否有效...")
+        
+        if self.check_session():
+            print("✅ VPN会话仍然有效，无需重新登录")
+            return True
+        
+        print("⚠️ VPN会话已失效，需要重新登录")
+        self.session.cookies.clear()
+        return False
+    
     def get_vpn_cookie(self):
         """
         获取VPN登录cookie
         检查是否存在Chrome浏览器，若有则自动获取cookie，否则指导用户手动获取
-        若selenium库未安装，尝试自动安装
+        依赖的安装和ChromeDriver下载由 python electricity_cli.py setup 完成
         """
         login_url = "https://webvpn.ujs.edu.cn/login"
         test_url = "https://webvpn.ujs.edu.cn/http/77726476706e69737468656265737421f8e6429b3e296c1e6b029ae29d51367b6885/"
         
         print("\n🔐 正在获取VPN登录cookie...")
         
-        # 检查并尝试安装selenium库
-        selenium_available = False
-        try:
-            from selenium import webdriver
-            from selenium.webdriver.chrome.options import Options
-            from selenium.webdriver.support.ui import WebDriverWait
-            from selenium.webdriver.support import expected_conditions as EC
-            from selenium.webdriver.common.by import By
-            selenium_available = True
-        except ImportError:
-            print("\n⚠️ Selenium库未安装，正在尝试自动安装...")
-            
-            # 尝试自动安装selenium
-            try:
-                import subprocess
-                print("正在安装Selenium库...")
-                subprocess.check_call([sys.executable, "-m", "pip", "install", "selenium"])
-                print("✅ Selenium库安装成功！")
-                # 重新导入
-                from selenium import webdriver
-                from selenium.webdriver.chrome.options import Options
-                from selenium.webdriver.support.ui import WebDriverWait
-                from selenium.webdriver.support import expected_conditions as EC
-                from selenium.webdriver.common.by import By
-                selenium_available = True
-            except Exception as e:
-                print(f"\n❌ 自动安装Selenium库失败：{str(e)}")
-                print("请手动安装Selenium库：pip install selenium")
-        
-        # 检查是否存在Chrome浏览器
-        chrome_available = False
-        if selenium_available:
-            try:
-                # 检查Chrome是否安装
-                try:
-                    # 尝试创建Chrome浏览器实例
-                    chrome_options = Options()
-                    chrome_options.add_argument("--headless")  # 无头模式，不显示浏览器窗口
-                    chrome_options.add_argument("--no-sandbox")
-                    chrome_options.add_argument("--disable-dev-shm-usage")
-                    chrome_options.add_argument("--disable-gpu")
-                    chrome_options.add_argument("--ignore-certificate-errors")
-                    
-                    # 尝试启动Chrome
-                    driver = webdriver.Chrome(options=chrome_options)
-                    driver.quit()
-                    chrome_available = True
-                except Exception as e:
-                    print(f"\n⚠️ Chrome浏览器检测失败：{str(e)}")
-                    
-                    # 检查是否是ChromeDriver缺失的错误
-                    if "Unable to obtain driver for chrome" in str(e) or "chromedriver" in str(e).lower():
-                        print("⚠️ ChromeDriver缺失，正在尝试自动安装...")
-                        
-                        # 尝试自动安装ChromeDriver
-                        try:
-                            import subprocess
-                            import os
-                            
-                            # 安装webdriver-manager
-                            print("正在安装webdriver-manager...")
-                            subprocess.check_call([sys.executable, "-m", "pip", "install", "webdriver-manager"])
-                            
-                            # 测试webdriver-manager
-                            from webdriver_manager.chrome import ChromeDriverManager
-                            from selenium.webdriver.chrome.service import Service
-                            
-                            print("正在下载ChromeDriver...")
-                            service = Service(ChromeDriverManager().install())
-                            
-                            # 再次尝试启动Chrome
-                            driver = webdriver.Chrome(service=service, options=chrome_options)
-                            driver.quit()
-                            chrome_available = True
-                            print("✅ ChromeDriver安装成功，Chrome浏览器检测成功")
-                        except Exception as e3:
-                            print(f"⚠️ ChromeDriver安装失败：{str(e3)}")
-                    
-                    # 检查系统路径中的Chrome可执行文件
-                    if not chrome_available:
-                        try:
-                            import os
-                            import platform
-                            
-                            system = platform.system()
-                            chrome_paths = []
-                            
-                            if system == "Windows":
-                                # Windows系统可能的Chrome路径
-                                chrome_paths = [
-                                    os.path.join(os.environ.get("PROGRAMFILES", r"C:\Program Files"), r"Google\Chrome\Application\chrome.exe"),
-                                    os.path.join(os.environ.get("PROGRAMFILES(X86)", r"C:\Program Files (x86)"), r"Google\Chrome\Application\chrome.exe"),
-                                    os.path.join(os.environ.get("LOCALAPPDATA", r"C:\Users\Default\AppData\Local"), r"Google\Chrome\Application\chrome.exe")
-                                ]
-                            elif system == "Darwin":
-                                # macOS系统可能的Chrome路径
-                                chrome_paths = ["/Applications/Google Chrome.app/Contents/MacOS/Google Chrome"]
-                            elif system == "Linux":
-                                # Linux系统可能的Chrome路径
-                                chrome_paths = ["/usr/bin/google-chrome", "/usr/bin/chromium", "/usr/bin/chromium-browser"]
-                            
-                            # 检查路径是否存在
-                            for path in chrome_paths:
-                                if os.path.exists(path):
-                                    print(f"✅ 找到Chrome可执行文件：{path}")
-                                    chrome_available = True
-                                    break
-                            
-                            if chrome_available:
-                                print("✅ Chrome浏览器检测成功（通过路径检查）")
-                            else:
-                                print("❌ 未找到Chrome可执行文件")
-                        except Exception as e2:
-                            print(f"⚠️ 路径检查失败：{str(e2)}")
-            except Exception as e:
-                print(f"\n⚠️ Selenium使用失败：{str(e)}")
+        # 浏览器能力检测结果缓存在本地，不再每次启动无头Chrome
+        capability = probe_browser()
+        if not capability['selenium']:
+            print("\n⚠️ Selenium库未安装，将使用手动获取模式")
+            print("如需自动获取cookie，请先运行：python electricity_cli.py setup")
+        elif not capability['chrome']:
+            print("\n⚠️ 未找到Chrome浏览器，将使用手动获取模式")
+        else:
+            print(f"✅ Chrome浏览器可用：{capability['chrome_path']}")
+        chrome_available = capability['selenium'] and capability['chrome']
         
         # 命令行模式获取cookie
         return self._get_vpn_cookie_cli(login_url, test_url, chrome_available)
@@ -256,6 +447,8 @@ class ElectricityQuery:
                 except Exception as e:
                     print(f"\n⚠️ 自动获取cookie失败：{str(e)}")
                     print("\n将回退到手动获取模式...")
+                    # 浏览器环境可能已变化，下次重新检测
+                    invalidate_browser_probe()
         
         # 手动获取cookie模式
         print("\n请按照以下详细步骤操作：")
@@ -315,14 +508,139 @@ class ElectricityQuery:
             print("\n❌ 未输入cookie，请重试")
             return None
     
+    def _room_key(self, room_number):
+        return room_key(self.selection.get('campus', ''), self.selection.get('community', ''),
+                        self.selection.get('building', ''), room_number)
+    
+    def load_from_store(self, campus, community, building, room_number, start_date, end_date):
+        """
+        若日期范围内的所有月份都已在本地存储中，直接返回查询结果，无需访问服务器
+        否则返回None
+        """
+        if self.store is None:
+            return None
+        
+        key = room_key(campus, community, building, room_number)
+        if self.store.missing_months(key, start_date, end_date):
+            return None
+        
+        all_electricity_records = []
+        headers = []
+        for year, month in month_range(start_date, end_date):
+            month_headers, month_records = self.store.load_month(key, year, month)
+            if not headers:
+                headers = month_headers
+            all_electricity_records.extend(month_records)
+        
+        print(f"\n✅ {start_date}到{end_date}的记录已全部在本地存储中，无需访问服务器")
+        return {
+            'records': all_electricity_records,
+            'headers': headers,
+            'total_electricity': total_usage(all_electricity_records),
+            'record_count': len(all_electricity_records)
+        }
+    
+    def query_room(self, campus, community, building, room_number, password, start_date, end_date):
+        """
+        依次完成访问系统、选择校区、社区、楼栋并查询电费，返回全部记录
+        """
+        print(f"\n正在查询房间 {room_number} 的电费")
+        
+        try:
+            batches = self._resilient_pages(
+                lambda: self.open_room(campus, community, building, room_number, password),
+                room_number, password, start_date, end_date)
+            return self._collect_result(batches)
+            
+        except Exception as e:
+            print(f"查询电费失败：{str(e)}")
+            import traceback
+            traceback.print_exc()
+            return None
+    
+    def iter_room_pages(self, campus, community, building, room_number, password, start_date, end_date):
+        """
+        流式查询某个房间：每取得一页用电记录就立即产出一个PageBatch
+        无法进入用电信息页面时不产出任何内容
+        """
+        yield from self._resilient_pages(
+            lambda: self.open_room(campus, community, building, room_number, password),
+            room_number, password, start_date, end_date)
+    
+    def iter_room_records(self, campus, community, building, room_number, password, start_date, end_date):
+        """
+        流式查询某个房间：逐条产出用电记录
+        """
+        for batch in self.iter_room_pages(campus, community, building, room_number, password, start_date, end_date):
+            yield from batch.records
+    
+    def open_room(self, campus, community, building, room_number, password):
+        """
+        选择校区、社区、楼栋和房间并登录，返回用电信息页面，失败时返回None
+        每次调用都开始一条独立的__VIEWSTATE链；有拓扑索引时从缓存的最深一级页面开始，
+        缓存不被服务器接受时再从首页重新选择
+        """
+        path = [campus, community, building]
+        
+        if self.topology is not None:
+            depth, page, form_values = self.topology.resolve(path, room_number)
+            if depth:
+                print(f"\n使用拓扑索引中缓存的页面，跳过{depth + 1}次请求")
+                self.selection = dict(zip(['campus', 'community', 'building'], path[:depth]))
+                self.form_values = form_values
+                info_page = self._navigate_and_enter(page, depth, path, room_number, password)
+                if info_page is not None:
+                    self.topology.save()
+                    return info_page
+                print("\n⚠️ 缓存的表单参数未被服务器接受，重新从首页查询")
+                self.topology.invalidate(path[:depth])
+        
+        # 访问电费查询系统
+        with profiling.phase('get_electricity_page'):
+            page = self.get_electricity_page()
+        if not page:
+            print("\n❌ 无法访问电费查询系统")
+            return None
+        
+        info_page = self._navigate_and_enter(page, 0, path, room_number, password)
+        if self.topology is not None:
+            self.topology.save()
+        return info_page
+    
+    def _navigate_and_enter(self, page, depth, path, room_number, password):
+        """
+        从第depth级开始依次选择剩余的校区、社区、楼栋，然后进入房间的用电信息页面
+        """
+        steps = [(self.select_campus, "校区"), (self.select_community, "社区"), (self.select_building, "楼栋")]
+        for level in range(depth, len(steps)):
+            select, label = steps[level]
+            with profiling.phase(select.__name__):
+                page = select(page, path[level])
+            if not page:
+                print(f"\n❌ 无法选择{label}")
+                return None
+        
+        return self._enter_room(page, room_number, password)
+    
+    def _remember(self, page, value):
+        """
+        把当前选择之后得到的页面记录到拓扑索引中
+        """
+        if self.topology is not None and page.form_state:
+            path = [self.selection[level] for level in ('campus', 'community', 'building') if level in self.selection]
+            self.topology.record(path, value, page)
+        return page
+    
     def get_electricity_page(self):
-        electricity_url = "https://webvpn.ujs.edu.cn/http/77726476706e69737468656265737421f8e6429b3e296c1e6b029ae29d51367b6885/"
+        electricity_url = self.base_url
         print(f"正在访问电费查询系统：{electricity_url}")
         
         try:
-            response = self.session.get(electricity_url, verify=False)
+            response = self._request('landing', 'GET', electricity_url)
             print(f"响应状态码：{response.status_code}")
-            return response
+            return self._parse(response, 'landing')
+        except SessionExpired:
+            raise
         except Exception as e:
             print(f"访问失败：{str(e)}")
             return None
@@ -331,23 +649,20 @@ class ElectricityQuery:
         print(f"\n正在选择校区：{campus_name}")
         
         try:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            viewstate = soup.find('input', {'name': '__VIEWSTATE'})['value']
-            eventvalidation = soup.find('input', {'name': '__EVENTVALIDATION'})['value']
+            form_state = Page.from_response(response).form_state
+            if not form_state:
+                print("未找到表单参数，无法选择校区")
+                return None
             
-            data = {
-                '__EVENTTARGET': 'ddlXiaoQu',
-                '__EVENTARGUMENT': '',
-                '__VIEWSTATE': viewstate,
-                '__EVENTVALIDATION': eventvalidation,
-                'ddlXiaoQu': campus_name
-            }
+            data = postback_form(form_state, 'ddlXiaoQu', {'ddlXiaoQu': campus_name})
             
-            electricity_url = "https://webvpn.ujs.edu.cn/http/77726476706e69737468656265737421f8e6429b3e296c1e6b029ae29d51367b6885/"
-            response = self.session.post(electricity_url, data=data, verify=False)
+            response = self._request('campus', 'POST', self.base_url, data=data)
             print(f"选择校区响应状态码：{response.status_code}")
-            return response
+            self.selection = {'campus': campus_name}
+            self.form_values = {'ddlXiaoQu': campus_name}
+            return self._remember(self._parse(response, 'campus'), campus_name)
+        except SessionExpired:
+            raise
         except Exception as e:
             print(f"选择校区失败：{str(e)}")
             return None
@@ -356,46 +671,35 @@ class ElectricityQuery:
         print(f"\n正在选择社区：{community_name}")
         
         try:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            viewstate_input = soup.find('input', {'name': '__VIEWSTATE'})
-            eventvalidation_input = soup.find('input', {'name': '__EVENTVALIDATION'})
+            page = Page.from_response(response)
             
-            if not viewstate_input or not eventvalidation_input:
+            form_state = page.form_state
+            if not form_state:
                 print("未找到表单参数，无法选择社区")
                 return None
             
-            viewstate = viewstate_input['value']
-            eventvalidation = eventvalidation_input['value']
-            
-            community_select = soup.find('select', {'name': 'ddlQuYu'})
-            if community_select:
-                community_value = None
-                for option in community_select.find_all('option'):
-                    if option.text.strip() == community_name:
-                        community_value = option['value']
-                        print(f"找到匹配的社区值：{community_value}")
-                        break
-                if not community_value:
-                    print(f"未找到匹配的社区选项：{community_name}")
-                    return None
-            else:
+            community_options = page.options.get('ddlQuYu')
+            if community_options is None:
                 print("未找到社区选择下拉框")
                 return None
+            community_value = community_options.get(community_name)
+            if not community_value:
+                print(f"未找到匹配的社区选项：{community_name}")
+                return None
+            print(f"找到匹配的社区值：{community_value}")
             
-            data = {
-                '__EVENTTARGET': 'ddlQuYu',
-                '__EVENTARGUMENT': '',
-                '__VIEWSTATE': viewstate,
-                '__EVENTVALIDATION': eventvalidation,
-                'ddlXiaoQu': '校本部',
+            data = postback_form(form_state, 'ddlQuYu', {
+                'ddlXiaoQu': self.form_values.get('ddlXiaoQu', '校本部'),
                 'ddlQuYu': community_value
-            }
+            })
             
-            electricity_url = "https://webvpn.ujs.edu.cn/http/77726476706e69737468656265737421f8e6429b3e296c1e6b029ae29d51367b6885/"
-            response = self.session.post(electricity_url, data=data, verify=False)
+            response = self._request('community', 'POST', self.base_url, data=data)
             print(f"选择社区响应状态码：{response.status_code}")
-            return response
+            self.selection['community'] = community_name
+            self.form_values['ddlQuYu'] = community_value
+            return self._remember(self._parse(response, 'community'), community_value)
+        except SessionExpired:
+            raise
         except Exception as e:
             print(f"选择社区失败：{str(e)}")
             return None
@@ -404,47 +708,36 @@ class ElectricityQuery:
         print(f"\n正在选择楼栋：{building_number}")
         
         try:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            viewstate_input = soup.find('input', {'name': '__VIEWSTATE'})
-            eventvalidation_input = soup.find('input', {'name': '__EVENTVALIDATION'})
+            page = Page.from_response(response)
             
-            if not viewstate_input or not eventvalidation_input:
+            form_state = page.form_state
+            if not form_state:
                 print("未找到表单参数，无法选择楼栋")
                 return None
             
-            viewstate = viewstate_input['value']
-            eventvalidation = eventvalidation_input['value']
-            
-            building_select = soup.find('select', {'name': 'ddlLouDong'})
-            if building_select:
-                building_value = None
-                for option in building_select.find_all('option'):
-                    if option.text.strip() == building_number:
-                        building_value = option['value']
-                        print(f"找到匹配的楼栋值：{building_value}")
-                        break
-                if not building_value:
-                    print(f"未找到匹配的楼栋选项：{building_number}")
-                    return None
-            else:
+            building_options = page.options.get('ddlLouDong')
+            if building_options is None:
                 print("未找到楼栋选择下拉框")
                 return None
+            building_value = building_options.get(building_number)
+            if not building_value:
+                print(f"未找到匹配的楼栋选项：{building_number}")
+                return None
+            print(f"找到匹配的楼栋值：{building_value}")
             
-            data = {
-                '__EVENTTARGET': 'ddlLouDong',
-                '__EVENTARGUMENT': '',
-                '__VIEWSTATE': viewstate,
-                '__EVENTVALIDATION': eventvalidation,
-                'ddlXiaoQu': '校本部',
-                'ddlQuYu': 'D区                                               ',
+            data = postback_form(form_state, 'ddlLouDong', {
+                'ddlXiaoQu': self.form_values.get('ddlXiaoQu', '校本部'),
+                'ddlQuYu': self.form_values.get('ddlQuYu', ''),
                 'ddlLouDong': building_value
-            }
+            })
             
-            electricity_url = "https://webvpn.ujs.edu.cn/http/77726476706e69737468656265737421f8e6429b3e296c1e6b029ae29d51367b6885/"
-            response = self.session.post(electricity_url, data=data, verify=False)
+            response = self._request('building', 'POST', self.base_url, data=data)
             print(f"选择楼栋响应状态码：{response.status_code}")
-            return response
+            self.selection['building'] = building_number
+            self.form_values['ddlLouDong'] = building_value
+            return self._remember(self._parse(response, 'building'), building_value)
+        except SessionExpired:
+            raise
         except Exception as e:
             print(f"选择楼栋失败：{str(e)}")
             return None
@@ -453,309 +746,517 @@ class ElectricityQuery:
         print(f"\n正在查询房间 {room_number} 的电费")
         
         try:
-            if response is None:
-                print("响应对象为None，无法查询电费")
-                return None
-            
-            if hasattr(response, 'status_code') and response.status_code != 200:
-                print(f"响应状态码异常：{response.status_code}")
-                return None
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            viewstate_input = soup.find('input', {'name': '__VIEWSTATE'})
-            eventvalidation_input = soup.find('input', {'name': '__EVENTVALIDATION'})
-            
-            if not viewstate_input or not eventvalidation_input:
-                print("未找到表单参数，无法查询电费")
-                return None
-            
-            viewstate = viewstate_input['value']
-            eventvalidation = eventvalidation_input['value']
-            
-            room_select = soup.find('select', {'name': 'ddlFangJian'})
-            if room_select:
-                room_value = None
-                for option in room_select.find_all('option'):
-                    if option.text.strip() == room_number:
-                        room_value = option['value']
-                        print(f"找到匹配的房间值：{room_value}")
-                        break
-                if not room_value:
-                    print(f"未找到房间 {room_number}")
-                    return None
-            else:
-                print("未找到房间选择下拉框")
-                return None
-            
-            data = {
-                '__VIEWSTATE': viewstate,
-                '__EVENTVALIDATION': eventvalidation,
-                'ddlXiaoQu': '校本部',
-                'ddlQuYu': 'D区                                               ',
-                'ddlLouDong': '1',
-                'ddlFangJian': room_value,
-                'txtStuPwd': password,
-                'btnEnter.x': '1',
-                'btnEnter.y': '1'
-            }
-            
-            electricity_url = "https://webvpn.ujs.edu.cn/http/77726476706e69737468656265737421f8e6429b3e296c1e6b029ae29d51367b6885/"
-            response = self.session.post(electricity_url, data=data, verify=False)
-            print(f"查询电费响应状态码：{response.status_code}")
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
+            batches = self._resilient_pages(lambda: self._enter_room(response, room_number, password),
+                                            room_number, password, start_date, end_date)
+            return self._collect_result(batches)
             
-            # 检查是否是初次使用，需要系统设置
-            if "系统设置" in response.text or "初次登录" in response.text:
-                print("\n⚠️ 检测到初次使用，需要设置房间密码和信息")
-                
-                # 获取表单参数
-                viewstate_input = soup.find('input', {'name': '__VIEWSTATE'})
-                eventvalidation_input = soup.find('input', {'name': '__EVENTVALIDATION'})
-                
-                if not viewstate_input or not eventvalidation_input:
-                    print("未找到表单参数，无法进行系统设置")
-                    return None
-                
-                viewstate = viewstate_input['value']
-                eventvalidation = eventvalidation_input['value']
+        except Exception as e:
+            print(f"查询电费失败：{str(e)}")
+            import traceback
+            traceback.print_exc()
+            return None
+    
+    def _collect_result(self, batches):
+        """
+        收集全部记录并计算总用电量，batches为_resilient_pages产出的PageBatch
+        无法进入用电信息页面，或票据失效后无法重新登录、重试用完时返回None
+        """
+        all_electricity_records = []
+        headers = []
+        # 设置了内存预算时记录只写入导出文件和本地存储，这里只累计条数和总用电量
+        keep_records = self.memory_budget is None
+        record_count = 0
+        total_electricity = 0
+        try:
+            for batch in batches:
+                if not headers:
+                    headers = batch.headers
+                record_count += len(batch.records)
+                if keep_records:
+                    all_electricity_records.extend(batch.records)
+                else:
+                    total_electricity += total_usage(batch.records)
+        except (SessionExpired, RequestFailed) as e:
+            print(f"\n❌ 查询中断：{str(e)}")
+            return None
+        
+        if not self._entered_room:
+            return None
+        if self._duplicates:
+            print(f"\n⚠️ 跳过了{self._duplicates}条重复记录")
+        
+        return {
+            'records': all_electricity_records,
+            'headers': headers,
+            'total_electricity': total_usage(all_electricity_records) if keep_records else total_electricity,
+            'record_count': record_count
+        }
+    
+    def _resilient_pages(self, open_info_page, room_number, password, start_date, end_date):
+        """
+        进入用电信息页面并逐页产出PageBatch
+        票据失效（重新登录后）或请求重试用完时，重新进入房间并从中断的月份/页继续，已产出的页不会重复产出；
+        无法重新登录或超过max_resumes时抛出SessionExpired/RequestFailed
+        """
+        self._entered_room = False
+        self._duplicates = 0
+        progress = {}
+        resumes = 0
+        write = self._export_writer()
+        # 去重只在一次查询之内进行，同一房间的另一次查询（例如配置中重复的房间）仍然得到完整的结果
+        dedup = DedupIndex()
+        try:
+            yield from self._resume_pages(open_info_page, room_number, password, start_date, end_date,
+                                          progress, resumes, write, dedup)
+        finally:
+            if isinstance(write, SinkThread):
+                write.close()
+                self.memory_budget.observe('sink', write.queue)
+    
+    def _export_writer(self):
+        """
+        写入导出文件的方式：设置了内存预算时交给后台的SinkThread（导出文件写得慢时查询等待），
+        否则直接调用exporter.write_batch；没有导出器时为None
+        """
+        if self.exporter is None:
+            return None
+        if self.memory_budget is None:
+            return self.exporter
+        exporter = self.exporter
+        return SinkThread(lambda item: exporter.write_batch(*item), self.memory_budget.sink_bytes, batch_size,
+                          name='export')
+    
+    def _resume_pages(self, open_info_page, room_number, password, start_date, end_date, progress, resumes, write,
+                      dedup):
+        while True:
+            try:
+                info_page = open_info_page()
+                if info_page is None:
+                    if not resumes:
+                        return
+                    raise RequestFailed("无法重新进入房间")
+                self._entered_room = True
+                for batch in self._iter_month_pages(info_page, room_number, start_date, end_date, progress):
+                    # 同一读数日期的记录只产出一次，重复的记录不计入总用电量，也不写入导出文件
+                    key = self._room_key(room_number)
+                    records = dedup.filter(key, batch.records)
+                    if len(records) != len(batch.records):
+                        self._duplicates += len(batch.records) - len(records)
+                        batch = batch._replace(records=records)
+                    if isinstance(write, SinkThread):
+                        write.put((batch.headers, batch.records, key))
+                    elif write is not None:
+                        write.write_batch(batch.headers, batch.records, key)
+                    yield batch
+                return
+            except (SessionExpired, RequestFailed) as e:
+                resumes += 1
+                if resumes > self.retry_policy.max_resumes:
+                    raise
+                if isinstance(e, SessionExpired) and not self.reauthenticate():
+                    raise
                 
-                # 命令行模式下，提示用户手动设置
-                print("\n请在浏览器中完成初次使用设置：")
-                print("1. 系统将打开设置页面")
-                print("2. 请设置房间密码")
-                print("3. 填写宿舍代表和手机号码")
-                print("4. 点击确定按钮完成设置")
+                # 之后从首页（或拓扑索引中缓存的楼栋页面）重新进入房间
+                if all(level in self.selection for level in ('campus', 'community', 'building')):
+                    selection = dict(self.selection)
+                    open_info_page = lambda: self.open_room(selection['campus'], selection['community'],
+                                                            selection['building'], room_number, password)
                 
-                # 打开系统浏览器
-                import webbrowser
-                setup_url = f"https://webvpn.ujs.edu.cn/http/77726476706e69737468656265737421f8e6429b3e296c1e6b029ae29d51367b6885/HouseInfo.aspx?ID={room_value}"
-                webbrowser.open(setup_url)
+                if progress:
+                    year, month = progress['month']
+                    print(f"\n⚠️ {str(e)}，重新进入房间，从{year}-{month:02d}第{progress['page'] + 1}页继续")
+                else:
+                    print(f"\n⚠️ {str(e)}，重新进入房间")
+    
+    def iter_electricity_pages(self, response, room_number, password, start_date, end_date):
+        """
+        流式查询：每取得一页用电记录就立即产出一个PageBatch，
+        调用方可以边查询边处理，内存占用不随日期范围增长
+        无法进入用电信息页面时不产出任何内容
+        """
+        print(f"\n正在查询房间 {room_number} 的电费")
+        
+        yield from self._resilient_pages(lambda: self._enter_room(response, room_number, password),
+                                         room_number, password, start_date, end_date)
+    
+    def iter_electricity_records(self, response, room_number, password, start_date, end_date):
+        """
+        流式查询：逐条产出用电记录
+        """
+        for batch in self.iter_electricity_pages(response, room_number, password, start_date, end_date):
+            yield from batch.records
+    
+    def _enter_room(self, response, room_number, password):
+        """
+        选择房间并输入密码登录，经由框架页面和导航栏进入用电信息页面
+        成功时返回用电信息页面，失败时返回None
+        """
+        if response is None:
+            print("响应对象为None，无法查询电费")
+            return None
+        
+        if hasattr(response, 'status_code') and response.status_code != 200:
+            print(f"响应状态码异常：{response.status_code}")
+            return None
+        
+        page = Page.from_response(response)
+        
+        form_state = page.form_state
+        if not form_state:
+            print("未找到表单参数，无法查询电费")
+            return None
+        
+        room_options = page.options.get('ddlFangJian')
+        if room_options is None:
+            print("未找到房间选择下拉框")
+            return None
+        room_value = room_options.get(room_number)
+        if not room_value:
+            print(f"未找到房间 {room_number}")
+            return None
+        print(f"找到匹配的房间值：{room_value}")
+        
+        data = room_form(form_state, self.form_values, room_value, password)
+        
+        with profiling.phase('enter_room'):
+            response = self._request('room', 'POST', self.base_url, data=data)
+            print(f"查询电费响应状态码：{response.status_code}")
+            page = self._parse(response, 'room')
+        
+        # 检查是否是初次使用，需要系统设置
+        if page.needs_setup:
+            if not self._first_use_setup(page, room_value):
+                return None
+            
+            # 重新查询
+            return self._enter_room(page, room_number, password)
+        
+        if not page.is_frameset:
+            print_table_cells(page.table_rows, "\n未找到电费信息，请手动检查查询结果文件。")
+            return None
+        
+        with profiling.phase('frameset'):
+            return self._resolve_frameset(page)
+    
+    def _resolve_frameset(self, page):
+        """
+        从框架页面经由stuMainFrame和stuTopFrame的导航栏进入用电信息页面，失败时返回None
+        """
+        print("\n发现框架页面，正在获取stuMainFrame的内容...")
+        
+        main_frame_src = page.frames.get('stuMainFrame')
+        if not main_frame_src:
+            print("未找到stuMainFrame")
+            return None
+        print(f"stuMainFrame的src：{main_frame_src}")
+        
+        main_frame_response = self._request('frames', 'GET', absolute_url(main_frame_src, self.base_url))
+        print(f"获取stuMainFrame响应状态码：{main_frame_response.status_code}")
+        
+        print_table_cells(self._parse(main_frame_response, 'frames').table_rows,
+                          "\n未找到电费信息，请手动检查stuMainFrame内容文件。")
+        
+        print("\n正在检查是否存在'用电信息'标签...")
+        
+        print("\n正在获取stuTopFrame的内容...")
+        top_frame_response = self._request('frames', 'GET', self.base_url + "stuTop.htm")
+        print(f"获取stuTopFrame响应状态码：{top_frame_response.status_code}")
+        
+        electricity_info_link = self._parse(top_frame_response, 'frames').electricity_info_link()
+        if not electricity_info_link:
+            print("\n未找到'用电信息'标签，可能需要手动点击。")
+            return None
+        
+        print(f"找到'用电信息'链接：{electricity_info_link}")
+        print("\n正在模拟点击'用电信息'标签...")
+        
+        electricity_info_response = self._request('frames', 'GET', absolute_url(electricity_info_link, self.base_url))
+        print(f"获取用电信息页面响应状态码：{electricity_info_response.status_code}")
+        
+        return self._parse(electricity_info_response, 'frames')
+    
+    def _first_use_setup(self, page, room_value):
+        """
+        初次使用时提示用户在浏览器中完成房间密码和信息设置
+        """
+        print("\n⚠️ 检测到初次使用，需要设置房间密码和信息")
+        
+        if not page.form_state:
+            print("未找到表单参数，无法进行系统设置")
+            return False
+        
+        # 无人值守时没有人能在浏览器中完成设置，等待输入会让工作线程一直挂起
+        if not self.interactive:
+            print("❌ 无人值守模式下无法完成初次设置，请先在命令行版中完成房间密码和信息设置")
+            return False
+        
+        # 命令行模式下，提示用户手动设置
+        print("\n请在浏览器中完成初次使用设置：")
+        print("1. 系统将打开设置页面")
+        print("2. 请设置房间密码")
+        print("3. 填写宿舍代表和手机号码")
+        print("4. 点击确定按钮完成设置")
+        
+        # 打开系统浏览器
+        import webbrowser
+        webbrowser.open(f"{self.base_url}HouseInfo.aspx?ID={room_value}")
+        
+        input("\n请完成设置后按Enter键继续...")
+        return True
+    
+    def _fetch_month_pages(self, info_form_state, months):
+        """
+        依次请求每个月份及其分页，产出 (年, 月, 页码, 已解码的PageResponse, 是否为该月最后一页)
+        只用正则表达式提取下一次回发需要的表单字段和分页状态，完整解析由调用方进行
+        """
+        for year, month in months:
+            response = self._request('month', 'POST', self.base_url + "HouseElec.aspx",
+                                     data=month_form(info_form_state, year, month))
+            page_index = 0
+            while True:
+                # 会话中没有登录的房间时服务器拒绝回发，按请求失败处理（重新进入房间后继续），不能当作没有记录
+                if response.status_code != 200:
+                    raise RequestFailed(f"查询{year}-{month:02d}的用电记录失败：状态码{response.status_code}")
+                response = PageResponse(response.status_code, response_text(response), response.url)
+                form_state, has_next_page = self._next_page_state(response)
+                yield year, month, page_index, response, not has_next_page
+                if not has_next_page:
+                    break
+                print("正在获取下一页...")
+                response = self._request('page', 'POST', self.base_url + "HouseElec.aspx",
+                                         data=next_page_form(form_state, year, month))
+                page_index += 1
+    
+    def _next_page_state(self, response):
+        """
+        返回 (下一页回发用的form_state, 是否有下一页)，正则提取不到表单字段时退回完整解析
+        """
+        text = response_text(response)
+        has_next_page = has_next_page_link(text)
+        form_state = form_state_of(extract_hidden_fields(text))
+        if has_next_page and form_state is None:
+            page = Page.from_response(response)
+            return page.form_state, page.has_next_page
+        return form_state, has_next_page
+    
+    def _iter_month_pages(self, info_page, room_number, start_date, end_date, progress=None):
+        """
+        逐月查询用电记录并处理分页，每取得一页就产出一个PageBatch
+        已结束的月份优先使用本地存储，整月作为一批产出
+        用电信息页面只解析一次，每个月份的查询都复用它的表单参数
+        prefetch_depth大于0时请求在后台线程中进行，解析当前页的同时下一页已经在请求中
+        progress记录下一批的位置 {'month': (年, 月), 'page': 页码}；传入之前中断时的progress可以从该位置继续，
+        之前的月份不再请求，同一个月中已产出的页只翻过而不再产出
+        有本地存储时保存每页内容的摘要；skip_unchanged为True时上次抓取过的月份中摘要与上次相同的页面不再解析，
+        有变化的页面合并到本地存储后，整月的记录从本地存储产出，结果和总用电量仍然完整
+        """
+        progress = {} if progress is None else progress
+        resume_month = progress.get('month')
+        resume_page = progress.get('page', 0)
+        headers = []
+        
+        store_key = self._room_key(room_number) if self.store is not None else None
+        
+        print(f"\n开始收集{start_date}到{end_date}的电费记录...")
+        
+        # (年, 月, 是否使用本地存储)，中断前已完成的月份不再处理
+        plan = []
+        for current_year, current_month in month_range(start_date, end_date):
+            if resume_month and (current_year, current_month) < resume_month:
+                continue
+            closed = bool(store_key) and self.store.is_month_closed(store_key, current_year, current_month)
+            plan.append((current_year, current_month, closed))
+        
+        pages = self._fetch_month_pages(info_page.form_state,
+                                        [(year, month) for year, month, closed in plan if not closed])
+        if self.prefetch_depth and self.memory_budget is not None:
+            budget = self.memory_budget
+            pages = prefetch(pages, self.prefetch_depth, budget.fetch_bytes, page_size,
+                             on_close=lambda bounded_queue: budget.observe('fetch', bounded_queue))
+        elif self.prefetch_depth:
+            pages = prefetch(pages, self.prefetch_depth)
+        
+        try:
+            for current_year, current_month, closed in plan:
+                current_date = f"{current_year}-{current_month:02d}"
+                skip_pages = resume_page if (current_year, current_month) == resume_month else 0
+                next_month = (current_year + 1, 1) if current_month == 12 else (current_year, current_month + 1)
                 
-                input("\n请完成设置后按Enter键继续...")
+                # 已结束且抓取过的月份直接读取本地存储
+                if closed:
+                    with profiling.phase('store'):
+                        month_headers, month_records = self.store.load_month(store_key, current_year, current_month)
+                    if not headers:
+                        headers = month_headers
+                    progress.update(month=next_month, page=0)
+                    if not skip_pages:
+                        print(f"\n月份 {current_date} 使用本地存储的 {len(month_records)} 条记录")
+                        yield PageBatch(current_year, current_month, 0, headers, month_records, True)
+                    continue
                 
-                # 重新查询
-                return self.query_electricity(response, room_number, password, start_date, end_date)
-            
-            frameset = soup.find('frameset')
-            if frameset:
-                print("\n发现框架页面，正在获取stuMainFrame的内容...")
+                print(f"\n正在处理月份：{current_date}")
+                # 写入本地存储需要整月的记录，最多只保留一个月
+                month_records = [] if store_key else None
+                # 页码 -> 本次抓取的内容摘要，以及上次抓取时的摘要
+                digests = {}
+                known_digests = (self.store.page_fingerprints(store_key, current_year, current_month)
+                                 if store_key and self.skip_unchanged else {})
+                # 上次抓取过的月份不逐页产出，月末从本地存储整月产出（未解析的页面的记录也在其中）
+                replay = bool(known_digests)
+                unchanged = 0
                 
-                main_frame = frameset.find('frame', {'name': 'stuMainFrame'})
-                if main_frame:
-                    main_frame_src = main_frame.get('src')
-                    print(f"stuMainFrame的src：{main_frame_src}")
-                    
-                    if not main_frame_src.startswith('http'):
-                        main_frame_url = "https://webvpn.ujs.edu.cn/http/77726476706e69737468656265737421f8e6429b3e296c1e6b029ae29d51367b6885/" + main_frame_src
-                    else:
-                        main_frame_url = main_frame_src
+                is_last_page = False
+                fetched = 0
+                while not is_last_page:
+                    # 与性能指标的步骤一致：month为选择月份的请求和第一页的解析，page为之后的每一页
+                    with profiling.phase('page' if fetched else 'month'):
+                        _, _, page_index, response, is_last_page = next(pages)
+                        fetched += 1
+                        if store_key:
+                            digests[page_index] = page_fingerprint(response.text)
+                        # 内容与上次抓取时相同的页面记录已在本地存储中，不解析也不产出
+                        page = (None if known_digests.get(page_index, '') == digests.get(page_index)
+                                else self._parse(response, 'page' if page_index else 'month'))
+                        response = None
+                    if page is None:
+                        unchanged += 1
+                        if self.metrics is not None:
+                            self.metrics.observe_unchanged('page' if page_index else 'month')
+                        continue
                     
-                    main_frame_response = self.session.get(main_frame_url, verify=False)
-                    print(f"获取stuMainFrame响应状态码：{main_frame_response.status_code}")
+                    if not headers:
+                        headers = page.grid_headers
+                    if month_records is not None:
+                        month_records.extend(page.grid_rows)
                     
-                    main_frame_soup = BeautifulSoup(main_frame_response.text, 'html.parser')
-                    
-                    electricity_info = []
-                    for table in main_frame_soup.find_all('table'):
-                        for row in table.find_all('tr'):
-                            cells = row.find_all('td')
-                            if cells:
-                                info = [cell.text.strip() for cell in cells]
-                                electricity_info.append(info)
-                    
-                    if electricity_info:
-                        print("\n电费查询结果：")
-                        for info in electricity_info:
-                            print(' | '.join(info))
-                    else:
-                        print("\n未找到电费信息，请手动检查stuMainFrame内容文件。")
-                    
-                    print("\n正在检查是否存在'用电信息'标签...")
-                    
-                    print("\n正在获取stuTopFrame的内容...")
-                    top_frame_url = "https://webvpn.ujs.edu.cn/http/77726476706e69737468656265737421f8e6429b3e296c1e6b029ae29d51367b6885/stuTop.htm"
-                    top_frame_response = self.session.get(top_frame_url, verify=False)
-                    print(f"获取stuTopFrame响应状态码：{top_frame_response.status_code}")
-                    
-                    top_frame_soup = BeautifulSoup(top_frame_response.text, 'html.parser')
-                    electricity_info_link = None
-                    
-                    for link in top_frame_soup.find_all('a', href=True):
-                        if link['href'] == 'HouseElec.aspx':
-                            electricity_info_link = link['href']
-                            print(f"找到'用电信息'链接：{electricity_info_link}")
-                            break
-                    
-                    if not electricity_info_link:
-                        nav_table = top_frame_soup.find('table')
-                        if nav_table:
-                            nav_links = nav_table.find_all('a', href=True)
-                            if len(nav_links) >= 2:
-                                electricity_info_link = nav_links[1]['href']
-                                print(f"通过索引找到'用电信息'链接：{electricity_info_link}")
-                    
-                    if electricity_info_link:
-                        print("\n正在模拟点击'用电信息'标签...")
-                        
-                        if not electricity_info_link.startswith('http'):
-                            electricity_info_url = "https://webvpn.ujs.edu.cn/http/77726476706e69737468656265737421f8e6429b3e296c1e6b029ae29d51367b6885/" + electricity_info_link
-                        else:
-                            electricity_info_url = electricity_info_link
-                        
-                        electricity_info_response = self.session.get(electricity_info_url, verify=False)
-                        print(f"获取用电信息页面响应状态码：{electricity_info_response.status_code}")
-                        
-                        electricity_info_soup = BeautifulSoup(electricity_info_response.text, 'html.parser')
-                        
-                        all_electricity_records = []
-                        headers = []
-                        
-                        start_year, start_month = map(int, start_date.split('-'))
-                        end_year, end_month = map(int, end_date.split('-'))
-                        
-                        print(f"\n开始收集{start_date}到{end_date}的电费记录...")
-                        
-                        # 计算总月数
-                        total_months = (end_year - start_year) * 12 + (end_month - start_month) + 1
-                        current_month_count = 0
-                        
-                        current_year = start_year
-                        current_month = start_month
-                        
-                        while (current_year < end_year) or (current_year == end_year and current_month <= end_month):
-                            current_date = f"{current_year}-{current_month:02d}"
-                            print(f"\n正在处理月份：{current_date}")
-                            
-                            page_soup = BeautifulSoup(electricity_info_response.text, 'html.parser')
-                            viewstate = page_soup.find('input', {'name': '__VIEWSTATE'})['value']
-                            eventvalidation = page_soup.find('input', {'name': '__EVENTVALIDATION'})['value']
-                            
-                            data = {
-                                '__VIEWSTATE': viewstate,
-                                '__EVENTVALIDATION': eventvalidation,
-                                'ddlYear': str(current_year),
-                                'ddlMonth': f"{current_month:02d}",
-                                'btnSelect': '查 看'
-                            }
-                            
-                            month_response = self.session.post("https://webvpn.ujs.edu.cn/http/77726476706e69737468656265737421f8e6429b3e296c1e6b029ae29d51367b6885/HouseElec.aspx", 
-                                                       data=data, verify=False)
-                            
-                            current_page_response = month_response
-                            has_next_page = True
-                            
-                            while has_next_page:
-                                page_soup = BeautifulSoup(current_page_response.text, 'html.parser')
-                                
-                                table = page_soup.find('table', {'id': 'gvElecInfo'})
-                                if table:
-                                    if not headers:
-                                        headers = [th.text.strip() for th in table.find('tr').find_all('th')]
-                                    
-                                    rows = table.find_all('tr')[1:]
-                                    for row in rows:
-                                        if row.find('a') and '下一页' in row.text:
-                                            continue
-                                        
-                                        cells = row.find_all('td')
-                                        if cells and len(cells) >= 5:
-                                            record = [cell.text.strip() for cell in cells]
-                                            if record[3] not in ['', ' ']:
-                                                all_electricity_records.append(record)
-                                
-                                has_next_page = False
-                                next_page_link = None
-                                
-                                for link in page_soup.find_all('a'):
-                                    if '下一页' in link.text:
-                                        has_next_page = True
-                                        break
-                                
-                                if has_next_page:
-                                    print("正在获取下一页...")
-                                    viewstate = page_soup.find('input', {'name': '__VIEWSTATE'})['value']
-                                    eventvalidation = page_soup.find('input', {'name': '__EVENTVALIDATION'})['value']
-                                    
-                                    pagination_data = {
-                                        '__VIEWSTATE': viewstate,
-                                        '__EVENTVALIDATION': eventvalidation,
-                                        'ddlYear': str(current_year),
-                                        'ddlMonth': f"{current_month:02d}",
-                                        '__EVENTTARGET': 'gvElecInfo',
-                                        '__EVENTARGUMENT': 'Page$Next'
-                                    }
-                                    
-                                    current_page_response = self.session.post("https://webvpn.ujs.edu.cn/http/77726476706e69737468656265737421f8e6429b3e296c1e6b029ae29d51367b6885/HouseElec.aspx", 
-                                                               data=pagination_data, verify=False)
-                            
-                            current_month += 1
-                            if current_month > 12:
-                                current_month = 1
-                                current_year += 1
-                        
-                        total_electricity = 0
-                        for record in all_electricity_records:
-                            if len(record) > 3 and record[3].strip():
-                                try:
-                                    total_electricity += float(record[3])
-                                except ValueError:
-                                    pass
-                        
-                        return {
-                            'records': all_electricity_records,
-                            'headers': headers,
-                            'total_electricity': total_electricity
-                        }
-                else:
-                    print("未找到stuMainFrame")
-            else:
-                electricity_info = []
-                for table in soup.find_all('table'):
-                    for row in table.find_all('tr'):
-                        cells = row.find_all('td')
-                        if cells:
-                            info = [cell.text.strip() for cell in cells]
-                            electricity_info.append(info)
+                    if not replay and page_index >= skip_pages:
+                        progress.update(month=(current_year, current_month), page=page_index + 1)
+                        yield PageBatch(current_year, current_month, page_index, headers, page.grid_rows, False)
                 
-                if electricity_info:
-                    print("\n电费查询结果：")
-                    for info in electricity_info:
-                        print(' | '.join(info))
-                else:
-                    print("\n未找到电费信息，请手动检查查询结果文件。")
-            
-            return None
-            
-        except Exception as e:
-            print(f"查询电费失败：{str(e)}")
-            import traceback
-            traceback.print_exc()
-            return None
+                if unchanged:
+                    print(f"月份 {current_date} 有{unchanged}页内容与上次相同，未重新解析，使用本地存储的记录")
+                with profiling.phase('store'):
+                    if unchanged:
+                        self.store.merge_month(store_key, current_year, current_month, headers, month_records)
+                    elif store_key:
+                        self.store.save_month(store_key, current_year, current_month, headers, month_records)
+                    if store_key:
+                        self.store.save_page_fingerprints(store_key, current_year, current_month, digests)
+                    if replay:
+                        # 第一页未解析时表头也从本地存储读取
+                        month_headers, month_records = self.store.load_month(store_key, current_year, current_month)
+                        headers = headers or month_headers
+                progress.update(month=next_month, page=0)
+                if replay and not skip_pages:
+                    yield PageBatch(current_year, current_month, 0, headers, month_records, True)
+        finally:
+            pages.close()
 
-def main():
+def print_result(result, start_date, end_date):
     """
-    命令行主函数
+    打印查询结果摘要和前10条用电详情
     """
-    print("=" * 60)
-    print("江苏大学宿舍电费查询系统 - 命令行版")
-    print("=" * 60)
+    print(f"查询结果：{start_date} 至 {end_date}")
+    print(f"总用电量：{result['total_electricity']:.2f} 度")
+    # 内存预算模式下结果中不保留记录，只有条数
+    record_count = result.get('record_count', len(result['records']))
+    print(f"记录条数：{record_count} 条")
     
-    # 获取VPN cookie
-    print("\n1. 获取VPN Cookie")
-    print("-" * 40)
-    eq = ElectricityQuery()
-    vpn_cookie = eq.get_vpn_cookie()
+    if result['headers']:
+        print("\n表头：")
+        print('\t'.join(result['headers']))
+        print("-" * 80)
+    
+    print("\n用电详情：")
+    for i, record in enumerate(result['records'][:10]):  # 只显示前10条
+        print(f"{i+1}.\t" + '\t'.join(record))
+    
+    if record_count > 10:
+        print(f"... 共 {record_count} 条记录，仅显示前10条")
+
+    print_statistics(result)
+
+def print_statistics(result):
+    """
+    打印按月统计和用电最多的几天，未安装numpy时跳过
+    """
+    try:
+        from analytics import analyze
+    except ImportError:
+        return
+
+    summary = analyze(result).summary()
+    if not summary or not summary['days']:
+        return
+
+    print("\n按月统计：")
+    for month, total in summary['monthly']:
+        print(f"{month}\t{total:.2f} 度")
+    print(f"日均用电：{summary['daily_average']:.2f} 度，近7天日均：{summary['recent_average']:.2f} 度")
+    print("用电最多的日期：" + '，'.join(f"{day}（{usage:.2f} 度）" for day, usage in summary['peak_days']))
+
+def option_value(argv, name, default=None):
+    """
+    读取命令行参数中 name 后面的值，参数不存在时返回None，缺少值时返回default
+    """
+    if name not in argv:
+        return None
+    index = argv.index(name)
+    return argv[index + 1] if index + 1 < len(argv) else default
+
+def main(argv=None):
+    """
+    命令行主函数
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "setup":
+        setup_environment()
+        return
+    if argv and argv[0] == "batch":
+        # 按配置文件批量查询，不需要任何输入，退出码表示结果
+        from batch_query import main as batch_main
+        sys.exit(batch_main(argv[1:]))
     
-    if not vpn_cookie:
-        print("\n❌ 获取VPN cookie失败，程序退出")
+    # --record DIR：保存本次查询的所有响应，供 benchmarks/bench_query.py --fixtures DIR 回放
+    record_dir = option_value(argv, "--record", "fixtures")
+    # --base-url URL：访问其他地址上的查询系统，例如本地的 stand_in_server.py
+    base_url = option_value(argv, "--base-url")
+    # --metrics PATH：记录每次请求的性能指标，结束时保存（.prom为Prometheus格式，其余为JSON）
+    metrics_path = option_value(argv, "--metrics", "metrics.json")
+    metrics = RequestMetrics() if metrics_path else None
+    # --export PATH：把查询到的记录写入文件，格式由扩展名决定（.csv、.jsonl、.parquet、.arrow、.npz）
+    export_path = option_value(argv, "--export", "electricity_records.csv")
+    # --memory-budget MB：限制查询过程中缓存的页面和待写入的记录，结束时报告峰值内存
+    memory_budget_mb = option_value(argv, "--memory-budget", str(DEFAULT_BUDGET_MB))
+    try:
+        memory_budget = MemoryBudget(float(memory_budget_mb)) if memory_budget_mb else None
+    except ValueError:
+        print(f"❌ 无效的内存预算：{memory_budget_mb}")
         return
+    # --profile PATH：记录每个阶段的耗时、CPU时间和内存峰值，结束时打印并保存（JSON）
+    profile_path = option_value(argv, "--profile", "profile.json")
+    # --flamegraph PATH：对查询过程采样调用栈，保存为折叠格式，可用flamegraph.pl或speedscope生成火焰图
+    flamegraph_path = option_value(argv, "--flamegraph", "profile.folded")
+    # --parser NAME：页面解析后端（bs4、stdlib或lxml），默认使用可用的最快后端
+    parser = option_value(argv, "--parser")
+    if parser:
+        try:
+            set_default_parser(parser)
+        except ValueError as e:
+            print(f"❌ {str(e)}")
+            return
+    
+    profiler = None
+    if profile_path or flamegraph_path:
+        profiler = profiling.enable(trace_memory=bool(profile_path),
+                                    sample_interval=profiling.DEFAULT_SAMPLE_INTERVAL if flamegraph_path else None)
     
-    print("\n✅ VPN cookie获取成功！")
+    print("=" * 60)
+    print("江苏大学宿舍电费查询系统 - 命令行版")
+    print("=" * 60)
     
     # 输入宿舍信息
-    print("\n2. 输入宿舍信息")
+    print("\n1. 输入宿舍信息")
     print("-" * 40)
     campus = input("请输入校区（默认：校本部）：").strip() or "校本部"
     community = input("请输入社区（例如：A区）：").strip()
@@ -768,7 +1269,7 @@ def main():
         return
     
     # 输入查询日期
-    print("\n3. 输入查询日期")
+    print("\n2. 输入查询日期")
     print("-" * 40)
     start_date = input("请输入开始日期（格式：YYYY-MM，例如：2026-01）：").strip()
     end_date = input("请输入结束日期（格式：YYYY-MM，例如：2026-01）：").strip()
@@ -777,63 +1278,77 @@ def main():
         print("\n❌ 日期输入不完整，程序退出")
         return
     
-    # 初始化查询对象
-    eq = ElectricityQuery(vpn_cookie)
-    
-    # 开始查询
-    print("\n4. 开始查询电费")
-    print("-" * 40)
-    
-    # 访问电费查询系统
-    response = eq.get_electricity_page()
-    if not response:
-        print("\n❌ 无法访问电费查询系统，程序退出")
-        return
-    
-    # 选择校区
-    response = eq.select_campus(response, campus)
-    if not response:
-        print("\n❌ 无法选择校区，程序退出")
-        return
-    
-    # 选择社区
-    response = eq.select_community(response, community)
-    if not response:
-        print("\n❌ 无法选择社区，程序退出")
-        return
-    
-    # 选择楼栋
-    response = eq.select_building(response, building)
-    if not response:
-        print("\n❌ 无法选择楼栋，程序退出")
-        return
+    exporter = None
+    if export_path:
+        try:
+            exporter = open_exporter(export_path)
+        except ValueError as e:
+            print(f"❌ {str(e)}")
+            return
     
-    # 查询电费
-    result = eq.query_electricity(response, room, password, start_date, end_date)
+    with RecordStore() as store:
+        # 已结束的月份都在本地存储中时，无需登录VPN
+        result = ElectricityQuery(store=store).load_from_store(campus, community, building, room, start_date, end_date)
+        if result is not None and exporter is not None:
+            exporter.write_result(result, room_key(campus, community, building, room))
+        
+        if result is None:
+            # 获取VPN cookie，优先复用上次保存的会话
+            print("\n3. 获取VPN Cookie")
+            print("-" * 40)
+            eq = ElectricityQuery(store=store, topology=TopologyIndex(), base_url=base_url, metrics=metrics)
+            eq.exporter = exporter
+            eq.memory_budget = memory_budget
+            if record_dir:
+                eq.record_responses(record_dir)
+            if not eq.restore_session():
+                vpn_cookie = eq.get_vpn_cookie()
+                
+                if not vpn_cookie:
+                    print("\n❌ 获取VPN cookie失败，程序退出")
+                    return
+                
+                print("\n✅ VPN cookie获取成功！")
+                eq.use_vpn_cookie(vpn_cookie)
+                eq.save_session()
+            
+            # 开始查询；查询过程中票据失效时重新获取cookie，并从中断的月份继续
+            print("\n4. 开始查询电费")
+            print("-" * 40)
+            eq.relogin = eq.get_vpn_cookie
+            ticket_obtained_at = eq.ticket_obtained_at
+            result = eq.query_room(campus, community, building, room, password, start_date, end_date)
+            if eq.ticket_obtained_at != ticket_obtained_at:
+                eq.save_session()
     
     if result:
         print("\n5. 查询结果")
         print("-" * 40)
-        print(f"查询结果：{start_date} 至 {end_date}")
-        print(f"总用电量：{result['total_electricity']:.2f} 度")
-        print(f"记录条数：{len(result['records'])} 条")
-        
-        if result['headers']:
-            print("\n表头：")
-            print('\t'.join(result['headers']))
-            print("-" * 80)
-        
-        print("\n用电详情：")
-        for i, record in enumerate(result['records'][:10]):  # 只显示前10条
-            print(f"{i+1}.\t" + '\t'.join(record))
-        
-        if len(result['records']) > 10:
-            print(f"... 共 {len(result['records'])} 条记录，仅显示前10条")
-        
+        print_result(result, start_date, end_date)
         print("\n✅ 查询完成！")
     else:
         print("\n❌ 查询失败，请检查网络连接和输入信息")
     
+    if exporter is not None:
+        exporter.close()
+        if exporter.count:
+            print(f"\n📁 {exporter.count}条记录已导出到：{os.path.abspath(export_path)}")
+    
+    if metrics is not None:
+        metrics.print_summary()
+        metrics.dump(metrics_path)
+    
+    if memory_budget is not None:
+        memory_budget.print_summary()
+    
+    if profiler is not None:
+        profiling.disable()
+        profiler.print_summary()
+        if profile_path:
+            profiler.dump(profile_path)
+        if flamegraph_path:
+            profiler.write_collapsed(flamegraph_path)
+    
     print("\n" + "=" * 60)
     print("程序执行完毕")
     print("=" * 60)
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用电记录导出
+
+每取得一页记录就写入文件，不必等整个查询结束，也不在内存中保留全部记录。
+列的类型由gvElecInfo的表头确定（usage_table.RecordSchema）：日期列为日期，读数和日用电量为浮点数，
+其余列为字符串；第一列为房间标识。支持的格式按文件扩展名选择：
+- .csv：保留原始文本，UTF-8（带BOM，Excel可以直接打开）
+- .jsonl：每行一条记录，日期为ISO格式字符串，数值为数字，空值为null
+- .parquet / .arrow：列式格式，需要安装pyarrow，按行组写入
+- .npz：未安装pyarrow时的列式格式（numpy），行组按列追加到临时文件，关闭时再组装成npz
+"""
+
+import csv
+import json
+import math
+import os
+import tempfile
+import threading
+import zipfile
+from datetime import date
+
+from usage_table import RecordSchema, convert_day, convert_float
+
+ROOM_COLUMN = '房间'
+
+# 列式格式每个行组的行数
+ROW_GROUP_SIZE = 65536
+
+STRING, DATE, FLOAT = 'string', 'date', 'float'
+
+
+class ExportSchema:
+    """
+    导出文件的列名和类型，由第一批记录的表头确定
+    """
+
+    def __init__(self, headers, sample=None):
+        record_schema = RecordSchema(headers, sample)
+        width = max(len(headers), len(sample or ()))
+        self.width = width
+
+        names = [ROOM_COLUMN]
+        for index in range(width):
+            name = headers[index].strip() if index < len(headers) and headers[index].strip() else f"column_{index}"
+            # 表头重名时加上列号
+            names.append(name if name not in names else f"{name}_{index}")
+        self.names = names
+
+        self.types = [STRING] + [STRING] * width
+        if record_schema.date_column is not None and record_schema.date_column < width:
+            self.types[record_schema.date_column + 1] = DATE
+        for column in (record_schema.reading_column, record_schema.usage_column):
+            if column is not None and column < width:
+                self.types[column + 1] = FLOAT
+
+    def extra_cells(self, record):
+        """
+        记录中超出导出列数、且不为空的单元格数；这些单元格不会写入导出文件
+        """
+        return sum(1 for cell in record[self.width:] if cell.strip())
+
+    def text_row(self, record, room):
+        cells = list(record[:self.width])
+        return [room] + cells + [''] * (self.width - len(cells))
+
+    def typed_row(self, record, room):
+        """
+        按列类型转换后的一行：日期为date，数值为float，无法识别的日期和数值为None
+        """
+        row = [room]
+        for index, kind in enumerate(self.types[1:]):
+            cell = record[index] if index < len(record) else None
+            if kind == DATE:
+                ordinal = convert_day(cell)[0]
+                row.append(date.fromordinal(ordinal) if ordinal else None)
+            elif kind == FLOAT:
+                value = convert_float(cell)[0]
+                row.append(None if math.isnan(value) else value)
+            else:
+                row.append(cell)
+        return row
+
+    def to_dict(self):
+        return {'columns': [{'name': name, 'type': kind} for name, kind in zip(self.names, self.types)]}
+
+
+class Exporter:
+    """
+    导出器基类：write_batch可以被多个线程调用，close后文件才完整
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.schema = None
+        self.count = 0
+        # 去重索引（dedup.DedupIndex），设置后同一房间的读数在整个导出文件中只写入一次
+        self.dedup = None
+        # 列数多于导出列数、多出的单元格被截掉的记录数
+        self.truncated = 0
+        self._lock = threading.Lock()
+
+    def write_batch(self, headers, records, room=''):
+        """
+        写入一批记录（通常是一页），第一批记录决定导出的列；之后更宽的记录多出的列不写入，并给出警告
+        """
+        if self.dedup is not None:
+            records = self.dedup.filter(room, records)
+        if not records:
+            return
+        with self._lock:
+            if self.schema is None:
+                self.schema = ExportSchema(headers, records[0])
+                self._open()
+            truncated = sum(1 for record in records if self.schema.extra_cells(record))
+            if truncated:
+                if not self.truncated:
+                    print(f"\n⚠️ {room or '记录'}有{truncated}条记录的列数多于导出文件的{self.schema.width}列，"
+                          f"多出的列不会写入{self.path}")
+                self.truncated += truncated
+            self._write(records, room)
+            self.count += len(records)
+
+    def write_result(self, result, room=''):
+        """
+        写入query_room等返回的完整结果
+        """
+        self.write_batch(result['headers'], result['records'], room)
+
+    def close(self):
+        with self._lock:
+            if self.schema is not None:
+                self._close()
+            if self.truncated:
+                print(f"\n⚠️ 共有{self.truncated}条记录的列数多于导出文件的列数，多出的列没有写入{self.path}")
+
+    def _open(self):
+        raise NotImplementedError
+
+    def _write(self, records, room):
+        raise NotImplementedError
+
+    def _close(self):
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CsvExporter(Exporter):
+    def _open(self):
+        self._file = open(self.path, 'w', encoding='utf-8-sig', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.schema.names)
+
+    def _write(self, records, room):
+        self._writer.writerows(self.schema.text_row(record, room) for record in records)
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+
+class JsonLinesExporter(Exporter):
+    def _open(self):
+        self._file = open(self.path, 'w', encoding='utf-8')
+
+    def _write(self, records, room):
+        names = self.schema.names
+        for record in records:
+            row = [value.isoformat() if isinstance(value, date) else value
+                   for value in self.schema.typed_row(record, room)]
+            self._file.write(json.dumps(dict(zip(names, row)), ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+
+class ColumnarExporter(Exporter):
+    """
+    列式导出：记录先按列缓存，满一个行组后写出
+    """
+
+    def __init__(self, path, row_group_size=ROW_GROUP_SIZE):
+        super().__init__(path)
+        self.row_group_size = row_group_size
+        self._columns = None
+
+    def _open(self):
+        self._columns = [[] for _ in self.schema.names]
+
+    def _write(self, records, room):
+        for record in records:
+            for column, value in zip(self._columns, self.schema.typed_row(record, room)):
+                column.append(value)
+        if len(self._columns[0]) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if self._columns[0]:
+            self._write_row_group(self._columns)
+            self._columns = [[] for _ in self.schema.names]
+
+    def _close(self):
+        self._flush()
+        self._finish()
+
+    def _write_row_group(self, columns):
+        raise NotImplementedError
+
+    def _finish(self):
+        pass
+
+
+class ArrowExporter(ColumnarExporter):
+    """
+    Parquet（.parquet）或Arrow IPC文件（.arrow/.feather），需要pyarrow
+    """
+
+    def __init__(self, path, row_group_size=ROW_GROUP_SIZE, parquet=None):
+        import pyarrow  # noqa: F401  未安装时在创建导出器时就报错
+        super().__init__(path, row_group_size)
+        self.parquet = path.endswith('.parquet') if parquet is None else parquet
+        self._writer = None
+
+    def _arrow_schema(self):
+        import pyarrow as pa
+        types = {STRING: pa.string(), DATE: pa.date32(), FLOAT: pa.float64()}
+        return pa.schema([(name, types[kind]) for name, kind in zip(self.schema.names, self.schema.types)],
+                         metadata={'source': 'gvElecInfo'})
+
+    def _write_row_group(self, columns):
+        import pyarrow as pa
+        arrow_schema = self._arrow_schema()
+        if self._writer is None:
+            if self.parquet:
+                import pyarrow.parquet as pq
+                self._writer = pq.ParquetWriter(self.path, arrow_schema)
+            else:
+                self._writer = pa.ipc.new_file(self.path, arrow_schema)
+        table = pa.Table.from_arrays([pa.array(column, type=field.type)
+                                      for column, field in zip(columns, arrow_schema)], schema=arrow_schema)
+        self._writer.write_table(table)
+
+    def _finish(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+class NpzExporter(ColumnarExporter):
+    """
+    numpy的.npz文件：每列一个数组（日期为datetime64[D]，数值为float64，字符串为Unicode），
+    列名和类型保存在__schema__中
+    npz中每个数组的头部要写明长度，所以行组先按列追加到临时文件，关闭时再逐个行组写入npz，
+    内存中最多只有一个行组（与设置了内存预算的查询一起使用时也不会缓存全部记录）
+    """
+
+    def __init__(self, path, row_group_size=ROW_GROUP_SIZE):
+        import numpy  # noqa: F401
+        super().__init__(path, row_group_size)
+        # 每列一个临时文件，以及写入其中的各个行组的 (dtype, 行数)
+        self._spools = None
+        self._segments = None
+
+    def _write_row_group(self, columns):
+        import numpy as np
+        if self._spools is None:
+            self._spools = [tempfile.TemporaryFile() for _ in columns]
+            self._segments = [[] for _ in columns]
+        for index, (column, kind) in enumerate(zip(columns, self.schema.types)):
+            if kind == DATE:
+                array = np.array([value.isoformat() if value else 'NaT' for value in column], dtype='datetime64[D]')
+            elif kind == FLOAT:
+                array = np.array([math.nan if value is None else value for value in column], dtype='float64')
+            else:
+                array = np.array(['' if value is None else value for value in column], dtype=str)
+            self._spools[index].write(array.tobytes())
+            self._segments[index].append((array.dtype, len(array)))
+
+    def _finish(self):
+        import numpy as np
+        if self._spools is None:
+            return
+        with zipfile.ZipFile(self.path, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for index, (spool, segments) in enumerate(zip(self._spools, self._segments)):
+                # 各行组的字符串列宽度不同，取最宽的
+                dtype = np.result_type(*[segment_dtype for segment_dtype, _ in segments])
+                header = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                          'shape': (sum(count for _, count in segments),)}
+                spool.seek(0)
+                with archive.open(f"c{index}.npy", 'w', force_zip64=True) as f:
+                    np.lib.format.write_array_header_2_0(f, header)
+                    for segment_dtype, count in segments:
+                        group = np.frombuffer(spool.read(segment_dtype.itemsize * count), dtype=segment_dtype)
+                        f.write(group.astype(dtype).tobytes())
+                spool.close()
+            with archive.open('__schema__.npy', 'w') as f:
+                np.lib.format.write_array(f, np.array(json.dumps(self.schema.to_dict(), ensure_ascii=False)))
+        self._spools = self._segments = None
+
+
+EXPORTERS = {
+    'csv': CsvExporter,
+    'jsonl': JsonLinesExporter,
+    'parquet': lambda path: ArrowExporter(path, parquet=True),
+    'arrow': lambda path: ArrowExporter(path, parquet=False),
+    'npz': NpzExporter,
+}
+
+EXTENSIONS = {
+    '.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl',
+    '.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow', '.npz': 'npz',
+}
+
+
+def open_exporter(path, export_format=None):
+    """
+    按格式（默认由扩展名决定）创建导出器；格式未知或缺少依赖时抛出ValueError
+    """
+    export_format = export_format or EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if export_format not in EXPORTERS:
+        raise ValueError(f"无法识别的导出格式：{path}（支持：{', '.join(EXTENSIONS)}）")
+    try:
+        return EXPORTERS[export_format](path)
+    except ImportError as e:
+        raise ValueError(f"导出为{export_format}需要安装{e.name}") from e
+
+
+def load_npz(path):
+    """
+    读取NpzExporter写出的文件，返回 (列名列表, {列名: 数组})
+    """
+    import numpy as np
+    with np.load(path) as data:
+        schema = json.loads(str(data['__schema__']))
+        names = [column['name'] for column in schema['columns']]
+        return names, {name: data[f"c{index}"] for index, name in enumerate(names)}
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+进程内共享的HTTP连接池
+
+默认情况下每个requests.Session都有自己的连接池，多房间查询时每个ElectricityQuery
+都要重新和VPN网关建立TCP/TLS连接。SharedPool把同一个HTTPAdapter挂载到所有会话上，
+会话之间只共享底层的keep-alive连接，cookie（VPN票据、ASP.NET_SessionId）仍由各自的会话保存。
+连接池大小应与并发的工作线程数一致；PoolStats统计取用连接的次数和真正新建连接（握手）的次数。
+"""
+
+import threading
+
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# 每个主机保持的连接数，默认与BatchQuery的工作线程数一致
+DEFAULT_POOL_SIZE = 8
+
+# 保持连接池的主机数（webvpn网关、本地模拟服务等）
+DEFAULT_MAX_HOSTS = 4
+
+
+class PoolStats:
+    """
+    连接池命中统计：checkouts为取用连接的次数，connects为新建连接的次数，其余为复用（命中）
+    """
+
+    def __init__(self):
+        self.checkouts = {}
+        self.connects = {}
+        self._lock = threading.Lock()
+
+    def record_checkout(self, host):
+        with self._lock:
+            self.checkouts[host] = self.checkouts.get(host, 0) + 1
+
+    def record_connect(self, host):
+        with self._lock:
+            self.connects[host] = self.connects.get(host, 0) + 1
+
+    @property
+    def misses(self):
+        return sum(self.connects.values())
+
+    @property
+    def hits(self):
+        return max(sum(self.checkouts.values()) - self.misses, 0)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def to_dict(self):
+        with self._lock:
+            hosts = {host: {'checkouts': count,
+                            'connects': self.connects.get(host, 0),
+                            'hits': max(count - self.connects.get(host, 0), 0)}
+                     for host, count in self.checkouts.items()}
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate, 'hosts': hosts}
+
+    def print_summary(self):
+        print(f"\n连接池：复用 {self.hits} 次，新建连接 {self.misses} 次，命中率 {self.hit_rate:.1%}")
+
+
+class _CountingPoolMixin:
+    """
+    记录连接取用和新建连接的urllib3连接池
+    """
+    pool_stats = None
+
+    def _get_conn(self, timeout=None):
+        self.pool_stats.record_checkout(self.host)
+        return super()._get_conn(timeout)
+
+    def _new_conn(self):
+        conn = super()._new_conn()
+        connect = conn.connect
+        stats, host = self.pool_stats, self.host
+
+        # 连接在首次发送请求时才真正建立，断开后重新建立也会再次调用connect
+        def counted_connect():
+            stats.record_connect(host)
+            return connect()
+
+        conn.connect = counted_connect
+        return conn
+
+
+class SharedPoolAdapter(HTTPAdapter):
+    def __init__(self, stats, pool_size=DEFAULT_POOL_SIZE, max_hosts=DEFAULT_MAX_HOSTS, block=False):
+        self.stats = stats
+        self._pool_classes = {
+            'http': type('CountingHTTPConnectionPool', (_CountingPoolMixin, HTTPConnectionPool),
+                         {'pool_stats': stats}),
+            'https': type('CountingHTTPSConnectionPool', (_CountingPoolMixin, HTTPSConnectionPool),
+                          {'pool_stats': stats}),
+        }
+        super().__init__(pool_connections=max_hosts, pool_maxsize=pool_size, pool_block=block)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = self._pool_classes
+
+
+class SharedPool:
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, max_hosts=DEFAULT_MAX_HOSTS, block=False):
+        """
+        pool_size：每个主机保持的keep-alive连接数
+        block：为True时连接全部被占用后等待空闲连接，而不是临时新建一个用完即关闭的连接
+        """
+        self.pool_size = pool_size
+        self.max_hosts = max_hosts
+        self.block = block
+        self.stats = PoolStats()
+        self.adapter = SharedPoolAdapter(self.stats, pool_size, max_hosts, block)
+        self._lock = threading.Lock()
+
+    def mount(self, session):
+        """
+        让会话使用共享的连接池，返回会话本身
+        """
+        session.mount('https://', self.adapter)
+        session.mount('http://', self.adapter)
+        return session
+
+    def ensure_size(self, pool_size):
+        """
+        连接池小于pool_size时扩大（例如BatchQuery的工作线程数多于当前连接数），已有的空闲连接会被关闭
+        """
+        with self._lock:
+            if pool_size <= self.pool_size:
+                return
+            self.pool_size = pool_size
+            self.adapter.poolmanager.clear()
+            self.adapter.init_poolmanager(self.max_hosts, pool_size, self.block)
+
+    def close(self):
+        self.adapter.close()
+
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def shared_pool(pool_size=None):
+    """
+    返回进程内共享的连接池，首次调用时创建；指定pool_size时保证连接池不小于该值
+    """
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = SharedPool(max(pool_size or 0, DEFAULT_POOL_SIZE))
+    if pool_size:
+        _shared_pool.ensure_size(pool_size)
+    return _shared_pool
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内存预算
+
+在内存较小的机器上遍历大量房间时，用MemoryBudget限制查询流水线中各阶段之间缓存的数据量：
+- 请求阶段：已下载、尚未解析的页面（pipeline.prefetch的队列）
+- 写入阶段：已解析、尚未写入导出文件的记录（pipeline.SinkThread的队列）
+两个队列都按字节数计算，队列满时上游等待（反压）。设置了内存预算的查询不在结果中保留记录，
+只返回条数和总用电量，记录写入导出文件和本地存储；写入本地存储时最多保留一个月的记录。
+多个线程同时查询时预算按线程数平分。
+
+结束时报告进程的峰值常驻内存（RSS）以及每个阶段队列的峰值和等待时间。
+"""
+
+import sys
+import threading
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_BUDGET_MB = 64
+
+# 请求阶段和写入阶段的队列各占预算的比例，其余留给解析、当前月份的记录和连接缓冲
+FETCH_SHARE = 0.25
+SINK_SHARE = 0.25
+
+# 每条记录（列表）和每个单元格（字符串）之外的固定开销估计
+RECORD_OVERHEAD = 64
+
+
+def peak_rss_bytes(children=False):
+    """
+    峰值常驻内存（字节），children为True时为已结束的子进程中最大的一个；不支持的平台返回None
+    """
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux以KB为单位，macOS以字节为单位
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def format_bytes(size):
+    if size is None:
+        return "未知"
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def page_size(item):
+    """
+    请求阶段队列项 (年, 月, 页码, PageResponse, 是否为最后一页) 的字节数
+    """
+    return sys.getsizeof(item[3].text)
+
+
+def batch_size(batch):
+    """
+    写入阶段队列项 (表头, 记录列表, 房间) 的字节数估计
+    """
+    _, records, _ = batch
+    return sum(RECORD_OVERHEAD + sum(sys.getsizeof(cell) for cell in record) for record in records)
+
+
+class MemoryBudget:
+    def __init__(self, megabytes=DEFAULT_BUDGET_MB, concurrency=1):
+        self.total_bytes = int(megabytes * 1024 * 1024)
+        # 同时进行的查询数，由BatchQuery设置
+        self.concurrency = concurrency
+        # 阶段 -> {'peak_bytes': 队列峰值, 'blocked_seconds': 上游等待时间}
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    @property
+    def fetch_bytes(self):
+        return max(1, int(self.total_bytes * FETCH_SHARE / max(self.concurrency, 1)))
+
+    @property
+    def sink_bytes(self):
+        return max(1, int(self.total_bytes * SINK_SHARE / max(self.concurrency, 1)))
+
+    def observe(self, stage, bounded_queue):
+        """
+        汇总一个已经结束的队列的统计
+        """
+        with self._lock:
+            stats = self.stages.setdefault(stage, {'peak_bytes': 0, 'blocked_seconds': 0.0})
+            stats['peak_bytes'] = max(stats['peak_bytes'], bounded_queue.peak_bytes)
+            stats['blocked_seconds'] += bounded_queue.blocked_seconds
+
+    def to_dict(self):
+        with self._lock:
+            stages = {stage: dict(stats) for stage, stats in self.stages.items()}
+        return {
+            'budget_bytes': self.total_bytes,
+            'fetch_queue_bytes': self.fetch_bytes,
+            'sink_queue_bytes': self.sink_bytes,
+            'concurrency': self.concurrency,
+            'stages': stages,
+            'peak_rss_bytes': peak_rss_bytes()
+        }
+
+    def print_summary(self):
+        report = self.to_dict()
+        print("\n内存预算：")
+        print(f"  预算：{format_bytes(report['budget_bytes'])}（请求队列 {format_bytes(report['fetch_queue_bytes'])}，"
+              f"写入队列 {format_bytes(report['sink_queue_bytes'])}，{report['concurrency']}个并发查询）")
+        labels = {'fetch': '请求队列', 'sink': '写入队列'}
+        for stage, stats in report['stages'].items():
+            print(f"  {labels.get(stage, stage)}：峰值 {format_bytes(stats['peak_bytes'])}，"
+                  f"上游等待 {stats['blocked_seconds']:.2f} 秒")
+        print(f"  峰值内存（RSS）：{format_bytes(report['peak_rss_bytes'])}")
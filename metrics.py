@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求级别的性能指标
+
+InstrumentedSession在requests.Session的每次请求上记录耗时、发送和接收的字节数、状态码、
+所属的查询步骤（landing、campus、community、building、room、frames、month、page）以及错误和重试次数；
+ElectricityQuery同时记录每一步解析页面的耗时。RequestMetrics把这些数据按步骤汇总成直方图，
+查询结束后可以导出为JSON或Prometheus文本格式，用来判断瓶颈在VPN网关还是本地解析。
+"""
+
+import json
+import math
+import threading
+import time
+
+import requests
+
+# 耗时直方图的桶上限（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+# 字节数直方图的桶上限
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, math.inf)
+
+UNKNOWN_STEP = 'other'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def quantile(self, q):
+        """
+        按桶估计分位数（返回所在桶的上限，最后一个桶返回观测到的最大值）
+        """
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return self.max if math.isinf(bound) else min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+            'buckets': {('+Inf' if math.isinf(bound) else repr(bound)): count
+                        for bound, count in zip(self.buckets, self.counts)}
+        }
+
+
+class StepStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        # 内容与上次抓取时相同、跳过解析的页面数
+        self.unchanged = 0
+        self.status_codes = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.parse = Histogram(LATENCY_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'unchanged': self.unchanged,
+            'status_codes': dict(self.status_codes),
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'latency_seconds': self.latency.to_dict(),
+            'parse_seconds': self.parse.to_dict(),
+            'response_bytes': self.response_size.to_dict()
+        }
+
+
+class RequestMetrics:
+    """
+    按查询步骤汇总请求指标，可以被多个线程（BatchQuery）共用
+    """
+
+    def __init__(self):
+        self.steps = {}
+        self.started_at = time.time()
+        # 连接池的命中统计（http_pool.PoolStats），由ElectricityQuery设置
+        self.pool_stats = None
+        self._lock = threading.Lock()
+
+    def _stats(self, step):
+        step = step or UNKNOWN_STEP
+        stats = self.steps.get(step)
+        if stats is None:
+            stats = self.steps[step] = StepStats()
+        return stats
+
+    def observe_request(self, step, latency, bytes_sent=0, bytes_received=0, status_code=None, error=None):
+        with self._lock:
+            stats = self._stats(step)
+            stats.requests += 1
+            stats.latency.observe(latency)
+            stats.bytes_sent += bytes_sent
+            stats.bytes_received += bytes_received
+            stats.response_size.observe(bytes_received)
+            if status_code is not None:
+                key = str(status_code)
+                stats.status_codes[key] = stats.status_codes.get(key, 0) + 1
+            if error is not None or (status_code is not None and status_code >= 400):
+                stats.errors += 1
+
+    def observe_parse(self, step, seconds):
+        with self._lock:
+            self._stats(step).parse.observe(seconds)
+
+    def observe_retry(self, step):
+        with self._lock:
+            self._stats(step).retries += 1
+
+    def observe_unchanged(self, step):
+        with self._lock:
+            self._stats(step).unchanged += 1
+
+    def to_dict(self):
+        with self._lock:
+            data = {
+                'started_at': self.started_at,
+                'duration_seconds': time.time() - self.started_at,
+                'steps': {step: stats.to_dict() for step, stats in self.steps.items()}
+            }
+        if self.pool_stats is not None:
+            data['connection_pool'] = self.pool_stats.to_dict()
+        return data
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self, prefix='electricity'):
+        """
+        导出为Prometheus文本格式
+        """
+        lines = []
+
+        def histogram(name, help_text, attribute):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            for step, stats in self.steps.items():
+                hist = getattr(stats, attribute)
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    le = '+Inf' if math.isinf(bound) else repr(bound)
+                    lines.append(f'{prefix}_{name}_bucket{{step="{step}",le="{le}"}} {cumulative}')
+                lines.append(f'{prefix}_{name}_sum{{step="{step}"}} {hist.sum}')
+                lines.append(f'{prefix}_{name}_count{{step="{step}"}} {hist.count}')
+
+        def counter(name, help_text, value_of):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for step, stats in self.steps.items():
+                lines.append(f'{prefix}_{name}{{step="{step}"}} {value_of(stats)}')
+
+        with self._lock:
+            histogram('request_duration_seconds', '请求耗时', 'latency')
+            histogram('parse_duration_seconds', '页面解析耗时', 'parse')
+            histogram('response_size_bytes', '响应大小', 'response_size')
+            lines.append(f"# HELP {prefix}_requests_total 请求次数")
+            lines.append(f"# TYPE {prefix}_requests_total counter")
+            for step, stats in self.steps.items():
+                for status, count in stats.status_codes.items():
+                    lines.append(f'{prefix}_requests_total{{step="{step}",status="{status}"}} {count}')
+            counter('request_errors_total', '失败的请求次数', lambda stats: stats.errors)
+            counter('request_retries_total', '重试次数', lambda stats: stats.retries)
+            counter('unchanged_pages_total', '内容未变化、跳过解析的页面数', lambda stats: stats.unchanged)
+            counter('bytes_sent_total', '发送的字节数', lambda stats: stats.bytes_sent)
+            counter('bytes_received_total', '接收的字节数', lambda stats: stats.bytes_received)
+        if self.pool_stats is not None:
+            lines.append(f"# HELP {prefix}_pool_connections_total 连接池取用连接的次数")
+            lines.append(f"# TYPE {prefix}_pool_connections_total counter")
+            lines.append(f'{prefix}_pool_connections_total{{result="hit"}} {self.pool_stats.hits}')
+            lines.append(f'{prefix}_pool_connections_total{{result="miss"}} {self.pool_stats.misses}')
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """
+        保存到文件：.prom/.txt为Prometheus文本格式，其余为JSON
+        """
+        content = self.to_prometheus() if path.endswith(('.prom', '.txt')) else self.to_json()
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            print(f"\n📁 性能指标已保存到：{path}")
+        except Exception as e:
+            print(f"\n⚠️ 保存性能指标失败：{str(e)}")
+
+    def print_summary(self):
+        print(f"\n{'步骤':<14}{'请求':>6}{'错误':>6}{'重试':>6}{'平均耗时(ms)':>14}{'P95(ms)':>10}"
+              f"{'解析(ms)':>10}{'接收(KB)':>10}")
+        with self._lock:
+            for step, stats in self.steps.items():
+                latency = stats.latency
+                average = latency.sum / latency.count * 1000 if latency.count else 0
+                parse = stats.parse.sum / stats.parse.count * 1000 if stats.parse.count else 0
+                print(f"{step:<14}{stats.requests:>6}{stats.errors:>6}{stats.retries:>6}{average:>14.1f}"
+                      f"{latency.quantile(0.95) * 1000:>10.1f}{parse:>10.2f}{stats.bytes_received / 1024:>10.1f}")
+        if self.pool_stats is not None:
+            self.pool_stats.print_summary()
+
+
+class InstrumentedSession(requests.Session):
+    """
+    记录每次请求指标的requests.Session；step为当前所处的查询步骤，由调用方设置
+    """
+
+    def __init__(self, metrics):
+        super().__init__()
+        self.metrics = metrics
+        self.step = None
+
+    def send(self, request, **kwargs):
+        body = request.body or b''
+        bytes_sent = len(body.encode('utf-8') if isinstance(body, str) else body)
+        step = self.step
+        start = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        except Exception as e:
+            self.metrics.observe_request(step, time.perf_counter() - start, bytes_sent, error=str(e))
+            raise
+
+        # stream=True时不读取响应体，按Content-Length统计
+        if kwargs.get('stream'):
+            bytes_received = int(response.headers.get('Content-Length', 0) or 0)
+        else:
+            bytes_received = len(response.content)
+        self.metrics.observe_request(step, time.perf_counter() - start, bytes_sent, bytes_received,
+                                     response.status_code)
+        return response
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+电费查询系统的页面模型
+
+每个响应只解析一次，解析时把后续步骤需要的内容全部提取出来：
+隐藏表单字段（__VIEWSTATE/__EVENTVALIDATION等）、下拉框选项、框架、链接、
+gvElecInfo表格的表头和记录以及分页状态。解析由page_parsers中的后端完成（bs4、stdlib或lxml），
+各后端的输出相同。响应按Content-Type或<meta charset>中声明的编码解码，都没有时按UTF-8，
+不依赖requests对编码的猜测。
+
+extract_hidden_fields和has_next_page_link只用正则表达式提取下一次回发需要的内容，
+不构建文档树，用于在完整解析之前尽快发出下一个请求。
+page_fingerprint是响应内容的摘要，内容与上次抓取时相同的页面可以不再解析。
+"""
+
+import codecs
+import hashlib
+import html
+import re
+from collections import namedtuple
+
+from page_parsers import parse_page
+
+DEFAULT_ENCODING = 'utf-8'
+
+# 声明为GB2312/GBK的页面中常有超出字符集的字符，按其超集GB18030解码
+ENCODING_SUPERSETS = {'gb2312': 'gb18030', 'gbk': 'gb18030'}
+
+CONTENT_TYPE_CHARSET = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+META_SCAN_BYTES = 2048
+
+# 已经解码的响应，与requests.Response一样提供status_code、text和url，用于构建Page
+PageResponse = namedtuple('PageResponse', ['status_code', 'text', 'url'])
+
+INPUT_TAG = re.compile(r'<input\b[^>]*>', re.IGNORECASE)
+TAG_ATTRIBUTE = re.compile(r'([\w:-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))')
+NEXT_PAGE_LINK = re.compile(r'<a\b[^>]*>(?:(?!</a>).)*?下一页', re.IGNORECASE | re.DOTALL)
+
+
+def extract_hidden_fields(text):
+    """
+    提取页面中所有隐藏表单字段 {name: value}，结果与Page.hidden_fields一致
+    """
+    fields = {}
+    for tag in INPUT_TAG.finditer(text):
+        attributes = {}
+        for match in TAG_ATTRIBUTE.finditer(tag.group(0)):
+            name = match.group(1).lower()
+            if name not in attributes:
+                value = match.group(2) if match.group(2) is not None else match.group(3)
+                attributes[name] = html.unescape(value if value is not None else match.group(4))
+        if attributes.get('type', '').lower() == 'hidden' and attributes.get('name'):
+            fields[attributes['name']] = attributes.get('value', '')
+    return fields
+
+
+def has_next_page_link(text):
+    """
+    页面中是否有'下一页'链接，与Page.has_next_page一致
+    """
+    return NEXT_PAGE_LINK.search(text) is not None
+
+
+def page_fingerprint(text):
+    """
+    页面内容的摘要（32位十六进制），内容完全相同的页面摘要相同
+    """
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def form_state_of(hidden_fields):
+    """
+    ASP.NET回发所需的__VIEWSTATE和__EVENTVALIDATION，任一缺失时为None
+    """
+    if '__VIEWSTATE' not in hidden_fields or '__EVENTVALIDATION' not in hidden_fields:
+        return None
+    return {
+        '__VIEWSTATE': hidden_fields['__VIEWSTATE'],
+        '__EVENTVALIDATION': hidden_fields['__EVENTVALIDATION']
+    }
+
+
+def body_encoding(body, content_type=None):
+    """
+    响应体的编码：Content-Type中的charset，其次是页面开头<meta>声明的charset，都没有时为UTF-8
+    """
+    match = CONTENT_TYPE_CHARSET.search(content_type or '')
+    charset = match.group(1) if match else None
+    if not charset:
+        match = META_CHARSET.search(body[:META_SCAN_BYTES])
+        charset = match.group(1).decode('ascii') if match else None
+    try:
+        name = codecs.lookup(charset or DEFAULT_ENCODING).name
+    except LookupError:
+        name = DEFAULT_ENCODING
+    return ENCODING_SUPERSETS.get(name, name)
+
+
+def decode_body(body, content_type=None):
+    return body.decode(body_encoding(body, content_type), errors='replace')
+
+
+def response_text(response):
+    """
+    响应的文本：有原始字节（requests.Response等）时按body_encoding解码，否则直接使用text
+    """
+    body = getattr(response, 'content', None)
+    if isinstance(body, bytes):
+        headers = getattr(response, 'headers', None) or {}
+        return decode_body(body, headers.get('Content-Type'))
+    return response.text
+
+
+class Page:
+    def __init__(self, text, status_code=200, url=None, parser=None):
+        """
+        parser为page_parsers中的后端名称，None时使用默认后端
+        """
+        self.status_code = status_code
+        self.url = url
+        # 是否是初次使用的系统设置页面
+        self.needs_setup = "系统设置" in text or "初次登录" in text
+
+        fields = parse_page(text, parser)
+        # 隐藏表单字段
+        self.hidden_fields = fields.hidden_fields
+        # 下拉框：名称 -> {选项文本: 选项值}
+        self.options = fields.options
+        # 框架页面：框架名称 -> src
+        self.is_frameset = fields.is_frameset
+        self.frames = fields.frames
+        # 链接，以及第一个表格（导航栏）中的链接
+        self.links = fields.links
+        self.nav_links = fields.nav_links
+        # gvElecInfo表格和分页状态；非用电信息页面保留所有表格行（table_rows），用于显示查询结果
+        self.grid_headers = fields.grid_headers
+        self.grid_rows = fields.grid_rows
+        self.has_next_page = fields.has_next_page
+        self.table_rows = fields.table_rows
+
+    @classmethod
+    def from_response(cls, response):
+        """
+        从requests.Response（或任何带text/status_code属性的响应）构建页面对象
+        已经是Page时直接返回
+        """
+        if isinstance(response, cls):
+            return response
+        return cls(response_text(response), getattr(response, 'status_code', 200), getattr(response, 'url', None))
+
+    @classmethod
+    def from_state(cls, hidden_fields, options):
+        """
+        用缓存的表单字段和下拉框选项还原一个页面对象，无需请求和解析
+        """
+        page = cls.__new__(cls)
+        page.status_code = 200
+        page.url = None
+        page.needs_setup = False
+        page.hidden_fields = dict(hidden_fields)
+        page.options = {name: dict(values) for name, values in options.items()}
+        page.is_frameset = False
+        page.frames = {}
+        page.links = []
+        page.nav_links = []
+        page.grid_headers = []
+        page.grid_rows = []
+        page.has_next_page = False
+        page.table_rows = []
+        return page
+
+    @property
+    def form_state(self):
+        """
+        ASP.NET回发所需的__VIEWSTATE和__EVENTVALIDATION，任一缺失时为None
+        """
+        return form_state_of(self.hidden_fields)
+
+    def electricity_info_link(self):
+        """
+        在stuTop.htm的导航栏中查找'用电信息'链接
+        """
+        if 'HouseElec.aspx' in self.links:
+            return 'HouseElec.aspx'
+        if len(self.nav_links) >= 2:
+            return self.nav_links[1]
+        return None
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+页面解析后端
+
+每个后端把HTML文本解析成同样的PageFields：隐藏表单字段、下拉框选项、框架、链接、
+gvElecInfo表格的表头和记录以及分页状态，Page直接使用这些字段。
+- bs4：BeautifulSoup + html.parser，最早的实现，作为其他后端的对照
+- stdlib：基于html.parser.HTMLParser的流式解析，只为用到的标签（input、select/option、frame、
+  a、table/tr/td/th）建立节点，不构建完整的文档树；标签嵌套和文本的处理方式与bs4一致
+- lxml：基于libxml2，安装了lxml时可用，速度最快；遇到未闭合的td/option等标签时按HTML规范补全结束标签，
+  这类不规范页面上的结果与bs4不同（ASP.NET生成的页面没有这种情况）
+默认使用可用的最快后端，可以用环境变量ELECTRICITY_PARSER或set_default_parser指定。
+benchmarks/bench_parsers.py检查各后端的输出是否与bs4一致并比较速度。
+"""
+
+import os
+import threading
+from collections import namedtuple
+from html.parser import HTMLParser
+
+PageFields = namedtuple('PageFields', [
+    'hidden_fields', 'options', 'is_frameset', 'frames', 'links', 'nav_links',
+    'grid_headers', 'grid_rows', 'has_next_page', 'table_rows'
+])
+
+GRID_ID = 'gvElecInfo'
+NEXT_PAGE_TEXT = '下一页'
+
+# 与bs4的html.parser一致：这些标签没有结束标签，不会包含其他内容
+VOID_ELEMENTS = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem', 'meta',
+    'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex',
+    'nextid', 'spacer'
+])
+
+# 这些标签中的文本不计入.text
+RAW_TEXT_ELEMENTS = ('script', 'style')
+
+
+def grid_fields(rows, row_text, row_has_link, row_cells, row_headers, cell_text):
+    """
+    从gvElecInfo表格的行中取出表头和有效记录（跳过分页行和日用电量为空的行）
+    """
+    grid_headers = [cell_text(th).strip() for th in row_headers(rows[0])] if rows else []
+    grid_rows = []
+    for row in rows[1:]:
+        if row_has_link(row) and NEXT_PAGE_TEXT in row_text(row):
+            continue
+
+        cells = row_cells(row)
+        if cells and len(cells) >= 5:
+            record = [cell_text(cell).strip() for cell in cells]
+            if record[3] not in ['', ' ']:
+                grid_rows.append(record)
+    return grid_headers, grid_rows
+
+
+def parse_bs4(text):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(text, 'html.parser')
+
+    hidden_fields = {}
+    for field in soup.find_all('input'):
+        if field.get('type', '').lower() == 'hidden' and field.get('name'):
+            hidden_fields[field['name']] = field.get('value', '')
+
+    options = {}
+    for select in soup.find_all('select'):
+        if select.get('name'):
+            options[select['name']] = {option.text.strip(): option.get('value', '')
+                                       for option in select.find_all('option')}
+
+    is_frameset = soup.find('frameset') is not None
+    frames = {frame.get('name'): frame.get('src') for frame in soup.find_all('frame')}
+
+    links = [link['href'] for link in soup.find_all('a', href=True)]
+    nav_table = soup.find('table')
+    nav_links = [link['href'] for link in nav_table.find_all('a', href=True)] if nav_table else []
+
+    has_next_page = any(NEXT_PAGE_TEXT in link.text for link in soup.find_all('a'))
+    grid_headers, grid_rows, table_rows = [], [], []
+
+    table = soup.find('table', {'id': GRID_ID})
+    if table:
+        grid_headers, grid_rows = grid_fields(
+            table.find_all('tr'), lambda row: row.text, lambda row: row.find('a') is not None,
+            lambda row: row.find_all('td'), lambda row: row.find_all('th'), lambda cell: cell.text)
+    else:
+        # 非用电信息页面保留所有表格行，用于显示查询结果
+        for row in soup.find_all('tr'):
+            cells = row.find_all('td')
+            if cells:
+                table_rows.append([cell.text.strip() for cell in cells])
+
+    soup.decompose()
+    return PageFields(hidden_fields, options, is_frameset, frames, links, nav_links,
+                      grid_headers, grid_rows, has_next_page, table_rows)
+
+
+class _Element:
+    __slots__ = ('tag', 'attrs', 'parts', 'rows', 'cells', 'headers', 'anchors', 'options')
+
+    def __init__(self, tag, attrs):
+        self.tag = tag
+        self.attrs = attrs
+        self.parts = []
+        # table：后代tr；tr：后代td/th；table和tr：后代a；select：后代option
+        self.rows = []
+        self.cells = []
+        self.headers = []
+        self.anchors = []
+        self.options = []
+
+    @property
+    def text(self):
+        return ''.join(self.parts)
+
+
+class _FieldParser(HTMLParser):
+    """
+    只记录用到的标签的流式解析器
+    没有结束标签的元素一直包含到文档结束或同名结束标签出现为止，与bs4的html.parser一致
+    """
+
+    # 需要收集文本的标签
+    TEXT_TAGS = ('a', 'tr', 'td', 'th', 'option')
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        # 所有打开的元素 [(标签名, _Element或None)]
+        self.stack = []
+        self.collectors = []
+        self.raw_depth = 0
+        self.hidden_fields = {}
+        self.is_frameset = False
+        self.frames = {}
+        self.selects = []
+        self.anchors = []
+        self.tables = []
+        self.rows = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: '' if value is None else value for name, value in attrs}
+
+        if tag in VOID_ELEMENTS:
+            if tag == 'input' and (attrs.get('type') or '').lower() == 'hidden' and attrs.get('name'):
+                self.hidden_fields[attrs['name']] = attrs.get('value', '')
+            elif tag == 'frame':
+                self.frames[attrs.get('name')] = attrs.get('src')
+            return
+
+        element = None
+        if tag == 'frameset':
+            self.is_frameset = True
+        elif tag in ('table', 'tr', 'td', 'th', 'a', 'select', 'option'):
+            element = _Element(tag, attrs)
+            for _, parent in self.stack:
+                if parent is None:
+                    continue
+                if tag == 'tr' and parent.tag == 'table':
+                    parent.rows.append(element)
+                elif tag == 'td' and parent.tag == 'tr':
+                    parent.cells.append(element)
+                elif tag == 'th' and parent.tag == 'tr':
+                    parent.headers.append(element)
+                elif tag == 'a' and parent.tag in ('table', 'tr'):
+                    parent.anchors.append(element)
+                elif tag == 'option' and parent.tag == 'select':
+                    parent.options.append(element)
+
+            if tag == 'table':
+                self.tables.append(element)
+            elif tag == 'tr':
+                self.rows.append(element)
+            elif tag == 'a':
+                self.anchors.append(element)
+            elif tag == 'select':
+                self.selects.append(element)
+            if tag in self.TEXT_TAGS:
+                self.collectors.append(element)
+        elif tag in RAW_TEXT_ELEMENTS:
+            self.raw_depth += 1
+
+        self.stack.append((tag, element))
+
+    def handle_endtag(self, tag):
+        for index in range(len(self.stack) - 1, -1, -1):
+            if self.stack[index][0] == tag:
+                break
+        else:
+            return
+
+        closed = self.stack[index:]
+        del self.stack[index:]
+        if any(element is not None for _, element in closed):
+            self.collectors = [element for _, element in self.stack
+                               if element is not None and element.tag in self.TEXT_TAGS]
+        self.raw_depth -= sum(1 for name, _ in closed if name in RAW_TEXT_ELEMENTS)
+
+    def handle_data(self, data):
+        if self.raw_depth:
+            return
+        for element in self.collectors:
+            element.parts.append(data)
+
+    def fields(self):
+        options = {}
+        for select in self.selects:
+            if select.attrs.get('name'):
+                options[select.attrs['name']] = {option.text.strip(): option.attrs.get('value', '')
+                                                 for option in select.options}
+
+        links = [anchor.attrs['href'] for anchor in self.anchors if 'href' in anchor.attrs]
+        nav_table = self.tables[0] if self.tables else None
+        nav_links = [anchor.attrs['href'] for anchor in nav_table.anchors
+                     if 'href' in anchor.attrs] if nav_table else []
+        has_next_page = any(NEXT_PAGE_TEXT in anchor.text for anchor in self.anchors)
+
+        grid_headers, grid_rows, table_rows = [], [], []
+        table = next((table for table in self.tables if table.attrs.get('id') == GRID_ID), None)
+        if table:
+            grid_headers, grid_rows = grid_fields(
+                table.rows, lambda row: row.text, lambda row: bool(row.anchors),
+                lambda row: row.cells, lambda row: row.headers, lambda cell: cell.text)
+        else:
+            for row in self.rows:
+                if row.cells:
+                    table_rows.append([cell.text.strip() for cell in row.cells])
+
+        return PageFields(self.hidden_fields, options, self.is_frameset, self.frames, links, nav_links,
+                          grid_headers, grid_rows, has_next_page, table_rows)
+
+
+def parse_stdlib(text):
+    parser = _FieldParser()
+    parser.feed(text)
+    parser.close()
+    return parser.fields()
+
+
+_lxml_local = threading.local()
+
+
+def _lxml_text(element):
+    """
+    元素的文本，与bs4的.text一样不包括script/style和注释的内容
+    """
+    parts = [element.text or '']
+    for child in element:
+        if isinstance(child.tag, str) and child.tag not in RAW_TEXT_ELEMENTS:
+            parts.append(_lxml_text(child))
+        parts.append(child.tail or '')
+    return ''.join(parts)
+
+
+def parse_lxml(text):
+    from lxml import etree, html as lxml_html
+
+    # lxml的解析器对象不能在线程间共用
+    parser = getattr(_lxml_local, 'parser', None)
+    if parser is None:
+        parser = _lxml_local.parser = lxml_html.HTMLParser(encoding='utf-8')
+    try:
+        root = lxml_html.document_fromstring(text.encode('utf-8'), parser=parser)
+    except (etree.ParserError, ValueError):
+        return PageFields({}, {}, False, {}, [], [], [], [], False, [])
+
+    hidden_fields = {}
+    for field in root.iter('input'):
+        if (field.get('type') or '').lower() == 'hidden' and field.get('name'):
+            hidden_fields[field.get('name')] = field.get('value', '')
+
+    options = {}
+    for select in root.iter('select'):
+        if select.get('name'):
+            options[select.get('name')] = {_lxml_text(option).strip(): option.get('value', '')
+                                           for option in select.iter('option')}
+
+    is_frameset = next(root.iter('frameset'), None) is not None
+    frames = {frame.get('name'): frame.get('src') for frame in root.iter('frame')}
+
+    anchors = list(root.iter('a'))
+    links = [anchor.get('href') for anchor in anchors if anchor.get('href') is not None]
+    nav_table = next(root.iter('table'), None)
+    nav_links = [anchor.get('href') for anchor in nav_table.iter('a')
+                 if anchor.get('href') is not None] if nav_table is not None else []
+    has_next_page = any(NEXT_PAGE_TEXT in _lxml_text(anchor) for anchor in anchors)
+
+    grid_headers, grid_rows, table_rows = [], [], []
+    table = next((table for table in root.iter('table') if table.get('id') == GRID_ID), None)
+    if table is not None:
+        grid_headers, grid_rows = grid_fields(
+            list(table.iter('tr')), _lxml_text, lambda row: next(row.iter('a'), None) is not None,
+            lambda row: list(row.iter('td')), lambda row: list(row.iter('th')), _lxml_text)
+    else:
+        for row in root.iter('tr'):
+            cells = list(row.iter('td'))
+            if cells:
+                table_rows.append([_lxml_text(cell).strip() for cell in cells])
+
+    return PageFields(hidden_fields, options, is_frameset, frames, links, nav_links,
+                      grid_headers, grid_rows, has_next_page, table_rows)
+
+
+PARSERS = {
+    'bs4': parse_bs4,
+    'stdlib': parse_stdlib,
+    'lxml': parse_lxml,
+}
+
+# 未指定时按顺序选择第一个可用的后端
+PREFERRED_PARSERS = ('lxml', 'stdlib')
+
+_default_parser = None
+
+
+def parser_available(name):
+    if name == 'lxml':
+        try:
+            import lxml.html  # noqa: F401
+        except ImportError:
+            return False
+        return True
+    if name == 'bs4':
+        try:
+            import bs4  # noqa: F401
+        except ImportError:
+            return False
+        return True
+    return name in PARSERS
+
+
+def available_parsers():
+    return [name for name in PARSERS if parser_available(name)]
+
+
+def set_default_parser(name):
+    """
+    指定之后所有页面使用的解析后端，None为自动选择
+    """
+    global _default_parser
+    if name is not None and name not in PARSERS:
+        raise ValueError(f"未知的解析后端：{name}（可选：{', '.join(PARSERS)}）")
+    if name is not None and not parser_available(name):
+        raise ValueError(f"解析后端 {name} 不可用，请先安装对应的库")
+    _default_parser = name
+
+
+def default_parser():
+    if _default_parser is None:
+        name = os.environ.get('ELECTRICITY_PARSER')
+        if name:
+            set_default_parser(name)
+        else:
+            set_default_parser(next(name for name in PREFERRED_PARSERS if parser_available(name)))
+    return _default_parser
+
+
+def parse_page(text, parser=None):
+    """
+    用指定（或默认）的后端解析页面，返回PageFields
+    """
+    return PARSERS[parser or default_parser()](text)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台预取
+
+prefetch在后台线程中提前迭代一个生成器，把产出的项目放进有界队列，
+调用方处理当前项目的同时，后台线程已经在取下一个。用于把逐页请求（网络等待）
+和页面解析（CPU）重叠起来：后台线程只负责请求和提取下一次回发需要的表单字段，
+完整解析在调用方的线程中进行。
+
+BoundedQueue按字节数限制队列（内存预算模式），SinkThread把解析结果交给后台线程写出：
+下游写得比上游慢时队列满，上游的put等待（反压），一直传到请求阶段，已下载但未处理的数据不会无限增长。
+"""
+
+import queue
+import sys
+import threading
+import time
+from collections import deque
+
+# 队列中最多缓存的项目数，后台线程领先调用方超过这个数量时等待
+DEFAULT_PREFETCH_DEPTH = 2
+
+_DONE = object()
+
+
+class BoundedQueue:
+    """
+    按项目的字节数（sizeof）和项目数限制的阻塞队列，接口与queue.Queue的put/get相同
+    放入会超出限制时等待，直到消费者取走足够的项目；队列为空时超过限制的单个项目也可以放入，不会死锁
+    """
+
+    def __init__(self, max_bytes, max_items=None, sizeof=sys.getsizeof):
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.sizeof = sizeof
+        self._items = deque()
+        self._bytes = 0
+        self._condition = threading.Condition()
+        # 队列中同时存在的最大字节数，以及put因队列满而等待的总时间（秒）
+        self.peak_bytes = 0
+        self.blocked_seconds = 0.0
+
+    def _full(self, size):
+        if not self._items:
+            return False
+        if self.max_items is not None and len(self._items) >= self.max_items:
+            return True
+        return self._bytes + size > self.max_bytes
+
+    def put(self, item, timeout=None):
+        size = self.sizeof(item)
+        with self._condition:
+            if self._full(size):
+                started = time.perf_counter()
+                ready = self._condition.wait_for(lambda: not self._full(size), timeout)
+                self.blocked_seconds += time.perf_counter() - started
+                if not ready:
+                    raise queue.Full
+            self._items.append((item, size))
+            self._bytes += size
+            self.peak_bytes = max(self.peak_bytes, self._bytes)
+            self._condition.notify_all()
+
+    def get(self, timeout=None):
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._items, timeout):
+                raise queue.Empty
+            item, size = self._items.popleft()
+            self._bytes -= size
+            self._condition.notify_all()
+            return item
+
+
+def _entry_size(sizeof):
+    """
+    队列项 (项目, 异常) 的字节数，结束标记不计
+    """
+    return lambda entry: 0 if entry[0] is _DONE else sizeof(entry[0])
+
+
+def prefetch(iterable, depth=DEFAULT_PREFETCH_DEPTH, max_bytes=None, sizeof=sys.getsizeof, on_close=None):
+    """
+    在后台线程中迭代iterable，按原顺序产出同样的项目
+    后台线程中的异常会在调用方取到该位置时重新抛出；调用方提前结束迭代时后台线程在当前项目完成后停止
+    指定max_bytes时队列中的项目（按sizeof计算）总共不超过max_bytes字节；
+    on_close在结束时以队列为参数调用，用于汇总队列的统计
+    """
+    if max_bytes is None:
+        items = queue.Queue(maxsize=max(depth, 1))
+    else:
+        items = BoundedQueue(max_bytes, max(depth, 1), _entry_size(sizeof))
+    stop = threading.Event()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run():
+        error = None
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    break
+        except BaseException as e:
+            error = e
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+        put((_DONE, error))
+
+    thread = threading.Thread(target=run, name='prefetch', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+        if on_close is not None:
+            on_close(items)
+
+
+class SinkThread:
+    """
+    在后台线程中依次调用sink(item)；put在队列满时等待（反压）
+    sink抛出的异常在之后的put或close时重新抛出
+    """
+
+    def __init__(self, sink, max_bytes, sizeof=sys.getsizeof, max_items=None, name='sink'):
+        self.sink = sink
+        self.queue = BoundedQueue(max_bytes, max_items, _entry_size(sizeof))
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item, _ = self.queue.get()
+            if item is _DONE:
+                return
+            if self.error is None:
+                try:
+                    self.sink(item)
+                except BaseException as e:
+                    self.error = e
+
+    def put(self, item):
+        if self.error is not None:
+            raise self.error
+        self.queue.put((item, None))
+
+    def close(self):
+        """
+        等待队列中的项目全部写出
+        """
+        if self._thread.is_alive():
+            self.queue.put((_DONE, None))
+            self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
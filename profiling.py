@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分阶段性能分析
+
+查询流程中的每个阶段（访问首页、选择校区/社区/楼栋、进入房间、解析框架页面、逐月和逐页查询）
+都用phase(name)标记。启用Profiler之后，每个阶段记录调用次数、耗时（墙钟时间）、
+CPU时间（当前线程）和tracemalloc统计的内存峰值（相对进入阶段时的增长）；未启用时phase什么也不做。
+
+设置sample_interval后，后台线程定时对正在执行某个阶段的线程采样调用栈，
+write_collapsed按flamegraph.pl / speedscope可以直接读取的折叠格式（"帧;帧;帧 次数"）写出，
+每个栈以所在的阶段开头，例如 "[page];_iter_month_pages (electricity_cli.py:1023);from_response (...) 12"。
+
+tracemalloc的峰值是整个进程共用的，reset_peak()会影响所有正在统计的阶段，所以内存峰值只统计
+没有其他线程同时处于某个阶段时的最外层阶段；嵌套的阶段和与其他线程重叠的阶段不统计内存峰值。
+要看内存时用一个工作线程运行。多进程分片遍历时各进程的统计通过snapshot/merge汇总到父进程。
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+# 默认的调用栈采样间隔（秒）
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+# 采样时每个栈最多保留的帧数（从最内层算起）
+MAX_STACK_DEPTH = 64
+
+_active = None
+
+
+class PhaseStats:
+    def __init__(self):
+        self.count = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.wall_max = 0.0
+        # 没有一次调用统计过内存峰值时为None
+        self.memory_peak = None
+
+    def _add_peak(self, memory_peak):
+        if memory_peak is not None:
+            self.memory_peak = memory_peak if self.memory_peak is None else max(self.memory_peak, memory_peak)
+
+    def add(self, wall, cpu, memory_peak=None):
+        self.count += 1
+        self.wall += wall
+        self.cpu += cpu
+        self.wall_max = max(self.wall_max, wall)
+        self._add_peak(memory_peak)
+
+    def merge(self, data):
+        self.count += data['count']
+        self.wall += data['wall_seconds']
+        self.cpu += data['cpu_seconds']
+        self.wall_max = max(self.wall_max, data['wall_max_seconds'])
+        self._add_peak(data['memory_peak_bytes'])
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'wall_seconds': self.wall,
+            'cpu_seconds': self.cpu,
+            'wall_max_seconds': self.wall_max,
+            'memory_peak_bytes': self.memory_peak
+        }
+
+
+class Profiler:
+    """
+    按阶段汇总耗时、CPU时间和内存峰值，可以被多个线程共用
+    """
+
+    def __init__(self, trace_memory=True, sample_interval=None):
+        self.trace_memory = trace_memory
+        self.sample_interval = sample_interval
+        # 阶段名 -> PhaseStats
+        self.phases = {}
+        # 折叠的调用栈 -> 采样次数
+        self.stacks = Counter()
+        self.samples = 0
+        self._lock = threading.Lock()
+        # 线程号 -> 正在执行的阶段栈 [[阶段名, 开始时间, 开始CPU时间, 开始内存, 是否统计内存峰值], ...]
+        self._running = {}
+        self._started_tracemalloc = False
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        if self.sample_interval and self._sampler is None:
+            self._stop.clear()
+            self._sampler = threading.Thread(target=self._sample_loop, name='profiler-sampler', daemon=True)
+            self._sampler.start()
+        return self
+
+    def stop(self):
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+            self._sampler = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    @contextmanager
+    def phase(self, name):
+        ident = threading.get_ident()
+        with self._lock:
+            stack = self._running.setdefault(ident, [])
+            # 只有单个线程中的最外层阶段统计内存峰值：其他线程的阶段开始后，
+            # 双方的峰值都会包含对方的分配，重置峰值也会互相影响
+            measure = not stack and len(self._running) == 1 and self._can_trace()
+            if not stack:
+                for other in self._running.values():
+                    if other:
+                        other[0][4] = False
+            if measure:
+                tracemalloc.reset_peak()
+            frame = [name, time.perf_counter(), time.thread_time(),
+                     tracemalloc.get_traced_memory()[0] if measure else 0, measure]
+            stack.append(frame)
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - frame[1]
+            cpu = time.thread_time() - frame[2]
+            with self._lock:
+                memory_peak = None
+                if frame[4] and tracemalloc.is_tracing():
+                    memory_peak = max(tracemalloc.get_traced_memory()[1] - frame[3], 0)
+                stack.pop()
+                if not stack:
+                    self._running.pop(ident, None)
+                stats = self.phases.get(name)
+                if stats is None:
+                    stats = self.phases[name] = PhaseStats()
+                stats.add(wall, cpu, memory_peak)
+
+    @staticmethod
+    def _can_trace():
+        return tracemalloc.is_tracing() and hasattr(tracemalloc, 'reset_peak')  # reset_peak: Python 3.9+
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.sample_interval):
+            frames = sys._current_frames()
+            for ident, stack in list(self._running.items()):
+                if ident == own or not stack or ident not in frames:
+                    continue
+                phases = [f"[{entry[0]}]" for entry in list(stack)]
+                self._record(phases, frames[ident])
+
+    def _record(self, phases, frame):
+        names = []
+        while frame is not None and len(names) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        key = ';'.join(phases + names[::-1])
+        with self._lock:
+            self.stacks[key] += 1
+            self.samples += 1
+
+    def snapshot(self, reset=False):
+        """
+        当前的统计（可以pickle），reset为True时清空已有的统计
+        """
+        with self._lock:
+            data = {
+                'phases': {name: stats.to_dict() for name, stats in self.phases.items()},
+                'stacks': dict(self.stacks),
+                'samples': self.samples
+            }
+            if reset:
+                self.phases = {}
+                self.stacks = Counter()
+                self.samples = 0
+        return data
+
+    def merge(self, data):
+        """
+        合并另一个Profiler（例如工作进程）的snapshot
+        """
+        with self._lock:
+            for name, phase_data in data['phases'].items():
+                stats = self.phases.get(name)
+                if stats is None:
+                    stats = self.phases[name] = PhaseStats()
+                stats.merge(phase_data)
+            self.stacks.update(data['stacks'])
+            self.samples += data['samples']
+
+    def to_dict(self):
+        data = self.snapshot()
+        del data['stacks']
+        data['trace_memory'] = self.trace_memory
+        data['sample_interval'] = self.sample_interval
+        return data
+
+    def dump(self, path):
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+            print(f"\n📁 分阶段性能统计已保存到：{path}")
+        except Exception as e:
+            print(f"\n⚠️ 保存分阶段性能统计失败：{str(e)}")
+
+    def write_collapsed(self, path):
+        """
+        按折叠格式写出采样到的调用栈，可以用flamegraph.pl或speedscope生成火焰图
+        """
+        with self._lock:
+            stacks = sorted(self.stacks.items())
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, count in stacks:
+                    f.write(f"{stack} {count}\n")
+            print(f"\n📁 火焰图数据（{len(stacks)}个调用栈）已保存到：{path}")
+        except Exception as e:
+            print(f"\n⚠️ 保存火焰图数据失败：{str(e)}")
+
+    def print_summary(self):
+        with self._lock:
+            phases = sorted(self.phases.items(), key=lambda item: -item[1].wall)
+        print(f"\n{'阶段':<22}{'次数':>6}{'总耗时(s)':>11}{'平均(ms)':>10}{'最长(ms)':>10}{'CPU(s)':>9}"
+              f"{'内存峰值(KB)':>14}")
+        for name, stats in phases:
+            average = stats.wall / stats.count * 1000 if stats.count else 0
+            memory_peak = '-' if stats.memory_peak is None else f"{stats.memory_peak / 1024:.1f}"
+            print(f"{name:<22}{stats.count:>6}{stats.wall:>11.3f}{average:>10.1f}{stats.wall_max * 1000:>10.1f}"
+                  f"{stats.cpu:>9.3f}{memory_peak:>14}")
+
+
+def enable(trace_memory=True, sample_interval=None):
+    """
+    创建并启用进程内的Profiler，之后所有phase都会被记录
+    """
+    global _active
+    disable()
+    _active = Profiler(trace_memory, sample_interval).start()
+    return _active
+
+
+def disable():
+    """
+    停止并移除当前的Profiler，返回它（没有时为None）
+    """
+    global _active
+    profiler, _active = _active, None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+
+def active():
+    return _active
+
+
+def phase(name):
+    """
+    标记一个阶段的上下文管理器；没有启用Profiler时不做任何事
+    """
+    profiler = _active
+    if profiler is None:
+        return nullcontext()
+    return profiler.phase(name)
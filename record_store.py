@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地用电记录存储
+
+使用SQLite保存已查询过的用电记录，按房间和日期建立索引。
+已经结束、并且在结束之后抓取过的月份直接从本地读取，
+只有当前月份和从未查询过的月份才需要访问服务器。
+每个月份各页内容的摘要（page_fingerprints）也保存在这里，再次抓取时内容未变化的页面可以跳过。
+"""
+
+import json
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+DEFAULT_DB_PATH = "electricity_records.db"
+
+# 等待其他连接释放写锁的最长时间（秒）：分片遍历时多个进程的多个线程写同一个数据库文件
+BUSY_TIMEOUT = 60
+
+# 记录中的日期单元格，兼容 2026-01-05 / 2026/1/5 / 2026年1月5日 等写法
+DATE_PATTERN = re.compile(r'(\d{4})\s*[-/年.]\s*(\d{1,2})\s*[-/月.]\s*(\d{1,2})')
+
+
+def room_key(campus, community, building, room):
+    """
+    生成房间的存储键，例如：校本部/A区/1/404
+    """
+    return '/'.join(str(part).strip() for part in (campus, community, building, room))
+
+
+def record_date(record):
+    """
+    从一条用电记录中找出日期，返回YYYY-MM-DD格式的字符串，找不到时返回None
+    """
+    for cell in record:
+        match = DATE_PATTERN.search(cell)
+        if match:
+            year, month, day = (int(part) for part in match.groups())
+            return f"{year:04d}-{month:02d}-{day:02d}"
+    return None
+
+
+def month_range(start_date, end_date):
+    """
+    按顺序生成start_date到end_date（格式：YYYY-MM）之间的所有(年, 月)
+    """
+    current_year, current_month = map(int, start_date.split('-'))
+    end_year, end_month = map(int, end_date.split('-'))
+
+    while (current_year < end_year) or (current_year == end_year and current_month <= end_month):
+        yield current_year, current_month
+        current_month += 1
+        if current_month > 12:
+            current_month = 1
+            current_year += 1
+
+
+class RecordStore:
+    def __init__(self, db_path=DEFAULT_DB_PATH, timeout=BUSY_TIMEOUT):
+        self.db_path = db_path
+        # 批量查询时多个线程共用同一个存储，所有访问都通过锁串行化
+        self.conn = sqlite3.connect(db_path, timeout=timeout, check_same_thread=False)
+        self.lock = threading.Lock()
+        # WAL模式下读取不会被写入阻塞，多个进程同时写入时按busy_timeout等待而不是立即报"database is locked"
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS months (
+                room TEXT NOT NULL,
+                month TEXT NOT NULL,
+                fetched_at TEXT NOT NULL,
+                headers TEXT NOT NULL,
+                PRIMARY KEY (room, month)
+            );
+            CREATE TABLE IF NOT EXISTS records (
+                room TEXT NOT NULL,
+                record_date TEXT NOT NULL,
+                month TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                cells TEXT NOT NULL,
+                PRIMARY KEY (room, record_date)
+            );
+            CREATE INDEX IF NOT EXISTS idx_records_month ON records (room, month, seq);
+            CREATE TABLE IF NOT EXISTS page_fingerprints (
+                room TEXT NOT NULL,
+                month TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                digest TEXT NOT NULL,
+                PRIMARY KEY (room, month, page)
+            );
+        """)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def is_month_closed(self, room, year, month, now=None):
+        """
+        判断某个月份是否可以直接使用本地数据：
+        该月份必须已经结束，并且最后一次抓取发生在该月份结束之后
+        """
+        now = now or datetime.now()
+        if (year, month) >= (now.year, now.month):
+            return False
+
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT fetched_at FROM months WHERE room = ? AND month = ?",
+                (room, f"{year}-{month:02d}")
+            ).fetchone()
+        if not row:
+            return False
+
+        fetched_at = datetime.fromisoformat(row[0])
+        return (fetched_at.year, fetched_at.month) > (year, month)
+
+    def missing_months(self, room, start_date, end_date, now=None):
+        """
+        返回日期范围内仍需访问服务器的月份列表
+        """
+        return [(year, month) for year, month in month_range(start_date, end_date)
+                if not self.is_month_closed(room, year, month, now)]
+
+    def latest_record_date(self, room):
+        """
+        房间最新一条有日期的本地记录的日期（YYYY-MM-DD），没有记录时返回None
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT MAX(record_date) FROM records WHERE room = ? AND record_date NOT LIKE '%#%'",
+                (room,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def load_month(self, room, year, month):
+        """
+        读取某个月份的本地记录，返回(表头, 记录列表)
+        """
+        month_key = f"{year}-{month:02d}"
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT headers FROM months WHERE room = ? AND month = ?",
+                (room, month_key)
+            ).fetchone()
+            rows = self.conn.execute(
+                "SELECT cells FROM records WHERE room = ? AND month = ? ORDER BY seq",
+                (room, month_key)
+            ).fetchall()
+        headers = json.loads(row[0]) if row else []
+        records = [json.loads(cells) for (cells,) in rows]
+        return headers, records
+
+    @staticmethod
+    def _month_filter(room, months):
+        """
+        按房间（months为[(年, 月)]时还按月份）筛选记录的WHERE子句和参数，月份在SQL中筛选
+        """
+        if months is None:
+            return "room = ?", [room]
+        month_keys = sorted({f"{year}-{month:02d}" for year, month in months})
+        return f"room = ? AND month IN ({', '.join('?' * len(month_keys))})", [room] + month_keys
+
+    def count_records(self, room, months=None):
+        """
+        房间的本地记录条数，months为[(年, 月)]时只统计这些月份；不读取记录内容
+        """
+        where, params = self._month_filter(room, months)
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM records WHERE {where}", params).fetchone()[0]
+
+    def save_month(self, room, year, month, headers, records):
+        """
+        保存某个月份的全部记录，并更新该月份的抓取时间
+        """
+        month_key = f"{year}-{month:02d}"
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM records WHERE room = ? AND month = ?", (room, month_key))
+            for seq, record in enumerate(records):
+                date_key = record_date(record) or f"{month_key}#{seq}"
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO records (room, record_date, month, seq, cells) VALUES (?, ?, ?, ?, ?)",
+                    (room, date_key, month_key, seq, json.dumps(record, ensure_ascii=False))
+                )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO months (room, month, fetched_at, headers) VALUES (?, ?, ?, ?)",
+                (room, month_key, datetime.now().isoformat(timespec='seconds'),
+                 json.dumps(headers, ensure_ascii=False))
+            )
+
+    def merge_month(self, room, year, month, headers, records):
+        """
+        把某个月份的部分记录合并到本地存储：同一日期的记录被替换，其余记录保持不变，并更新该月份的抓取时间
+        用于只重新解析了内容有变化的页面的情况
+        """
+        month_key = f"{year}-{month:02d}"
+        with self.lock, self.conn:
+            rows = self.conn.execute(
+                "SELECT record_date, seq, cells FROM records WHERE room = ? AND month = ?", (room, month_key)
+            ).fetchall()
+            seqs = {date_key: seq for date_key, seq, _ in rows}
+            undated = {cells for date_key, _, cells in rows if '#' in date_key}
+            next_seq = max(seqs.values(), default=-1) + 1
+            for record in records:
+                cells = json.dumps(record, ensure_ascii=False)
+                date_key = record_date(record)
+                if date_key is None:
+                    if cells in undated:
+                        continue
+                    date_key = f"{month_key}#{next_seq}"
+                seq = seqs.get(date_key)
+                if seq is None:
+                    seq = seqs[date_key] = next_seq
+                    next_seq += 1
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO records (room, record_date, month, seq, cells) VALUES (?, ?, ?, ?, ?)",
+                    (room, date_key, month_key, seq, cells)
+                )
+            row = self.conn.execute(
+                "SELECT headers FROM months WHERE room = ? AND month = ?", (room, month_key)
+            ).fetchone()
+            if not headers and row:
+                headers = json.loads(row[0])
+            self.conn.execute(
+                "INSERT OR REPLACE INTO months (room, month, fetched_at, headers) VALUES (?, ?, ?, ?)",
+                (room, month_key, datetime.now().isoformat(timespec='seconds'),
+                 json.dumps(headers, ensure_ascii=False))
+            )
+
+    def page_fingerprints(self, room, year, month):
+        """
+        某个月份上次抓取时各页内容的摘要 {页码: 摘要}
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT page, digest FROM page_fingerprints WHERE room = ? AND month = ?",
+                (room, f"{year}-{month:02d}")
+            ).fetchall()
+        return dict(rows)
+
+    def save_page_fingerprints(self, room, year, month, digests):
+        """
+        保存某个月份各页内容的摘要 {页码: 摘要}，替换该月份之前的全部摘要
+        """
+        month_key = f"{year}-{month:02d}"
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM page_fingerprints WHERE room = ? AND month = ?", (room, month_key))
+            self.conn.executemany(
+                "INSERT INTO page_fingerprints (room, month, page, digest) VALUES (?, ?, ?, ?)",
+                [(room, month_key, page, digest) for page, digest in digests.items()]
+            )
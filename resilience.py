@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求重试与VPN票据失效检测
+
+RetryPolicy规定单个请求的最大尝试次数和带随机抖动的指数退避时间，
+以及一次查询中最多重新进入房间的次数。连接错误、超时和网关错误（429/502/503/504）会按策略重试；
+被webvpn跳转到登录页面说明票据已失效，抛出SessionExpired，由调用方重新登录后从中断的月份/页继续。
+RateLimiter限制多个查询共同的请求速率，用于长时间运行的守护进程。
+"""
+
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+# 可以重试的状态码（网关暂时不可用或限流）
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+
+class SessionExpired(Exception):
+    """
+    VPN票据失效，请求被跳转到了登录页面
+    """
+
+
+class RequestFailed(Exception):
+    """
+    请求在重试次数用完后仍然失败
+    """
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=8.0, max_resumes=3):
+        # 请求至少要发送一次，max_attempts为0时重试循环一次也不会执行
+        if max_attempts < 1:
+            raise ValueError(f"max_attempts至少为1（包括第一次请求）：{max_attempts}")
+        if max_resumes < 0:
+            raise ValueError(f"max_resumes不能为负数：{max_resumes}")
+        # 单个请求的最大尝试次数（包括第一次）
+        self.max_attempts = max_attempts
+        # 第n次重试前等待 [0, min(max_delay, base_delay * 2**n)) 秒（full jitter）
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # 一次查询中因票据失效或请求失败而重新进入房间的最大次数
+        self.max_resumes = max_resumes
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+NO_RETRY = RetryPolicy(max_attempts=1, max_resumes=0)
+
+
+class RateLimiter:
+    """
+    请求速率限制：多个线程共用，每次请求前调用wait()，相邻两次请求的开始时间至少间隔1/rate秒
+    """
+
+    def __init__(self, rate):
+        # 每秒最多的请求数
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def is_login_redirect(location):
+    return 'login' in urlsplit(location or '').path.lower()
+
+
+def is_login_response(response):
+    """
+    判断响应是否是webvpn的登录跳转（跳转本身或跳转之后的登录页面）
+    """
+    if response.status_code in (301, 302, 303, 307) and is_login_redirect(response.headers.get('Location')):
+        return True
+    for previous in getattr(response, 'history', None) or []:
+        if is_login_redirect(previous.headers.get('Location')):
+            return True
+    return is_login_redirect(str(getattr(response, 'url', '') or ''))
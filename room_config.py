@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+房间配置文件
+
+守护进程和批量查询从JSON配置文件中读取要查询的房间，格式如下：
+
+{
+    "base_url": null,
+    "max_workers": 4,
+    "password": "111",
+    "start": "2026-01",
+    "rooms": [
+        {"community": "A区", "building": "1", "room": "404"},
+        {"campus": "校本部", "community": "B区", "building": "3", "room": "201", "password": "222", "start": "2025-09"},
+        {"community": "C区", "building": "2", "rooms": ["101", "102", "103"]},
+        "校本部/A区/1/405"
+    ]
+}
+
+房间的password、campus、start、end未设置时使用顶层的同名设置；rooms列表中的字符串为
+"校区/社区/楼栋/房间"或"社区/楼栋/房间"；一个条目中的"rooms"列表展开为同一楼栋的多个房间。
+"""
+
+import json
+import re
+
+from batch_query import make_room
+from electricity_cli import SESSION_FILE, ElectricityQuery
+
+MONTH_PATTERN = re.compile(r'^\d{4}-\d{2}$')
+
+# 房间条目中可以从顶层继承的设置
+ROOM_DEFAULTS = {
+    'campus': '校本部',
+    'password': '111',
+    'start': None,
+    'end': None,
+}
+
+
+def _check_month(value, where):
+    if value is not None and not MONTH_PATTERN.match(str(value)):
+        raise ValueError(f"{where}的日期格式错误：{value}（应为YYYY-MM）")
+    return value
+
+
+def _room_entries(entry, index):
+    """
+    把配置中的一个条目展开为 [(社区, 楼栋, 房间, 条目中的其他设置)]
+    """
+    where = f"第{index + 1}个房间"
+    if isinstance(entry, str):
+        parts = [part.strip() for part in entry.split('/')]
+        if len(parts) == 3:
+            return [(parts[0], parts[1], parts[2], {})]
+        if len(parts) == 4:
+            return [(parts[1], parts[2], parts[3], {'campus': parts[0]})]
+        raise ValueError(f"{where}格式错误：{entry}（应为 校区/社区/楼栋/房间 或 社区/楼栋/房间）")
+
+    if not isinstance(entry, dict):
+        raise ValueError(f"{where}格式错误：{entry}")
+    missing = [name for name in ('community', 'building') if not entry.get(name)]
+    if not entry.get('room') and not entry.get('rooms'):
+        missing.append('room')
+    if missing:
+        raise ValueError(f"{where}缺少字段：{', '.join(missing)}")
+
+    room_numbers = entry['rooms'] if entry.get('rooms') else [entry['room']]
+    settings = {name: entry[name] for name in ROOM_DEFAULTS if entry.get(name) is not None}
+    return [(entry['community'], entry['building'], room_number, settings) for room_number in room_numbers]
+
+
+def normalize_rooms(config):
+    """
+    把配置中的房间展开为make_room格式的字典列表，每个房间另有start和end（可能为None）
+    """
+    defaults = {name: config.get(name, default) for name, default in ROOM_DEFAULTS.items()}
+    rooms = []
+    for index, entry in enumerate(config.get('rooms') or []):
+        for community, building, room_number, settings in _room_entries(entry, index):
+            merged = dict(defaults, **settings)
+            room = make_room(str(community), str(building), str(room_number),
+                             str(merged['password']), str(merged['campus']))
+            room['start'] = _check_month(merged['start'], f"房间{room_number}")
+            room['end'] = _check_month(merged['end'], f"房间{room_number}")
+            rooms.append(room)
+    return rooms
+
+
+def load_config(path):
+    """
+    读取房间配置文件，返回配置字典，其中rooms已经展开；文件不存在或格式错误时抛出ValueError
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        raise ValueError(f"配置文件不存在：{path}")
+    except json.JSONDecodeError as e:
+        raise ValueError(f"配置文件不是有效的JSON：{path}（{e}）")
+
+    if not isinstance(config, dict):
+        raise ValueError(f"配置文件的顶层应为对象：{path}")
+    _check_month(config.get('start'), "配置")
+    _check_month(config.get('end'), "配置")
+    config['rooms'] = normalize_rooms(config)
+    if not config['rooms']:
+        raise ValueError(f"配置文件中没有房间：{path}")
+    return config
+
+
+def open_session(config, session_path=SESSION_FILE, interactive=True):
+    """
+    取得VPN cookie（JSON字符串）：配置中的vpn_cookie，其次是保存的会话，
+    都不可用时重新登录；interactive为False时不登录，返回None
+    """
+    if config.get('vpn_cookie'):
+        return json.dumps(config['vpn_cookie'])
+
+    eq = ElectricityQuery(base_url=config.get('base_url'))
+    if eq.restore_session(session_path):
+        return json.dumps(eq.session.cookies.get_dict())
+    if not interactive:
+        return None
+
+    vpn_cookie = eq.get_vpn_cookie()
+    if vpn_cookie:
+        eq.use_vpn_cookie(vpn_cookie)
+        eq.save_session(session_path)
+    return vpn_cookie
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多进程分片遍历
+
+遍历整个校区（或部分社区、楼栋）的用电记录时，页面解析和网络等待一样耗时，单个Python进程只能用一个CPU核心。
+这里按 校区/社区/楼栋 把房间分成分片，每个楼栋一个分片，交给进程池中的工作进程：
+- 父进程先逐级选择校区、社区、楼栋，从下拉框中列出所有房间（也可以用room_config的配置文件指定房间），
+  拓扑索引保存到dorm_topology.json，工作进程直接从缓存的楼栋页面进入房间
+- 每个工作进程有自己的BatchQuery（threads个ElectricityQuery和自己的连接池），进程之间不共享会话和连接
+- 房间多的楼栋先开始，减少最后只剩一个进程在运行的时间
+- 工作进程只把每个房间的摘要返回父进程；记录写入每个分片的临时文件（每个房间一行），
+  父进程逐个房间读出，按 校区/社区/楼栋/房间 的顺序写入同一个导出文件，与进程数和完成顺序无关，
+  父进程的内存不随遍历的房间数增长
+
+使用方法：
+python sharded_sweep.py --start 2026-01 --end 2026-03
+python sharded_sweep.py --start 2026-01 --community A区,D区 --processes 8 --output sweep.parquet
+python sharded_sweep.py --config rooms.json --start 2026-01 --summary -
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import profiling
+from batch_query import (EXIT_CONFIG, EXIT_FAILED, EXIT_OK, BatchQuery, add_profile_arguments, finish_profiler,
+                         make_room, room_summary, start_profiler, write_summary)
+from dedup import DedupIndex
+from electricity_cli import SESSION_FILE, ElectricityQuery
+from exporters import open_exporter
+from memory_budget import peak_rss_bytes
+from page_parsers import set_default_parser
+from record_store import DEFAULT_DB_PATH, RecordStore, room_key
+from topology import DEFAULT_TOPOLOGY_PATH, TopologyIndex, node_key
+
+DEFAULT_OUTPUT_PATH = "sweep_records.csv"
+DEFAULT_SUMMARY_PATH = "sweep_summary.json"
+
+# 每个工作进程中同时查询的房间数
+DEFAULT_THREADS = 2
+
+# 下拉框中的占位选项
+PLACEHOLDER_OPTION = '请选择'
+
+# 一个楼栋的所有待查询房间
+Shard = namedtuple('Shard', ['campus', 'community', 'building', 'rooms'])
+
+
+def natural_key(text):
+    """
+    按数字大小排序的键：'2' < '10'，'A区' < 'B区'
+    """
+    return [(0, int(part), '') if part.isdigit() else (1, 0, part) for part in re.split(r'(\d+)', str(text)) if part]
+
+
+def shard_key(shard):
+    return room_key(shard.campus, shard.community, shard.building, '').rstrip('/')
+
+
+def shards_from_rooms(rooms):
+    """
+    把房间按楼栋分组，分片和分片中的房间都按自然顺序排列
+    """
+    groups = {}
+    for room in rooms:
+        path = (room.get('campus', '校本部'), room['community'], room['building'])
+        groups.setdefault(path, []).append(room)
+    return [Shard(*path, sorted(group, key=lambda room: natural_key(room['room'])))
+            for path, group in sorted(groups.items(), key=lambda item: [natural_key(part) for part in item[0]])]
+
+
+def _choices(page, select_name, wanted=None):
+    """
+    下拉框中的选项名称（不含占位选项），wanted不为空时只保留其中的名称
+    """
+    options = page.options.get(select_name, {}) if page else {}
+    names = [name for name, value in options.items() if value and PLACEHOLDER_OPTION not in name]
+    if wanted:
+        missing = [name for name in wanted if name not in names]
+        if missing:
+            print(f"\n⚠️ 未找到：{', '.join(missing)}")
+        names = [name for name in wanted if name in names]
+    return names
+
+
+def discover_rooms(eq, campus, communities=None, buildings=None, password="111"):
+    """
+    逐级选择校区、社区、楼栋，列出范围内的所有房间；选择结果记录在eq.topology中
+    """
+    page = eq.get_electricity_page()
+    campus_page = eq.select_campus(page, campus) if page else None
+    if not campus_page:
+        print(f"\n❌ 无法选择校区：{campus}")
+        return []
+    campus_values = dict(eq.form_values)
+
+    rooms = []
+    for community in _choices(campus_page, 'ddlQuYu', communities):
+        # 每个社区都从同一个校区页面回发，选择状态要回到校区这一级
+        eq.selection = {'campus': campus}
+        eq.form_values = dict(campus_values)
+        community_page = eq.select_community(campus_page, community)
+        if not community_page:
+            continue
+        community_values = dict(eq.form_values)
+
+        for building in _choices(community_page, 'ddlLouDong', buildings):
+            eq.selection = {'campus': campus, 'community': community}
+            eq.form_values = dict(community_values)
+            building_page = eq.select_building(community_page, building)
+            for room_number in _choices(building_page, 'ddlFangJian'):
+                rooms.append(make_room(community, building, room_number, password, campus))
+
+    if eq.topology is not None:
+        eq.topology.save()
+    print(f"\n✅ 共找到{len(rooms)}个房间")
+    return rooms
+
+
+def shard_nodes(topology, shard):
+    """
+    分片所在楼栋路径上的拓扑索引节点，传给工作进程
+    """
+    path = [shard.campus, shard.community, shard.building]
+    nodes = {}
+    for depth in range(1, len(path) + 1):
+        key = node_key(path[:depth])
+        if key in topology.nodes:
+            nodes[key] = topology.nodes[key]
+    return nodes
+
+
+# 工作进程中的BatchQuery，由_init_worker创建
+_worker = {}
+
+
+def _init_worker(vpn_cookie, base_url, db_path, threads, parser, verbose, profile=None):
+    if not verbose:
+        sys.stdout = open(os.devnull, 'w', encoding='utf-8')
+    if parser:
+        set_default_parser(parser)
+    if profile is not None:
+        # (是否跟踪内存, 采样间隔)，统计随每个分片的结果返回父进程
+        profiling.enable(*profile)
+    store = RecordStore(db_path) if db_path else None
+    # 拓扑索引只保存在内存中，节点由父进程随分片传入
+    _worker['batch'] = BatchQuery(vpn_cookie, max_workers=threads, store=store,
+                                  topology=TopologyIndex(None), base_url=base_url)
+
+
+def sweep_shard(shard, nodes, start_date, end_date, spool_path=None):
+    """
+    在工作进程中查询一个分片的所有房间，返回 {'rooms': [房间摘要], 'spool': 记录文件, 'offsets': [...],
+    'elapsed': 秒, 'pid': 进程号}，房间摘要（room_summary）的顺序与分片中的顺序一致
+    记录不随结果返回父进程：spool_path不为None时每个房间的记录写入其中的一行JSON，
+    offsets[i]为第i个房间所在行的位置（没有记录时为None）；启用了profiling时'profile'为本分片的统计（Profiler.snapshot）
+    """
+    batch = _worker['batch']
+    with batch.topology.lock:
+        batch.topology.nodes.update(nodes)
+
+    started = time.perf_counter()
+    rooms = [dict(room, start=room.get('start') or start_date, end=room.get('end') or end_date)
+             for room in shard.rooms]
+    # 同一分片中可能有房间号相同的条目（例如配置重复），按条目的位置对应结果
+    positions = {id(room): index for index, room in enumerate(rooms)}
+    summaries = [None] * len(rooms)
+    offsets = [None] * len(rooms)
+    spool = open(spool_path, 'w', encoding='utf-8') if spool_path else contextlib.nullcontext()
+    with spool:
+        for room, result, error in batch.iter_results(rooms, start_date, end_date):
+            index = positions[id(room)]
+            summaries[index] = room_summary(room, result, error)
+            if spool_path and result and result['records']:
+                offsets[index] = spool.tell()
+                key = room_key(room.get('campus', '校本部'), room['community'], room['building'], room['room'])
+                spool.write(json.dumps({'room': key, 'headers': result['headers'], 'records': result['records']},
+                                       ensure_ascii=False) + '\n')
+    profiler = profiling.active()
+    return {
+        'rooms': summaries,
+        'spool': spool_path,
+        'offsets': offsets,
+        'elapsed': time.perf_counter() - started,
+        'pid': os.getpid(),
+        'profile': profiler.snapshot(reset=True) if profiler is not None else None
+    }
+
+
+def export_spool(exporter, spool_path, offsets):
+    """
+    按房间顺序把工作进程写入临时文件的记录写入导出文件，每次只读取一个房间
+    """
+    with open(spool_path, encoding='utf-8') as f:
+        for offset in offsets:
+            if offset is None:
+                continue
+            f.seek(offset)
+            line = json.loads(f.readline())
+            exporter.write_batch(line['headers'], line['records'], line['room'])
+
+
+def sweep(shards, vpn_cookie, start_date, end_date, processes=None, threads=DEFAULT_THREADS, base_url=None,
+          db_path=None, topology=None, exporter=None, parser=None, verbose=False, profiler=None):
+    """
+    用processes个进程查询所有分片，按分片顺序产出 (分片, [房间摘要])；
+    导出器按同样的顺序写入。传入profiler时工作进程用同样的设置分析，统计合并到profiler中
+    """
+    processes = processes or os.cpu_count() or 1
+    # spawn：工作进程不继承父进程的连接和会话（各平台行为一致）
+    context = multiprocessing.get_context('spawn')
+    if exporter is not None and exporter.dedup is None:
+        # 同一房间出现在多个分片（配置重复）时，重叠的读数只写入一次
+        exporter.dedup = DedupIndex()
+    spool_dir = tempfile.TemporaryDirectory(prefix='sweep_') if exporter is not None else contextlib.nullcontext()
+    with spool_dir as spool_path, \
+            ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=_init_worker,
+                                initargs=(vpn_cookie, base_url, db_path, threads, parser, verbose,
+                                          (profiler.trace_memory, profiler.sample_interval) if profiler else None)
+                                ) as executor:
+        futures = [None] * len(shards)
+        for index in sorted(range(len(shards)), key=lambda index: -len(shards[index].rooms)):
+            nodes = shard_nodes(topology, shards[index]) if topology is not None else {}
+            spool = os.path.join(spool_path, f"shard_{index}.jsonl") if spool_path else None
+            futures[index] = executor.submit(sweep_shard, shards[index], nodes, start_date, end_date, spool)
+
+        for number, (shard, future) in enumerate(zip(shards, futures), 1):
+            try:
+                outcome = future.result()
+            except Exception as e:
+                error = f"工作进程失败：{str(e)}"
+                outcome = {'rooms': [room_summary(dict(room, start=room.get('start') or start_date,
+                                                       end=room.get('end') or end_date), None, error)
+                                     for room in shard.rooms],
+                           'spool': None, 'elapsed': 0.0, 'pid': None}
+
+            if profiler is not None and outcome.get('profile'):
+                profiler.merge(outcome['profile'])
+            rooms = outcome['rooms']
+            failed = sum(1 for summary in rooms if summary['status'] != 'ok')
+            print(f"[{number}/{len(shards)}] {shard_key(shard)}：{len(rooms) - failed}/{len(rooms)}个房间成功，"
+                  f"{outcome['elapsed']:.1f}秒（进程{outcome['pid']}）")
+
+            if exporter is not None and outcome['spool']:
+                export_spool(exporter, outcome['spool'], outcome['offsets'])
+                os.remove(outcome['spool'])
+            yield shard, rooms
+
+
+def split_names(value):
+    return [part.strip() for part in value.split(',') if part.strip()] if value else None
+
+
+def _run(args):
+    if args.parser:
+        try:
+            set_default_parser(args.parser)
+        except ValueError as e:
+            print(f"❌ {str(e)}")
+            return EXIT_CONFIG, None
+    if args.config:
+        from room_config import load_config
+        try:
+            config = load_config(args.config)
+        except ValueError as e:
+            print(f"❌ {str(e)}")
+            return EXIT_CONFIG, None
+    else:
+        config = {'rooms': None}
+    base_url = args.base_url or config.get('base_url')
+    start_date = args.start or config.get('start')
+    end_date = args.end or config.get('end') or datetime.now().strftime('%Y-%m')
+    if not start_date:
+        print("❌ 请用 --start 指定开始月份（YYYY-MM）")
+        return EXIT_CONFIG, None
+
+    from room_config import open_session
+    vpn_cookie = open_session(dict(config, base_url=base_url), args.session)
+    if not vpn_cookie:
+        print("\n❌ 获取VPN cookie失败")
+        return EXIT_CONFIG, None
+
+    profiler = start_profiler(args)
+    topology = TopologyIndex(DEFAULT_TOPOLOGY_PATH)
+    rooms = config['rooms']
+    if rooms is None:
+        eq = ElectricityQuery(vpn_cookie, topology=topology, base_url=base_url)
+        rooms = discover_rooms(eq, args.campus, split_names(args.community), split_names(args.building),
+                               args.password)
+        if not rooms:
+            finish_profiler(profiler, args)
+            return EXIT_FAILED, None
+
+    try:
+        exporter = open_exporter(args.output) if args.output else None
+    except ValueError as e:
+        print(f"❌ {str(e)}")
+        finish_profiler(profiler, args)
+        return EXIT_CONFIG, None
+
+    shards = shards_from_rooms(rooms)
+    processes = args.processes or os.cpu_count() or 1
+    print(f"\n开始遍历：{len(shards)}个楼栋，{len(rooms)}个房间，{processes}个进程 × {args.threads}个线程")
+
+    db_path = None if args.no_store else (args.db or config.get('db_file', DEFAULT_DB_PATH))
+    if db_path:
+        # 工作进程打开存储前先建好表，避免多个进程同时建表
+        RecordStore(db_path).close()
+
+    started = time.time()
+    summaries = []
+    for shard, rooms_done in sweep(shards, vpn_cookie, start_date, end_date, processes, args.threads, base_url,
+                                   db_path, topology, exporter, args.parser, args.verbose, profiler):
+        summaries.extend(rooms_done)
+    elapsed = time.time() - started
+    if exporter is not None:
+        exporter.close()
+    finish_profiler(profiler, args)
+
+    failed = sum(1 for summary in summaries if summary['status'] != 'ok')
+    summary = {
+        'started_at': datetime.fromtimestamp(started).isoformat(timespec='seconds'),
+        'elapsed_seconds': round(elapsed, 3),
+        'processes': processes,
+        'threads': args.threads,
+        'shards': len(shards),
+        'total': len(summaries),
+        'succeeded': len(summaries) - failed,
+        'failed': failed,
+        'rooms_per_second': round(len(summaries) / elapsed, 3) if elapsed else None,
+        'output': args.output,
+        # 工作进程的峰值为已结束的子进程中最大的一个
+        'peak_rss_bytes': {'main': peak_rss_bytes(), 'workers': peak_rss_bytes(children=True)},
+        'rooms': summaries
+    }
+    print(f"\n{'✅' if not failed else '⚠️'} {summary['succeeded']}/{summary['total']}个房间查询成功，"
+          f"用时{elapsed:.1f}秒（{summary['rooms_per_second']}个房间/秒）")
+    if exporter is not None and exporter.count:
+        print(f"📁 {exporter.count}条记录已导出到：{os.path.abspath(args.output)}")
+    return (EXIT_FAILED if failed else EXIT_OK), summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按楼栋分片、多进程遍历房间的用电记录")
+    parser.add_argument('--start', help="开始月份（YYYY-MM），使用配置文件时默认为其中的start")
+    parser.add_argument('--end', help="结束月份（YYYY-MM），默认为当前月份")
+    parser.add_argument('--config', help="房间配置文件（格式见room_config.py），不指定时从下拉框中列出所有房间")
+    parser.add_argument('--campus', default='校本部', help="要遍历的校区")
+    parser.add_argument('--community', help="只遍历这些社区，逗号分隔")
+    parser.add_argument('--building', help="只遍历这些楼栋，逗号分隔")
+    parser.add_argument('--password', default='111', help="房间的查询密码")
+    parser.add_argument('--processes', type=int, help="工作进程数，默认为CPU核心数")
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS, help="每个进程同时查询的房间数")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_PATH,
+                        help="导出文件（.csv、.jsonl、.parquet、.arrow、.npz），为空时不导出")
+    parser.add_argument('--summary', default=DEFAULT_SUMMARY_PATH, help="结果摘要（JSON），'-'为输出到标准输出")
+    parser.add_argument('--db', help="本地存储的SQLite文件")
+    parser.add_argument('--no-store', action='store_true', help="不使用本地存储")
+    parser.add_argument('--base-url', help="电费查询系统的地址，例如本地的stand_in_server.py")
+    parser.add_argument('--session', default=SESSION_FILE, help="VPN会话文件")
+    parser.add_argument('--parser', help="页面解析后端（bs4、stdlib或lxml）")
+    parser.add_argument('--verbose', action='store_true', help="显示工作进程的查询过程")
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    stdout = sys.stdout
+    progress = contextlib.redirect_stdout(sys.stderr) if args.summary == '-' else contextlib.nullcontext()
+    with progress:
+        code, summary = _run(args)
+        if summary is not None:
+            write_summary(summary, args.summary, stdout)
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+电费查询系统的离线页面夹具
+
+SyntheticSite按真实系统的结构生成查询流程中的每个页面：首页、选择校区/社区/楼栋后的回发页面、
+房间登录后的框架页面、stuMainFrame、stuTop.htm、HouseElec.aspx以及分页的gvElecInfo表格。
+页面状态（当前选择、年月、页码）和真实系统一样编码在__VIEWSTATE中，只有登录的房间按客户端保存，
+生成的页面也带有与真实系统相近大小的__VIEWSTATE。
+
+FixtureSession实现了ElectricityQuery用到的requests.Session接口，直接返回生成的页面，
+不需要网络和VPN即可完整运行一次查询。ResponseRecorder可以把真实查询的响应按步骤保存下来，
+load_recorded读取保存的页面，用于基准测试中回放真实数据。
+"""
+
+import base64
+import calendar
+import hashlib
+import json
+import os
+import re
+from urllib.parse import parse_qsl, urlsplit
+
+from page_model import response_text
+
+DEFAULT_ROWS_PER_PAGE = 10
+
+# 真实系统的__VIEWSTATE约为数KB
+DEFAULT_VIEWSTATE_SIZE = 6000
+
+DEFAULT_CAMPUSES = ['校本部']
+DEFAULT_COMMUNITIES = ['A区', 'D区']
+DEFAULT_BUILDINGS = [str(number) for number in range(1, 6)]
+DEFAULT_ROOMS = [f"{floor}{number:02d}" for floor in range(1, 7) for number in range(1, 21)]
+
+GRID_HEADERS = ['序号', '日期', '电表读数', '日用电量', '备注']
+
+# 查询流程中的步骤名称，与ResponseRecorder保存的文件名对应
+STEPS = ['landing', 'campus', 'community', 'building', 'frameset', 'main_frame', 'stu_top', 'house_elec', 'grid']
+
+SELECT_STEPS = {'ddlXiaoQu': 'campus', 'ddlQuYu': 'community', 'ddlLouDong': 'building'}
+
+
+def classify_request(method, path, form):
+    """
+    根据请求方法、路径和表单判断它属于查询流程中的哪一步
+    """
+    name = path.rsplit('/', 1)[-1].split('?', 1)[0]
+    if name.startswith('stuMain'):
+        return 'main_frame'
+    if name.startswith('stuTop'):
+        return 'stu_top'
+    if name.startswith('HouseElec'):
+        return 'grid' if method == 'POST' else 'house_elec'
+    if method == 'GET':
+        return 'landing'
+    if 'txtStuPwd' in form:
+        return 'frameset'
+    return SELECT_STEPS.get(form.get('__EVENTTARGET'), 'unknown')
+
+
+class FixtureResponse:
+    """
+    与requests.Response兼容的最小响应对象
+    """
+
+    def __init__(self, status_code, text, url, headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.url = url
+        self.headers = headers or {'Content-Type': 'text/html; charset=utf-8'}
+        self.encoding = 'utf-8'
+
+    @property
+    def content(self):
+        return self.text.encode('utf-8')
+
+
+class SyntheticSite:
+    def __init__(self, campuses=None, communities=None, buildings=None, rooms=None,
+                 rows_per_page=DEFAULT_ROWS_PER_PAGE, viewstate_size=DEFAULT_VIEWSTATE_SIZE, pages_per_month=None,
+                 setup_rooms=()):
+        self.campuses = campuses or DEFAULT_CAMPUSES
+        self.communities = communities or DEFAULT_COMMUNITIES
+        self.buildings = buildings or DEFAULT_BUILDINGS
+        self.rooms = rooms or DEFAULT_ROOMS
+        self.rows_per_page = rows_per_page
+        self.viewstate_size = viewstate_size
+        # 指定时每个月的记录固定分成这么多页，覆盖rows_per_page
+        self.pages_per_month = pages_per_month
+        # 这些房间号登录时返回初次使用的系统设置页面，而不是框架页面
+        self.setup_rooms = set(setup_rooms)
+
+    def page_size(self, record_count):
+        if self.pages_per_month:
+            return max(-(-record_count // self.pages_per_month), 1)
+        return self.rows_per_page
+
+    # ---------- __VIEWSTATE ----------
+
+    def encode_state(self, **state):
+        """
+        把页面状态编码进__VIEWSTATE，并用确定性的内容填充到接近真实系统的大小
+        """
+        payload = base64.b64encode(json.dumps(state, ensure_ascii=False).encode('utf-8')).decode('ascii')
+        padding_size = max(self.viewstate_size - len(payload), 0)
+        seed = hashlib.sha256(payload.encode('ascii')).digest()
+        padding = base64.b64encode(seed * (padding_size // len(seed) + 1)).decode('ascii')[:padding_size]
+        return f"/wEPDw{payload}.{padding}"
+
+    @staticmethod
+    def decode_state(viewstate):
+        match = re.match(r'/wEPDw([A-Za-z0-9+/=]*)\.', viewstate or '')
+        if not match:
+            return {}
+        try:
+            return json.loads(base64.b64decode(match.group(1)).decode('utf-8'))
+        except ValueError:
+            return {}
+
+    # ---------- 页面 ----------
+
+    @staticmethod
+    def event_validation(viewstate):
+        return base64.b64encode(hashlib.md5(viewstate.encode('ascii')).digest()).decode('ascii')
+
+    def _hidden_fields(self, **state):
+        viewstate = self.encode_state(**state)
+        validation = self.event_validation(viewstate)
+        return (f'<input type="hidden" name="__EVENTTARGET" id="__EVENTTARGET" value="" />\n'
+                f'<input type="hidden" name="__EVENTARGUMENT" id="__EVENTARGUMENT" value="" />\n'
+                f'<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="{viewstate}" />\n'
+                f'<input type="hidden" name="__EVENTVALIDATION" id="__EVENTVALIDATION" value="{validation}" />\n')
+
+    @staticmethod
+    def _select(name, options, selected=None, value_format='{}'):
+        rendered = []
+        for text in options:
+            mark = ' selected="selected"' if text == selected else ''
+            rendered.append(f'<option{mark} value="{value_format.format(text)}">{text}</option>')
+        return (f'<select name="{name}" onchange="javascript:setTimeout(\'__doPostBack(\\\'{name}\\\',\\\'\\\')\', 0)" '
+                f'id="{name}">\n' + '\n'.join(rendered) + '\n</select>')
+
+    def _room_value(self, community, building, room):
+        digest = hashlib.md5(f"{community}/{building}/{room}".encode('utf-8')).hexdigest()
+        return str(int(digest[:8], 16) % 900000 + 100000)
+
+    def index_page(self, campus=None, community=None, building=None):
+        """
+        首页以及选择校区/社区/楼栋后的回发页面
+        """
+        parts = [self._select('ddlXiaoQu', ['请选择'] + self.campuses, campus)]
+        if campus:
+            # 真实系统的社区选项值带有空格填充
+            parts.append(self._select('ddlQuYu', self.communities, community, value_format='{:<10}'))
+        if community:
+            parts.append(self._select('ddlLouDong', self.buildings, building))
+        if building:
+            select = ['<select name="ddlFangJian" id="ddlFangJian">']
+            for room in self.rooms:
+                select.append(f'<option value="{self._room_value(community, building, room)}">{room}</option>')
+            select.append('</select>')
+            parts.append('\n'.join(select))
+            parts.append('<input name="txtStuPwd" type="password" id="txtStuPwd" />')
+            parts.append('<input type="image" name="btnEnter" id="btnEnter" src="images/enter.gif" />')
+
+        state = {'campus': campus, 'community': community, 'building': building}
+        return ('<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN">\n'
+                '<html xmlns="http://www.w3.org/1999/xhtml"><head><title>宿舍用电查询</title></head>\n'
+                '<body><form name="form1" method="post" action="./" id="form1">\n'
+                + self._hidden_fields(**state) +
+                '<table class="login" cellspacing="0" cellpadding="0">\n'
+                + ''.join(f'<tr><td class="label">选择</td><td>{part}</td></tr>\n' for part in parts) +
+                '</table></form></body></html>')
+
+    def frameset_page(self):
+        return ('<html><head><title>宿舍用电查询</title></head>\n'
+                '<frameset rows="90,*" frameborder="0">\n'
+                '<frame name="stuTopFrame" src="stuTop.htm" scrolling="no" />\n'
+                '<frame name="stuMainFrame" src="stuMain.aspx" />\n'
+                '</frameset></html>')
+
+    def setup_page(self, room_value):
+        """
+        初次登录时的系统设置页面（设置房间密码、宿舍代表和手机号码）
+        """
+        return ('<html><head><title>系统设置</title></head><body>\n'
+                f'<form name="form1" method="post" action="HouseInfo.aspx?ID={room_value}" id="form1">\n'
+                + self._hidden_fields(setup=room_value) +
+                '<p>初次登录，请设置房间密码和信息</p>\n'
+                '<input name="txtPwd" type="password" id="txtPwd" />\n'
+                '<input name="txtName" type="text" id="txtName" />\n'
+                '<input name="txtPhone" type="text" id="txtPhone" />\n'
+                '<input type="submit" name="btnOK" value="确定" id="btnOK" />\n'
+                '</form></body></html>')
+
+    def main_frame_page(self, room=None):
+        rows = [('房间', room or ''), ('剩余电量', '86.32'), ('剩余金额', '49.21'), ('状态', '正常')]
+        return ('<html><body><table class="info">\n'
+                + ''.join(f'<tr><td>{label}</td><td>{value}</td></tr>\n' for label, value in rows) +
+                '</table></body></html>')
+
+    def stu_top_page(self):
+        links = [('stuMain.aspx', '基本信息'), ('HouseElec.aspx', '用电信息'),
+                 ('HouseBuy.aspx', '购电信息'), ('HousePwd.aspx', '修改密码')]
+        return ('<html><body><table class="nav"><tr>\n'
+                + ''.join(f'<td><a href="{href}" target="stuMainFrame">{text}</a></td>\n' for href, text in links) +
+                '</tr></table></body></html>')
+
+    def house_elec_page(self, room=None, year=None, month=None, page=0):
+        """
+        HouseElec.aspx：未指定年月时只有查询表单，否则带有gvElecInfo表格的一页
+        """
+        years = [str(y) for y in range(2018, 2031)]
+        months = [f"{m:02d}" for m in range(1, 13)]
+        form = (self._select('ddlYear', years, str(year) if year else None) +
+                self._select('ddlMonth', months, f"{month:02d}" if month else None) +
+                '<input type="submit" name="btnSelect" value="查 看" id="btnSelect" />\n')
+
+        grid = ''
+        if year and month:
+            records = self.month_records(room, year, month)
+            page_size = self.page_size(len(records))
+            start = page * page_size
+            rows = records[start:start + page_size]
+            grid_rows = ['<tr>' + ''.join(f'<th scope="col">{header}</th>' for header in GRID_HEADERS) + '</tr>']
+            for record in rows:
+                grid_rows.append('<tr>' + ''.join(f'<td>{cell}</td>' for cell in record) + '</tr>')
+            pager = []
+            if page > 0:
+                pager.append('<a href="javascript:__doPostBack(\'gvElecInfo\',\'Page$Prev\')">上一页</a>')
+            if start + page_size < len(records):
+                pager.append('<a href="javascript:__doPostBack(\'gvElecInfo\',\'Page$Next\')">下一页</a>')
+            if pager:
+                grid_rows.append(f'<tr class="pager"><td colspan="{len(GRID_HEADERS)}">{"&nbsp;".join(pager)}</td></tr>')
+            grid = ('<table cellspacing="0" rules="all" border="1" id="gvElecInfo">\n'
+                    + '\n'.join(grid_rows) + '\n</table>')
+
+        state = {'room': room, 'year': year, 'month': month, 'page': page}
+        return ('<html><body><form name="form1" method="post" action="HouseElec.aspx" id="form1">\n'
+                + self._hidden_fields(**state) + form + grid + '</form></body></html>')
+
+    def month_records(self, room, year, month):
+        """
+        确定性生成某个房间一个月的每日用电记录
+        """
+        records = []
+        days = calendar.monthrange(year, month)[1]
+        seed = int(hashlib.md5(str(room).encode('utf-8')).hexdigest()[:6], 16)
+        reading = 1000 + seed % 5000 + ((year - 2018) * 12 + month) * 150
+        for day in range(1, days + 1):
+            usage = ((seed + year * 372 + month * 31 + day) * 2654435761 % 1000) / 100
+            reading += usage
+            records.append([str(day), f"{year}-{month:02d}-{day:02d}", f"{reading:.2f}", f"{usage:.2f}", ''])
+        return records
+
+    def step_pages(self, year=2025, month=3, room=None):
+        """
+        按查询流程的顺序返回[(步骤名称, 页面)]，gvElecInfo的每一页各占一项
+        """
+        room = room or self.rooms[0]
+        campus, community, building = self.campuses[0], self.communities[0], self.buildings[0]
+        pages = [
+            ('landing', self.index_page()),
+            ('campus', self.index_page(campus)),
+            ('community', self.index_page(campus, community)),
+            ('building', self.index_page(campus, community, building)),
+            ('frameset', self.frameset_page()),
+            ('main_frame', self.main_frame_page(room)),
+            ('stu_top', self.stu_top_page()),
+            ('house_elec', self.house_elec_page(room)),
+        ]
+        record_count = len(self.month_records(room, year, month))
+        page_count = -(-record_count // self.page_size(record_count))
+        for page in range(page_count):
+            pages.append(('grid', self.house_elec_page(room, year, month, page)))
+        return pages
+
+    # ---------- 请求路由 ----------
+
+    def respond(self, method, path, form=None, client=None):
+        """
+        按真实系统的回发流程处理一个请求，返回(状态码, 页面)
+        client是单个客户端的会话状态（相当于真实系统中按cookie保存的登录房间）
+        """
+        form = form or {}
+        client = client if client is not None else {}
+        step = classify_request(method, path, form)
+
+        # 与ASP.NET一样校验回发的__EVENTVALIDATION是否与__VIEWSTATE匹配
+        if method == 'POST' and '__VIEWSTATE' in form:
+            if form.get('__EVENTVALIDATION') != self.event_validation(form['__VIEWSTATE']):
+                return 500, '<html><body><h2>Invalid postback or callback argument.</h2></body></html>'
+
+        if step == 'landing':
+            return 200, self.index_page()
+        if step in ('campus', 'community', 'building'):
+            campus = form.get('ddlXiaoQu') or None
+            community = None
+            building = None
+            if step != 'campus':
+                community = form.get('ddlQuYu', '').strip() or None
+            if step == 'building':
+                building = form.get('ddlLouDong') or None
+            return 200, self.index_page(campus, community, building)
+        if step == 'frameset':
+            state = self.decode_state(form.get('__VIEWSTATE'))
+            room_value = form.get('ddlFangJian')
+            if any(room_value == self._room_value(state.get('community'), state.get('building'), room)
+                   for room in self.setup_rooms):
+                return 200, self.setup_page(room_value)
+            client['room'] = room_value
+            return 200, self.frameset_page()
+        # 进入房间之后的页面按cookie对应的登录房间生成，没有登录房间（例如客户端丢弃了会话cookie）时拒绝访问，
+        # 不能退回到其他房间的数据
+        if step in ('main_frame', 'house_elec', 'grid') and not client.get('room'):
+            return 403, '<html><body><h2>会话已失效，请重新选择房间登录</h2></body></html>'
+        if step == 'main_frame':
+            return 200, self.main_frame_page(client.get('room'))
+        if step == 'stu_top':
+            return 200, self.stu_top_page()
+        if step == 'house_elec':
+            return 200, self.house_elec_page(client.get('room'))
+        if step == 'grid':
+            state = self.decode_state(form.get('__VIEWSTATE'))
+            year, month = int(form.get('ddlYear', 0)), int(form.get('ddlMonth', 0))
+            page = 0
+            if form.get('__EVENTARGUMENT') == 'Page$Next':
+                page = state.get('page', 0) + 1
+            return 200, self.house_elec_page(state.get('room'), year, month, page)
+        return 404, '<html><body>Not Found</body></html>'
+
+
+class FixtureSession:
+    """
+    替代requests.Session，把请求交给SyntheticSite处理，不访问网络
+    """
+
+    def __init__(self, site=None, base_url='http://fixtures.local/'):
+        self.site = site or SyntheticSite()
+        self.base_url = base_url
+        self.headers = {}
+        self.cookies = {}
+        self.client = {}
+        self.requests = []
+
+    def _path(self, url):
+        return urlsplit(url).path
+
+    def get(self, url, **kwargs):
+        status, text = self.site.respond('GET', self._path(url), client=self.client)
+        self.requests.append(('GET', url))
+        return FixtureResponse(status, text, url)
+
+    def post(self, url, data=None, **kwargs):
+        status, text = self.site.respond('POST', self._path(url), dict(data or {}), self.client)
+        self.requests.append(('POST', url))
+        return FixtureResponse(status, text, url)
+
+    def request(self, method, url, **kwargs):
+        if method.upper() == 'POST':
+            return self.post(url, **kwargs)
+        return self.get(url, **kwargs)
+
+
+class ResponseRecorder:
+    """
+    requests的响应钩子，把查询流程中的每个响应按步骤保存到目录中
+    用法：session.hooks['response'].append(ResponseRecorder('fixtures'))
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.sequence = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, response, *args, **kwargs):
+        request = response.request
+        body = request.body or ''
+        if isinstance(body, bytes):
+            body = body.decode('utf-8', errors='replace')
+        form = dict(parse_qsl(body)) if request.method == 'POST' else {}
+        step = classify_request(request.method, urlsplit(request.url).path, form)
+
+        self.sequence += 1
+        path = os.path.join(self.directory, f"{self.sequence:03d}_{step}.html")
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(response_text(response))
+        except Exception as e:
+            print(f"⚠️ 保存响应失败：{str(e)}")
+        return response
+
+
+def load_recorded(directory):
+    """
+    读取ResponseRecorder保存的页面，按保存顺序返回[(步骤名称, 页面)]
+    """
+    pages = []
+    for name in sorted(os.listdir(directory)):
+        match = re.match(r'\d+_(\w+)\.html$', name)
+        if not match:
+            continue
+        with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+            pages.append((match.group(1), f.read()))
+    return pages
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+电费查询系统的本地模拟服务
+
+用http.server模拟webvpn上的电费查询系统，供压测和联调使用，不访问真实的webvpn.ujs.edu.cn。
+页面由site_fixtures.SyntheticSite生成，完整模拟查询依赖的ASP.NET回发流程：
+__VIEWSTATE/__EVENTVALIDATION往返校验、校区/社区/楼栋下拉框联动、
+登录后的stuMainFrame框架页面以及gvElecInfo的Page$Next分页。
+每个请求的延迟和每个月的分页数都可以配置，登录的房间按ASP.NET_SessionId cookie区分。
+还可以按比例返回503，或限制每个VPN票据可用的请求次数（用完后跳转到登录页面），用于验证重试和重新登录。
+
+使用方法：
+python stand_in_server.py --port 8765 --latency 80 --jitter 40 --pages 3
+python stand_in_server.py --error-rate 0.05 --ticket-budget 200
+python electricity_cli.py --base-url http://127.0.0.1:8765/
+"""
+
+import argparse
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+from site_fixtures import SyntheticSite, classify_request
+
+SESSION_COOKIE = 'ASP.NET_SessionId'
+TICKET_COOKIE = 'wengine_vpn_ticketwebvpn_ujs_edu_cn'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 响应头和响应体分两次写出，不关闭Nagle算法时keep-alive连接上每个请求会多等待约40ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _cookies(self):
+        cookies = {}
+        for part in self.headers.get('Cookie', '').split(';'):
+            name, _, value = part.strip().partition('=')
+            if name:
+                cookies[name] = value
+        return cookies
+
+    def _client(self, cookies):
+        """
+        按cookie找到客户端的会话状态，没有时新建一个
+        """
+        session_id = cookies.get(SESSION_COOKIE)
+        new_session = session_id is None or session_id not in self.server.clients
+        if new_session:
+            session_id = session_id or uuid.uuid4().hex
+            with self.server.lock:
+                self.server.clients.setdefault(session_id, {})
+        return session_id, self.server.clients[session_id], new_session
+
+    def _send(self, status, text, extra_headers=()):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in extra_headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method):
+        form = {}
+        if method == 'POST':
+            length = int(self.headers.get('Content-Length', 0))
+            form = dict(parse_qsl(self.rfile.read(length).decode('utf-8')))
+
+        cookies = self._cookies()
+        self.server.wait()
+
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            return self._send(503, '<html><body>Service Unavailable</body></html>')
+
+        if self.path.startswith('/login'):
+            return self._send(200, '<html><body><form id="login">webvpn login</form></body></html>')
+        if not self.server.use_ticket(cookies.get(TICKET_COOKIE)):
+            return self._send(302, '', [('Location', '/login')])
+
+        session_id, client, new_session = self._client(cookies)
+        status, text = self.server.site.respond(method, self.path, form, client)
+        with self.server.lock:
+            self.server.request_counts[classify_request(method, self.path, form)] += 1
+
+        headers = [('Set-Cookie', f"{SESSION_COOKIE}={session_id}; path=/; HttpOnly")] if new_session else []
+        self._send(status, text, headers)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, site=None, latency=0.0, jitter=0.0, verbose=False,
+                 error_rate=0.0, ticket_budget=None):
+        """
+        latency和jitter的单位为秒：每个请求延迟 latency + [0, jitter) 秒后再响应
+        error_rate：返回503的比例；ticket_budget：每个VPN票据可用的请求次数，None为不检查票据
+        """
+        super().__init__((host, port), StandInHandler)
+        self.site = site or SyntheticSite()
+        self.latency = latency
+        self.jitter = jitter
+        self.verbose = verbose
+        self.error_rate = error_rate
+        self.ticket_budget = ticket_budget
+        self.ticket_usage = Counter()
+        self.clients = {}
+        self.request_counts = Counter()
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def wait(self):
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def use_ticket(self, ticket):
+        """
+        消耗票据的一次请求额度，票据缺失或额度用完时返回False
+        """
+        if self.ticket_budget is None:
+            return True
+        if not ticket:
+            return False
+        with self.lock:
+            self.ticket_usage[ticket] += 1
+            return self.ticket_usage[ticket] <= self.ticket_budget
+
+    def start(self):
+        """
+        在后台线程中运行，返回可以作为base_url使用的地址
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="电费查询系统的本地模拟服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0, help="每个请求的固定延迟（毫秒）")
+    parser.add_argument('--jitter', type=float, default=0, help="每个请求额外的随机延迟上限（毫秒）")
+    parser.add_argument('--rows-per-page', type=int, default=10, help="gvElecInfo每页的记录数")
+    parser.add_argument('--pages', type=int, help="每个月固定的分页数，指定时覆盖 --rows-per-page")
+    parser.add_argument('--buildings', type=int, default=5, help="每个社区的楼栋数")
+    parser.add_argument('--rooms', type=int, default=120, help="每栋楼的房间数")
+    parser.add_argument('--viewstate-size', type=int, default=6000, help="__VIEWSTATE的大小（字节）")
+    parser.add_argument('--error-rate', type=float, default=0, help="随机返回503的比例，例如0.05")
+    parser.add_argument('--ticket-budget', type=int, help="每个VPN票据可用的请求次数，用完后跳转到登录页面")
+    parser.add_argument('--verbose', action='store_true', help="打印每个请求")
+    args = parser.parse_args()
+
+    rooms = [f"{index // 20 + 1}{index % 20 + 1:02d}" for index in range(args.rooms)]
+    site = SyntheticSite(buildings=[str(number) for number in range(1, args.buildings + 1)], rooms=rooms,
+                         rows_per_page=args.rows_per_page, viewstate_size=args.viewstate_size,
+                         pages_per_month=args.pages)
+    server = StandInServer(args.host, args.port, site, args.latency / 1000, args.jitter / 1000, args.verbose,
+                           args.error_rate, args.ticket_budget)
+
+    print(f"✅ 本地模拟服务已启动：{server.url}")
+    print(f"使用方法：python electricity_cli.py --base-url {server.url}")
+    print("按Ctrl+C停止")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("\n请求统计：")
+        for step, count in server.request_counts.most_common():
+            print(f"  {step:<12}{count}")
+
+
+if __name__ == '__main__':
+    main()
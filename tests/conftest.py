@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+测试共用的夹具：在后台线程中运行stand_in_server.py模拟的电费查询系统，不访问真实的webvpn
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from site_fixtures import SyntheticSite  # noqa: E402
+from stand_in_server import StandInServer  # noqa: E402
+
+# 测试查询的房间和日期范围（跨年，每个月分成多页）
+CAMPUS = '校本部'
+COMMUNITY = 'A区'
+BUILDING = '1'
+ROOM = '101'
+START_DATE = '2024-11'
+END_DATE = '2025-02'
+
+
+def start_server(**kwargs):
+    kwargs.setdefault('site', SyntheticSite(pages_per_month=3))
+    server = StandInServer(**kwargs)
+    server.start()
+    return server
+
+
+@pytest.fixture
+def stand_in():
+    server = start_server()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def make_stand_in():
+    """
+    按参数启动模拟服务（例如error_rate、ticket_budget），测试结束后全部关闭
+    """
+    servers = []
+
+    def make(**kwargs):
+        server = start_server(**kwargs)
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.stop()
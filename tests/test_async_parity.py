@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+同步和异步客户端对同一个房间的查询结果必须完全一致
+"""
+
+import asyncio
+import threading
+
+from async_query import AsyncElectricityQuery, query_rooms
+from conftest import BUILDING, CAMPUS, COMMUNITY, END_DATE, ROOM, START_DATE
+from electricity_cli import ElectricityQuery, month_form
+from record_store import RecordStore
+
+
+def sync_result(base_url, room=ROOM):
+    eq = ElectricityQuery(base_url=base_url)
+    eq.prefetch_depth = 0
+    return eq.query_room(CAMPUS, COMMUNITY, BUILDING, room, '111', START_DATE, END_DATE)
+
+
+async def async_result(base_url, room=ROOM):
+    async with AsyncElectricityQuery(base_url=base_url) as eq:
+        return await eq.query_room(CAMPUS, COMMUNITY, BUILDING, room, '111', START_DATE, END_DATE)
+
+
+def test_async_matches_sync(stand_in):
+    expected = sync_result(stand_in.url)
+    actual = asyncio.run(async_result(stand_in.url))
+
+    assert expected is not None and actual is not None
+    assert expected['records']
+    assert actual['records'] == expected['records']
+    assert actual['headers'] == expected['headers']
+    assert actual['total_electricity'] == expected['total_electricity']
+
+
+def test_async_rooms_are_not_mixed(stand_in):
+    rooms = [{'campus': CAMPUS, 'community': COMMUNITY, 'building': BUILDING, 'room': room}
+             for room in ('101', '102', '203')]
+    results = asyncio.run(query_rooms(None, rooms, START_DATE, END_DATE, concurrency=3, base_url=stand_in.url))
+
+    assert len(results) == 3
+    for room, result, error in results:
+        assert error is None
+        assert result['records'] == sync_result(stand_in.url, room['room'])['records']
+
+
+def test_postback_without_session_is_rejected(stand_in):
+    # 没有会话cookie的回发不能退回到其他房间的数据
+    eq = ElectricityQuery(base_url=stand_in.url)
+    eq.prefetch_depth = 0
+    info_page = eq.open_room(CAMPUS, COMMUNITY, BUILDING, ROOM, '111')
+    assert info_page is not None
+    eq.session.cookies.clear()
+
+    response = eq.session.post(stand_in.url + 'HouseElec.aspx', data=month_form(info_page.form_state, 2025, 1))
+    assert response.status_code == 403
+
+
+class ThreadRecordingStore(RecordStore):
+    """
+    记录每次读写存储时所在的线程
+    """
+
+    def __init__(self, db_path):
+        super().__init__(db_path)
+        self.threads = set()
+
+    def is_month_closed(self, *args, **kwargs):
+        self.threads.add(threading.get_ident())
+        return super().is_month_closed(*args, **kwargs)
+
+    def load_month(self, *args, **kwargs):
+        self.threads.add(threading.get_ident())
+        return super().load_month(*args, **kwargs)
+
+    def save_month(self, *args, **kwargs):
+        self.threads.add(threading.get_ident())
+        return super().save_month(*args, **kwargs)
+
+
+def test_store_io_runs_off_the_event_loop(stand_in, tmp_path):
+    expected = sync_result(stand_in.url)
+
+    async def run(store):
+        loop_thread = threading.get_ident()
+        async with AsyncElectricityQuery(base_url=stand_in.url, store=store) as eq:
+            result = await eq.query_room(CAMPUS, COMMUNITY, BUILDING, ROOM, '111', START_DATE, END_DATE)
+        return loop_thread, result
+
+    with ThreadRecordingStore(str(tmp_path / 'records.db')) as store:
+        # 第一次从服务器查询并保存，第二次已结束的月份全部从本地存储读取
+        for _ in range(2):
+            store.threads.clear()
+            loop_thread, result = asyncio.run(run(store))
+            assert result['records'] == expected['records']
+            assert store.threads and loop_thread not in store.threads
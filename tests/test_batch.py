@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+批量查询无人值守运行：需要初次设置的房间直接失败，没有VPN cookie时按配置错误退出，都不等待用户操作
+"""
+
+import webbrowser
+
+from batch_query import EXIT_CONFIG, BatchQuery, make_room, run_batch
+from conftest import BUILDING, COMMUNITY, END_DATE, START_DATE
+import vpn_access
+from site_fixtures import SyntheticSite
+
+
+def test_first_use_setup_fails_without_prompting(make_stand_in, monkeypatch):
+    server = make_stand_in(site=SyntheticSite(pages_per_month=2, setup_rooms=['102']))
+
+    # 查询中的异常会被捕获，所以只记录调用，最后再检查
+    prompts = []
+
+    def unexpected(*args, **kwargs):
+        prompts.append(args)
+        return ''
+
+    monkeypatch.setattr('builtins.input', unexpected)
+    monkeypatch.setattr(webbrowser, 'open', unexpected)
+
+    rooms = [dict(make_room(COMMUNITY, BUILDING, room), start=START_DATE) for room in ('101', '102')]
+    summaries = run_batch(BatchQuery(None, max_workers=2, base_url=server.url), rooms, END_DATE)
+
+    assert [summary['status'] for summary in summaries] == ['ok', 'failed']
+    assert summaries[1]['records'] == 0
+    assert prompts == []
+
+
+def test_vpn_access_config_without_cookie_exits_with_config_error(tmp_path, monkeypatch):
+
+    config_path = tmp_path / 'rooms.json'
+    config_path.write_text('{"rooms": [{"community": "A区", "building": "1", "room": "101", "start": "2025-01"}]}',
+                           encoding='utf-8')
+    # 工作目录中没有vpn_cookie.json，也不能弹出扫码登录
+    monkeypatch.chdir(tmp_path)
+    logins = []
+    monkeypatch.setattr(vpn_access, 'get_vpn_cookie', lambda: logins.append(1))
+
+    assert vpn_access.run_config(str(config_path), str(tmp_path / 'summary.json')) == EXIT_CONFIG
+    assert logins == []
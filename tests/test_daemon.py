@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+守护进程：VPN会话失效时不等待扫码登录，按退避间隔再检查
+"""
+
+import daemon
+from daemon import PollingDaemon
+from record_store import RecordStore
+
+
+def test_expired_session_backs_off_without_login(stand_in, tmp_path, monkeypatch):
+    config = {'rooms': [{'community': 'A区', 'building': '1', 'room': '101'}], 'base_url': stand_in.url,
+              'keepalive_minutes': 1, 'status_file': str(tmp_path / 'status.json'),
+              'topology_file': str(tmp_path / 'topology.json')}
+    with RecordStore(str(tmp_path / 'records.db')) as store:
+        polling = PollingDaemon(config, None, store, session_path=str(tmp_path / 'session.json'))
+        assert polling.relogin is None
+
+        monkeypatch.setattr(polling.control, 'check_session', lambda: False)
+        logins = []
+        monkeypatch.setattr(daemon.ElectricityQuery, 'get_vpn_cookie', lambda self: logins.append(1))
+
+        assert not polling.keepalive()
+        assert polling.keepalive_delay() == 120
+        assert not polling.keepalive()
+        assert polling.keepalive_delay() == 240
+        assert logins == []
+
+        monkeypatch.setattr(polling.control, 'check_session', lambda: True)
+        assert polling.keepalive()
+        assert polling.keepalive_delay() == 60
+
+
+def test_stored_readings_counts_only_polled_months(tmp_path):
+    with RecordStore(str(tmp_path / 'records.db')) as store:
+        for month in (10, 11, 12):
+            records = [[f"2024-{month:02d}-{day:02d}", '1', '2', '3.5', '4'] for day in range(1, 6)]
+            store.save_month('room', 2024, month, ['日期'], records)
+        polling = PollingDaemon({'rooms': []}, None, store, session_path=str(tmp_path / 'session.json'))
+
+        assert polling.stored_readings('room', '2024-11', '2025-01') == 10
+        assert store.count_records('room') == 15
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+重复记录不计入总用电量；配置中重复的房间各自得到完整的结果，导出文件中只出现一次
+"""
+
+import csv
+
+from batch_query import BatchQuery, make_room, run_batch
+from conftest import BUILDING, CAMPUS, COMMUNITY, END_DATE, ROOM, START_DATE
+from electricity_cli import ElectricityQuery
+from exporters import open_exporter
+
+
+def query(base_url, start_date=START_DATE, end_date=END_DATE):
+    eq = ElectricityQuery(base_url=base_url)
+    return eq.query_room(CAMPUS, COMMUNITY, BUILDING, ROOM, '111', start_date, end_date)
+
+
+def test_repeated_pages_are_counted_once(stand_in):
+    expected = query(stand_in.url)
+
+    eq = ElectricityQuery(base_url=stand_in.url)
+    iter_month_pages = eq._iter_month_pages
+
+    # 分页异常：每一页都出现两次
+    def doubled(*args, **kwargs):
+        for batch in iter_month_pages(*args, **kwargs):
+            yield batch
+            yield batch
+
+    eq._iter_month_pages = doubled
+    result = eq.query_room(CAMPUS, COMMUNITY, BUILDING, ROOM, '111', START_DATE, END_DATE)
+
+    assert result['records'] == expected['records']
+    assert result['total_electricity'] == expected['total_electricity']
+
+
+def test_repeated_room_entries_keep_their_totals(stand_in, tmp_path):
+    full = query(stand_in.url)
+    tail = query(stand_in.url, '2025-01', END_DATE)
+    export_path = tmp_path / 'records.csv'
+    exporter = open_exporter(str(export_path))
+
+    rooms = [dict(make_room(COMMUNITY, BUILDING, ROOM), start=START_DATE),
+             dict(make_room(COMMUNITY, BUILDING, ROOM), start=START_DATE),
+             dict(make_room(COMMUNITY, BUILDING, ROOM), start='2025-01')]
+    batch = BatchQuery(None, max_workers=2, base_url=stand_in.url, exporter=exporter)
+    summaries = run_batch(batch, rooms, END_DATE)
+    exporter.close()
+
+    for summary, expected in zip(summaries, [full, full, tail]):
+        assert summary['status'] == 'ok'
+        assert summary['records'] == len(expected['records'])
+        assert summary['total_electricity'] == round(expected['total_electricity'], 2)
+
+    # 导出文件中重叠的读数只出现一次（多个线程写入，顺序不固定）
+    with open(export_path, encoding='utf-8-sig', newline='') as f:
+        rows = list(csv.reader(f))[1:]
+    assert sorted(row[1:] for row in rows) == sorted(full['records'])
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+导出器逐批写入的结果与一次写入全部记录相同；比第一批更宽的记录被截断时给出警告
+"""
+
+import csv
+
+import numpy as np
+
+from conftest import END_DATE, START_DATE
+from exporters import CsvExporter, NpzExporter, load_npz
+from record_store import month_range
+from site_fixtures import GRID_HEADERS, SyntheticSite
+
+
+def sample_batches():
+    site = SyntheticSite()
+    # 房间名长度不同，各行组字符串列的宽度也不同
+    for room in ('101', '校本部/A区/1/102'):
+        for year, month in month_range(START_DATE, END_DATE):
+            yield room, site.month_records(room, year, month)
+
+
+def test_npz_row_groups_match_single_write(tmp_path):
+    streamed = NpzExporter(str(tmp_path / 'streamed.npz'), row_group_size=7)
+    single = NpzExporter(str(tmp_path / 'single.npz'), row_group_size=10 ** 6)
+    for room, records in sample_batches():
+        streamed.write_batch(GRID_HEADERS, records, room)
+        single.write_batch(GRID_HEADERS, records, room)
+    streamed.close()
+    single.close()
+
+    names, columns = load_npz(streamed.path)
+    expected_names, expected = load_npz(single.path)
+    assert names == expected_names
+    assert len(columns[names[0]]) == streamed.count
+    for name in names:
+        assert columns[name].dtype == expected[name].dtype
+        np.testing.assert_array_equal(columns[name], expected[name])
+    assert columns['日期'].dtype == np.dtype('datetime64[D]')
+    assert set(columns['房间']) == {'101', '校本部/A区/1/102'}
+
+
+def test_wider_records_are_reported(tmp_path, capsys):
+    exporter = CsvExporter(str(tmp_path / 'records.csv'))
+    records = SyntheticSite().month_records('101', 2025, 1)
+    exporter.write_batch(GRID_HEADERS, records[:3], '101')
+    # 末尾的空单元格不算多出的列
+    exporter.write_batch(GRID_HEADERS, [record + [' '] for record in records[3:5]], '101')
+    assert exporter.truncated == 0
+
+    exporter.write_batch(GRID_HEADERS, [record + ['extra'] for record in records[5:7]], '101')
+    exporter.close()
+
+    assert exporter.truncated == 2
+    assert '多出的列' in capsys.readouterr().out
+    with open(exporter.path, encoding='utf-8-sig', newline='') as f:
+        rows = list(csv.reader(f))
+    assert len(rows) == 8 and all(len(row) == len(rows[0]) for row in rows)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+各解析后端对同一页面的结果必须与bs4一致，隐藏字段的type不区分大小写
+"""
+
+import pytest
+
+import page_parsers
+from conftest import BUILDING, CAMPUS, COMMUNITY, END_DATE, ROOM, START_DATE
+from electricity_cli import ElectricityQuery
+from page_model import extract_hidden_fields
+from page_parsers import available_parsers, parse_page
+from site_fixtures import SyntheticSite
+
+PARSERS = available_parsers()
+
+MIXED_CASE_PAGE = """<html><body><form>
+<INPUT TYPE="HIDDEN" NAME="__VIEWSTATE" VALUE="abc" />
+<input type="Hidden" name="__EVENTVALIDATION" value="def">
+<input type="text" name="txtRoom" value="101">
+</form></body></html>"""
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_pages_match_bs4(parser):
+    for step, text in SyntheticSite(pages_per_month=3).step_pages():
+        assert parse_page(text, parser) == parse_page(text, 'bs4'), step
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_hidden_type_is_case_insensitive(parser):
+    expected = {'__VIEWSTATE': 'abc', '__EVENTVALIDATION': 'def'}
+    assert extract_hidden_fields(MIXED_CASE_PAGE) == expected
+    assert parse_page(MIXED_CASE_PAGE, parser).hidden_fields == expected
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_query_results_match_across_parsers(stand_in, monkeypatch, parser):
+    def query():
+        eq = ElectricityQuery(base_url=stand_in.url)
+        eq.prefetch_depth = 0
+        return eq.query_room(CAMPUS, COMMUNITY, BUILDING, ROOM, '111', START_DATE, END_DATE)
+
+    monkeypatch.setattr(page_parsers, '_default_parser', 'bs4')
+    expected = query()
+    monkeypatch.setattr(page_parsers, '_default_parser', parser)
+    actual = query()
+
+    assert expected['records']
+    assert actual['records'] == expected['records']
+    assert actual['headers'] == expected['headers']
+    assert actual['total_electricity'] == expected['total_electricity']
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+内存峰值只统计单个线程中的最外层阶段，嵌套和多线程同时进行的阶段不统计
+"""
+
+import threading
+
+from profiling import Profiler
+
+ALLOCATION = 2 * 1024 * 1024
+
+
+def test_top_level_phase_reports_peak():
+    profiler = Profiler().start()
+    try:
+        with profiler.phase('outer'):
+            buffer = bytearray(ALLOCATION)
+            del buffer
+            with profiler.phase('inner'):
+                pass
+    finally:
+        profiler.stop()
+
+    phases = profiler.to_dict()['phases']
+    assert phases['outer']['memory_peak_bytes'] >= ALLOCATION
+    assert phases['inner']['memory_peak_bytes'] is None
+    assert phases['inner']['count'] == 1
+
+
+def test_overlapping_threads_report_no_peak():
+    profiler = Profiler().start()
+    entered = threading.Barrier(2)
+
+    def work(name):
+        with profiler.phase(name):
+            entered.wait()
+            bytearray(ALLOCATION)
+            entered.wait()
+
+    threads = [threading.Thread(target=work, args=(name,)) for name in ('a', 'b')]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 其他线程结束之后的阶段重新统计内存峰值
+        with profiler.phase('after'):
+            bytearray(ALLOCATION)
+    finally:
+        profiler.stop()
+
+    phases = profiler.to_dict()['phases']
+    assert phases['a']['memory_peak_bytes'] is None
+    assert phases['b']['memory_peak_bytes'] is None
+    assert phases['after']['memory_peak_bytes'] >= ALLOCATION
+
+
+def test_merge_keeps_unmeasured_phases():
+    profiler = Profiler(trace_memory=False)
+    with profiler.phase('page'):
+        pass
+    merged = Profiler(trace_memory=False)
+    merged.merge(profiler.snapshot())
+    merged.merge(profiler.snapshot())
+    assert merged.to_dict()['phases']['page']['count'] == 2
+    assert merged.to_dict()['phases']['page']['memory_peak_bytes'] is None
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+请求失败重试和票据失效后的续查：结果必须与一次顺利的查询完全一致
+"""
+
+import itertools
+import json
+import random
+
+import pytest
+
+from conftest import BUILDING, CAMPUS, COMMUNITY, END_DATE, ROOM, START_DATE
+from electricity_cli import ElectricityQuery
+from resilience import RetryPolicy
+from stand_in_server import TICKET_COOKIE
+
+
+def ticket_cookie(ticket):
+    return json.dumps({TICKET_COOKIE: ticket})
+
+
+def query(base_url, **kwargs):
+    kwargs.setdefault('retry_policy', RetryPolicy(max_attempts=8, base_delay=0.001, max_delay=0.01, max_resumes=10))
+    eq = ElectricityQuery(base_url=base_url, **kwargs)
+    eq.prefetch_depth = 0
+    return eq.query_room(CAMPUS, COMMUNITY, BUILDING, ROOM, '111', START_DATE, END_DATE)
+
+
+def test_retries_server_errors(stand_in, make_stand_in):
+    expected = query(stand_in.url)
+    random.seed(2024)
+    flaky = make_stand_in(error_rate=0.2)
+    actual = query(flaky.url)
+
+    assert expected['records']
+    assert actual['records'] == expected['records']
+    assert actual['total_electricity'] == expected['total_electricity']
+
+
+def test_resumes_after_ticket_expires(stand_in, make_stand_in):
+    expected = query(stand_in.url)
+    server = make_stand_in(ticket_budget=15)
+    tickets = itertools.count(1)
+    logins = []
+
+    def relogin():
+        logins.append(1)
+        return ticket_cookie(f"ticket-{next(tickets)}")
+
+    actual = query(server.url, vpn_cookie=ticket_cookie('ticket-0'), relogin=relogin)
+
+    assert logins
+    assert actual['records'] == expected['records']
+    assert actual['headers'] == expected['headers']
+    assert actual['total_electricity'] == expected['total_electricity']
+
+
+def test_expired_ticket_without_relogin_fails(make_stand_in):
+    server = make_stand_in(ticket_budget=15)
+    assert query(server.url, vpn_cookie=ticket_cookie('ticket-0')) is None
+
+
+@pytest.mark.parametrize('kwargs', [{'max_attempts': 0}, {'max_attempts': -1}, {'max_resumes': -1}])
+def test_retry_policy_rejects_invalid_limits(kwargs):
+    with pytest.raises(ValueError):
+        RetryPolicy(**kwargs)
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+VPN会话文件保存为JSON，加载时不会反序列化任意对象
+"""
+
+import json
+import pickle
+
+from electricity_cli import ElectricityQuery
+
+
+def test_session_round_trip(tmp_path):
+    path = str(tmp_path / 'vpn_session.json')
+    eq = ElectricityQuery()
+    eq.session.cookies.set('wengine_vpn_ticketwebvpn_ujs_edu_cn', 'abc123')
+    eq.ticket_obtained_at = 1700000000.0
+    eq.save_session(path)
+
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f)['cookies'] == {'wengine_vpn_ticketwebvpn_ujs_edu_cn': 'abc123'}
+
+    restored = ElectricityQuery()
+    assert restored.load_session(path)
+    assert restored.session.cookies.get('wengine_vpn_ticketwebvpn_ujs_edu_cn') == 'abc123'
+    assert restored.ticket_obtained_at == 1700000000.0
+
+
+def test_pickled_session_is_not_loaded(tmp_path):
+    path = tmp_path / 'vpn_session.json'
+    path.write_bytes(pickle.dumps({'cookies': {'ticket': 'x'}, 'headers': {}}))
+    assert not ElectricityQuery().load_session(str(path))
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+分片遍历：同一分片中房间号相同的条目各自得到自己的结果，导出文件按房间顺序写入
+"""
+
+import csv
+import multiprocessing
+import threading
+
+from batch_query import make_room
+from conftest import BUILDING, CAMPUS, COMMUNITY, END_DATE, START_DATE
+from electricity_cli import ElectricityQuery
+from exporters import open_exporter
+from record_store import RecordStore
+from sharded_sweep import shards_from_rooms, sweep
+
+
+def query(base_url, room, start_date):
+    eq = ElectricityQuery(base_url=base_url)
+    return eq.query_room(CAMPUS, COMMUNITY, BUILDING, room, '111', start_date, END_DATE)
+
+
+def test_sweep_keeps_repeated_room_entries_apart(stand_in, tmp_path):
+    rooms = [dict(make_room(COMMUNITY, BUILDING, '101'), start=START_DATE),
+             dict(make_room(COMMUNITY, BUILDING, '101'), start='2025-01'),
+             dict(make_room(COMMUNITY, BUILDING, '102'), start=START_DATE)]
+    shards = shards_from_rooms(rooms)
+    assert len(shards) == 1
+    export_path = tmp_path / 'sweep.csv'
+    exporter = open_exporter(str(export_path))
+
+    results = list(sweep(shards, None, START_DATE, END_DATE, processes=1, threads=2, base_url=stand_in.url,
+                         exporter=exporter))
+    exporter.close()
+
+    summaries = [summary for _, shard_summaries in results for summary in shard_summaries]
+    expected = {(summary_room['room'], summary_room['start']): query(stand_in.url, summary_room['room'],
+                                                                     summary_room['start'])
+                for summary_room in rooms}
+    assert len(summaries) == 3
+    for room, summary in zip(shards[0].rooms, summaries):
+        result = expected[(room['room'], room['start'])]
+        assert summary['status'] == 'ok'
+        assert summary['start'] == room['start']
+        assert summary['records'] == len(result['records'])
+        assert summary['total_electricity'] == round(result['total_electricity'], 2)
+
+    # 重复条目重叠的读数只导出一次，房间按顺序写入
+    with open(export_path, encoding='utf-8-sig', newline='') as f:
+        rows = list(csv.reader(f))[1:]
+    expected_rows = ([['校本部/A区/1/101'] + record for record in expected[('101', START_DATE)]['records']] +
+                     [['校本部/A区/1/102'] + record for record in expected[('102', START_DATE)]['records']])
+    assert rows == expected_rows
+
+
+def write_months(db_path, worker):
+    # 每个工作进程中的多个线程共用一个存储，与sweep_shard相同
+    with RecordStore(db_path) as store:
+        def write(thread):
+            for month in range(1, 13):
+                room = f"{worker}/{thread}"
+                records = [[f"2024-{month:02d}-{day:02d}", '1', '2', '3.5', '4'] for day in range(1, 29)]
+                store.save_month(room, 2024, month, ['日期'], records)
+                store.merge_month(room, 2024, month, [], records[:5])
+        threads = [threading.Thread(target=write, args=(thread,)) for thread in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+
+def test_store_accepts_concurrent_writers(tmp_path):
+    db_path = str(tmp_path / 'records.db')
+    RecordStore(db_path).close()
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=write_months, args=(db_path, worker)) for worker in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert [worker.exitcode for worker in workers] == [0] * 4
+    with RecordStore(db_path) as store:
+        assert store.conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        assert store.count_records('3/2') == 12 * 28
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+跳过内容未变化的页面时，结果、总用电量和表头仍然完整，与不跳过时相同
+"""
+
+from datetime import datetime
+
+from conftest import BUILDING, CAMPUS, COMMUNITY, ROOM
+from electricity_cli import ElectricityQuery
+from metrics import RequestMetrics
+from record_store import RecordStore
+from site_fixtures import GRID_HEADERS, SyntheticSite
+
+
+class GrowingSite(SyntheticSite):
+    """
+    当前月份只显示前visible_days天的记录，模拟两次抓取之间新增的读数
+    """
+
+    visible_days = 25
+
+    def month_records(self, room, year, month):
+        records = super().month_records(room, year, month)
+        now = datetime.now()
+        if (year, month) == (now.year, now.month):
+            return records[:self.visible_days]
+        return records
+
+
+def query(base_url, store=None, skip_unchanged=False, metrics=None):
+    eq = ElectricityQuery(store=store, base_url=base_url, metrics=metrics)
+    eq.skip_unchanged = skip_unchanged
+    month = datetime.now().strftime('%Y-%m')
+    return eq.query_room(CAMPUS, COMMUNITY, BUILDING, ROOM, '111', month, month)
+
+
+def test_unchanged_pages_are_replayed_from_store(make_stand_in, tmp_path):
+    site = GrowingSite(rows_per_page=10)
+    server = make_stand_in(site=site)
+    store = RecordStore(str(tmp_path / 'records.db'))
+
+    first = query(server.url, store)
+    assert len(first['records']) == 25
+
+    # 前两页（包括表头所在的第一页）与上次相同，第三页有变化，第四页是新的
+    site.visible_days = 31
+    metrics = RequestMetrics()
+    second = query(server.url, store, skip_unchanged=True, metrics=metrics)
+    expected = query(server.url)
+
+    unchanged = sum(step['unchanged'] for step in metrics.to_dict()['steps'].values())
+    assert unchanged == 2
+    assert second['headers'] == GRID_HEADERS
+    assert second['records'] == expected['records']
+    assert second['total_electricity'] == expected['total_electricity']
+
+    # 本地存储中的记录也完整
+    now = datetime.now()
+    room_key = f"{CAMPUS}/{COMMUNITY}/{BUILDING}/{ROOM}"
+    assert store.load_month(room_key, now.year, now.month) == (GRID_HEADERS, expected['records'])
+    store.close()
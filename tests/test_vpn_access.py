@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+vpn_access的回发使用所选的校区、社区和楼栋；没有进入用电信息页面的房间在配置模式中记为失败
+"""
+
+import csv
+import json
+
+import vpn_access
+from conftest import END_DATE, START_DATE
+from electricity_cli import ElectricityQuery
+from site_fixtures import FixtureSession, SyntheticSite
+
+VPN_URL = "https://webvpn.ujs.edu.cn/http/77726476706e69737468656265737421f8e6429b3e296c1e6b029ae29d51367b6885/"
+
+CAMPUSES = ['校本部', '京口校区']
+
+
+def make_site(**kwargs):
+    return SyntheticSite(campuses=CAMPUSES, pages_per_month=2, **kwargs)
+
+
+def run_config(tmp_path, monkeypatch, site, rooms):
+    config_path = tmp_path / 'rooms.json'
+    config_path.write_text(json.dumps({'rooms': rooms, 'start': START_DATE, 'end': END_DATE}, ensure_ascii=False),
+                           encoding='utf-8')
+    summary_path = tmp_path / 'summary.json'
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(vpn_access, 'get_session', lambda *args, **kwargs: FixtureSession(site, VPN_URL))
+    code = vpn_access.run_config(str(config_path), str(summary_path))
+    return code, json.loads(summary_path.read_text(encoding='utf-8'))
+
+
+def test_postbacks_use_selected_campus_community_and_building(tmp_path, monkeypatch):
+    site = make_site()
+    room = {'campus': '京口校区', 'community': 'D区', 'building': '3', 'room': '205'}
+    code, summary = run_config(tmp_path, monkeypatch, site, [room])
+
+    assert code == 0
+    [entry] = summary['rooms']
+    assert entry['status'] == 'ok'
+    with open(entry['csv'], encoding='utf-8-sig', newline='') as f:
+        rows = [row[1:] for row in list(csv.reader(f))[1:]]
+
+    eq = ElectricityQuery()
+    eq.session = FixtureSession(site)
+    eq.base_url = eq.session.base_url
+    eq.prefetch_depth = 0
+    expected = eq.query_room(room['campus'], room['community'], room['building'], room['room'], '111',
+                             START_DATE, END_DATE)
+    assert rows and rows == expected['records']
+    assert entry['records'] == len(rows)
+
+
+def test_room_without_frameset_is_reported_as_failed(tmp_path, monkeypatch):
+    site = make_site(setup_rooms=['102'])
+    rooms = [{'community': 'A区', 'building': '1', 'room': room} for room in ('101', '102')]
+    code, summary = run_config(tmp_path, monkeypatch, site, rooms)
+
+    assert code == 1
+    ok, failed = summary['rooms']
+    assert ok['status'] == 'ok' and ok['records'] > 0
+    assert failed['status'] == 'failed'
+    assert failed['csv'] is None
+    assert summary['failed'] == 1
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+宿舍拓扑索引
+
+记录 校区/社区/楼栋 每一级选择后页面上的下拉框选项（名称 -> 表单值）和ASP.NET表单参数，
+保存到本地JSON文件。查询房间时从已缓存的最深一级页面开始，
+只补发缺少的postback；缓存未命中或服务器不接受时再按需刷新。
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+
+from page_model import Page
+
+DEFAULT_TOPOLOGY_PATH = "dorm_topology.json"
+
+# 每一级对应的下拉框名称：校区、社区、楼栋、房间
+LEVEL_SELECTS = ['ddlXiaoQu', 'ddlQuYu', 'ddlLouDong', 'ddlFangJian']
+
+
+def node_key(path):
+    return '/'.join(str(part).strip() for part in path)
+
+
+class TopologyIndex:
+    def __init__(self, path=DEFAULT_TOPOLOGY_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        # 节点键（例如 校本部/A区/1）-> {'value': 表单值, 'hidden_fields': {...}, 'options': {...}}
+        self.nodes = {}
+        self.dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.nodes = json.load(f).get('nodes', {})
+            except Exception as e:
+                print(f"\n⚠️ 加载拓扑索引失败：{str(e)}")
+                self.nodes = {}
+
+    def save(self):
+        """
+        有变化时写回JSON文件
+        """
+        if not self.path or not self.dirty:
+            return
+        with self.lock:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'updated_at': datetime.now().isoformat(timespec='seconds'),
+                           'nodes': self.nodes}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+
+    def lookup(self, path):
+        """
+        返回某一级节点的缓存，不存在时返回None
+        """
+        return self.nodes.get(node_key(path))
+
+    def value(self, path):
+        """
+        返回路径最后一级名称对应的表单值，未缓存时返回None
+        """
+        if len(path) == 1:
+            node = self.lookup(path)
+            return node['value'] if node else None
+        parent = self.lookup(path[:-1])
+        if not parent:
+            return None
+        return parent['options'].get(LEVEL_SELECTS[len(path) - 1], {}).get(str(path[-1]).strip())
+
+    def children(self, path):
+        """
+        返回某一级节点下一级的所有名称，例如某个楼栋下的所有房间号
+        """
+        node = self.lookup(path)
+        if not node:
+            return []
+        return list(node['options'].get(LEVEL_SELECTS[len(path)], {}))
+
+    def record(self, path, value, page):
+        """
+        记录选择某一级之后得到的页面
+        """
+        with self.lock:
+            self.nodes[node_key(path)] = {
+                'value': value,
+                'hidden_fields': page.form_state or {},
+                'options': page.options,
+            }
+            self.dirty = True
+
+    def invalidate(self, path):
+        """
+        删除某一级节点及其所有下级节点
+        """
+        key = node_key(path)
+        with self.lock:
+            for existing in [k for k in self.nodes if k == key or k.startswith(key + '/')]:
+                del self.nodes[existing]
+                self.dirty = True
+
+    def resolve(self, path, room_number=None):
+        """
+        找出可以直接使用的最深一级缓存页面
+        返回(已完成的级数, 页面, 表单值)，没有可用缓存时返回(0, None, {})
+
+        楼栋页面中找不到目标房间时视为未命中，需要重新选择楼栋
+        """
+        form_values = {}
+        best = (0, None, {})
+        for depth in range(1, len(path) + 1):
+            node = self.lookup(path[:depth])
+            if not node or not node['hidden_fields']:
+                break
+            form_values = dict(form_values)
+            form_values[LEVEL_SELECTS[depth - 1]] = node['value']
+
+            if depth == len(path) and room_number is not None:
+                if str(room_number).strip() not in node['options'].get(LEVEL_SELECTS[depth], {}):
+                    break
+
+            best = (depth, Page.from_state(node['hidden_fields'], node['options']), form_values)
+        return best
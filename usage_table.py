@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+列式用电记录表
+
+查询结果中的记录是字符串列表（list[list[str]]），每次统计都要重新把字符串转换成数字。
+UsageTable把记录按列保存在定长数组中：日期保存为日序数（date.toordinal()），
+电表读数和日用电量保存为浮点数，房间标识只保存一次，每行只记录房间编号。
+其余列（序号、备注等）以驻留字符串保存，可以无损地还原成原来的表头/行格式。
+"""
+
+import math
+import sys
+from array import array
+from datetime import date
+from functools import lru_cache
+
+from record_store import DATE_PATTERN
+
+# 日用电量所在列，与total_usage等现有代码保持一致
+USAGE_COLUMN = 3
+
+READING_KEYWORDS = ('读数', '示数', '表底', '表码')
+DATE_KEYWORDS = ('日期', '时间')
+
+
+class RecordSchema:
+    """
+    根据gvElecInfo的表头确定日期、读数、日用电量所在的列
+    """
+
+    def __init__(self, headers, sample=None):
+        self.headers = list(headers)
+        self.usage_column = USAGE_COLUMN
+        self.date_column = self._find_column(DATE_KEYWORDS)
+        self.reading_column = self._find_column(READING_KEYWORDS)
+
+        if sample:
+            self.detect_date_column(sample)
+
+    def detect_date_column(self, sample):
+        """
+        表头中没有日期列时，用第一条记录中第一个像日期的单元格所在的列
+        """
+        if self.date_column is not None:
+            return
+        for index, cell in enumerate(sample):
+            if index != self.usage_column and DATE_PATTERN.search(cell):
+                self.date_column = index
+                return
+
+    def _find_column(self, keywords):
+        for index, header in enumerate(self.headers):
+            if index != self.usage_column and any(keyword in header for keyword in keywords):
+                return index
+        return None
+
+    @property
+    def typed_columns(self):
+        return {self.date_column, self.reading_column, self.usage_column} - {None}
+
+
+def parse_float(cell):
+    try:
+        return float(cell)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def decimal_places(cell):
+    """
+    数值单元格的小数位数，用于还原时保持原来的写法（'1.0'和'1'）
+    """
+    cell = cell.strip()
+    return len(cell) - cell.index('.') - 1 if '.' in cell else 0
+
+
+def format_float(value, places):
+    if value != value:
+        return ''
+    return f"{value:.{places}f}"
+
+
+def parse_day(cell):
+    """
+    把日期单元格转换成日序数，无法识别时返回0
+    """
+    match = DATE_PATTERN.search(cell or '')
+    if not match:
+        return 0
+    year, month, day = (int(part) for part in match.groups())
+    try:
+        return date(year, month, day).toordinal()
+    except ValueError:
+        return 0
+
+
+@lru_cache(maxsize=65536)
+def convert_day(cell):
+    """
+    日期单元格 -> (日序数, 0, 能否按原样还原)
+    同一天的日期在不同房间的记录中反复出现，解析结果按原文缓存
+    """
+    if cell is None:
+        return 0, 0, True
+    value = parse_day(cell)
+    restored = date.fromordinal(value).isoformat() if value else ''
+    return value, 0, restored == cell
+
+
+@lru_cache(maxsize=65536)
+def convert_float(cell):
+    """
+    数值单元格 -> (数值, 小数位数, 能否按原样还原)
+    """
+    if cell is None:
+        return math.nan, 0, True
+    value = parse_float(cell)
+    places = min(decimal_places(cell), 255) if value == value else 0
+    return value, places, format_float(value, places) == cell
+
+
+class UsageTable:
+    def __init__(self, headers=(), sample=None):
+        self.schema = RecordSchema(headers, sample)
+        # 房间标识只保存一次，每行保存它在rooms中的编号
+        self.rooms = []
+        self._room_ids = {}
+        self.room_ids = array('I')
+        self.days = array('i')
+        self.readings = array('d')
+        self.usage = array('d')
+        # 读数和日用电量的小数位数
+        self.reading_places = array('B')
+        self.usage_places = array('B')
+        # 其余列：列号 -> 驻留字符串列表
+        self.extra_columns = {}
+        self.widths = array('B')
+        # 无法按原样还原的日期/数值单元格：(行号, 列号) -> 原始文本
+        self.raw_cells = {}
+
+    @classmethod
+    def from_rows(cls, headers, rows, room=''):
+        """
+        从表头和字符串记录构建列式表
+        """
+        table = cls(headers, rows[0] if rows else None)
+        table.append_rows(rows, room)
+        return table
+
+    @classmethod
+    def from_result(cls, result, room=''):
+        """
+        从query_electricity/query_room的返回结果构建列式表
+        """
+        return cls.from_rows(result['headers'], result['records'], room)
+
+    def __len__(self):
+        return len(self.days)
+
+    def room_id(self, room):
+        room = sys.intern(str(room))
+        room_id = self._room_ids.get(room)
+        if room_id is None:
+            room_id = len(self.rooms)
+            self.rooms.append(room)
+            self._room_ids[room] = room_id
+        return room_id
+
+    def append_rows(self, rows, room=''):
+        """
+        追加一批字符串记录，所有记录属于同一个房间
+        """
+        schema = self.schema
+        if rows:
+            schema.detect_date_column(rows[0])
+
+        room_id = self.room_id(room)
+        typed_columns = schema.typed_columns
+        for record in rows:
+            row_index = len(self.days)
+            self.room_ids.append(room_id)
+            self.widths.append(len(record))
+            day, _, exact = self._typed_cell(record, schema.date_column, convert_day)
+            self.days.append(day)
+            if not exact:
+                self.raw_cells[(row_index, schema.date_column)] = record[schema.date_column]
+            reading, places, exact = self._typed_cell(record, schema.reading_column, convert_float)
+            self.readings.append(reading)
+            self.reading_places.append(places)
+            if not exact:
+                self.raw_cells[(row_index, schema.reading_column)] = record[schema.reading_column]
+            usage, places, exact = self._typed_cell(record, schema.usage_column, convert_float)
+            self.usage.append(usage)
+            self.usage_places.append(places)
+            if not exact:
+                self.raw_cells[(row_index, schema.usage_column)] = record[schema.usage_column]
+
+            for index, cell in enumerate(record):
+                if index in typed_columns:
+                    continue
+                column = self.extra_columns.get(index)
+                if column is None:
+                    column = self.extra_columns[index] = []
+                # 之前的记录比这一条短时补空位
+                column.extend([''] * (row_index - len(column)))
+                column.append(sys.intern(cell))
+
+    @staticmethod
+    def _typed_cell(record, column, convert):
+        if column is None or column >= len(record):
+            return convert(None)
+        return convert(record[column])
+
+    def extend(self, other):
+        """
+        合并另一张表头相同的列式表
+        """
+        id_map = [self.room_id(room) for room in other.rooms]
+        offset = len(self)
+        self.room_ids.extend(array('I', (id_map[room_id] for room_id in other.room_ids)))
+        self.days.extend(other.days)
+        self.readings.extend(other.readings)
+        self.usage.extend(other.usage)
+        self.reading_places.extend(other.reading_places)
+        self.usage_places.extend(other.usage_places)
+        self.widths.extend(other.widths)
+        for (row_index, column), cell in other.raw_cells.items():
+            self.raw_cells[(offset + row_index, column)] = cell
+        for index, column in other.extra_columns.items():
+            target = self.extra_columns.setdefault(index, [])
+            target.extend([''] * (offset - len(target)))
+            target.extend(column)
+
+    def total_usage(self, room=None):
+        """
+        日用电量合计，可以只统计某个房间
+        """
+        if room is None:
+            return math.fsum(value for value in self.usage if value == value)
+        room_id = self._room_ids.get(room)
+        if room_id is None:
+            return 0.0
+        return math.fsum(value for value, rid in zip(self.usage, self.room_ids)
+                         if rid == room_id and value == value)
+
+    def to_rows(self, room=None):
+        """
+        还原成(表头, 字符串记录列表)，可以只导出某个房间
+        """
+        schema = self.schema
+        room_id = self._room_ids.get(room) if room is not None else None
+        rows = []
+        for row_index in range(len(self)):
+            if room_id is not None and self.room_ids[row_index] != room_id:
+                continue
+            record = []
+            for index in range(self.widths[row_index]):
+                raw = self.raw_cells.get((row_index, index))
+                if raw is not None:
+                    record.append(raw)
+                elif index == schema.date_column:
+                    ordinal = self.days[row_index]
+                    record.append(date.fromordinal(ordinal).isoformat() if ordinal else '')
+                elif index == schema.reading_column:
+                    record.append(format_float(self.readings[row_index], self.reading_places[row_index]))
+                elif index == schema.usage_column:
+                    record.append(format_float(self.usage[row_index], self.usage_places[row_index]))
+                else:
+                    column = self.extra_columns.get(index, [])
+                    record.append(column[row_index] if row_index < len(column) else '')
+            rows.append(record)
+        return list(schema.headers), rows
+
+    def to_numpy(self):
+        """
+        以NumPy数组的形式返回各列（零拷贝），需要安装numpy
+        """
+        import numpy as np
+        return {
+            'room_id': np.frombuffer(self.room_ids, dtype=np.uint32) if len(self) else np.zeros(0, np.uint32),
+            'day': np.frombuffer(self.days, dtype=np.int32) if len(self) else np.zeros(0, np.int32),
+            'reading': np.frombuffer(self.readings, dtype=np.float64) if len(self) else np.zeros(0),
+            'usage': np.frombuffer(self.usage, dtype=np.float64) if len(self) else np.zeros(0),
+        }
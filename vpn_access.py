@@ -1,13 +1,12 @@
 import requests
 import os
-from bs4 import BeautifulSoup
+from dedup import DedupIndex
+from exporters import CsvExporter
+from http_pool import shared_pool
+from page_model import extract_hidden_fields
 import time
 import json
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.by import By
+import sys
 
 def get_vpn_cookie():
     """
@@ -18,6 +17,10 @@ def get_vpn_cookie():
     print("\n🔐 正在获取VPN登录cookie...")
     print("请使用企业微信扫码登录VPN")
     
+    # 只有需要扫码登录时才导入Selenium，复用vpn_cookie.json时无需加载
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    
     # 创建会话
     session = requests.Session()
     
@@ -159,10 +162,10 @@ def get_vpn_cookie():
         traceback.print_exc()
         return None
 
-def get_session():
-    # 尝试从文件中加载cookie
-    cookies = None
-    if os.path.exists('vpn_cookie.json'):
+def get_session(cookies=None, interactive=True):
+    # 传入cookie时直接使用，否则尝试从文件中加载cookie
+    # interactive为False时（按配置文件查询）不弹出扫码登录，没有cookie时返回None
+    if not cookies and os.path.exists('vpn_cookie.json'):
         try:
             with open('vpn_cookie.json', 'r', encoding='utf-8') as f:
                 cookies = json.load(f)
@@ -172,18 +175,11 @@ def get_session():
             cookies = None
     
     # 如果没有cookie文件或加载失败，自动获取cookie
-    if not cookies:
+    if not cookies and interactive:
         cookies = get_vpn_cookie()
-        if not cookies:
-            print("\n❌ 无法获取cookie，使用默认cookie值")
-            # 使用默认cookie值作为 fallback
-            cookies = {
-                'show_vpn': '1',
-                'show_fast': '0',
-                'heartbeat': '1',
-                'show_faq': '0',
-                'wengine_vpn_ticketwebvpn_ujs_edu_cn': '407b4646a249c8ed'  # 关键cookie值
-            }
+    if not cookies:
+        print("\n❌ 无法获取cookie")
+        return None
     
     # 从抓包文件中提取的请求头信息
     headers = {
@@ -205,7 +201,7 @@ def get_session():
         'Connection': 'keep-alive'
     }
     
-    session = requests.Session()
+    session = shared_pool().mount(requests.Session())
     session.cookies.update(cookies)
     session.headers.update(headers)
     
@@ -232,8 +228,10 @@ def get_electricity_page(session):
         print(f"访问失败：{str(e)}")
         return None
 
-def select_campus(session, response, campus_name):
-    # 选择校区
+def select_campus(session, response, campus_name, form_values=None):
+    # 选择校区，form_values记录已选择的下拉框值，之后的回发都带上这些值
+    # bs4只在解析页面时导入，import vpn_access不会加载它
+    from bs4 import BeautifulSoup
     print(f"\n正在选择校区：{campus_name}")
     
     try:
@@ -251,6 +249,9 @@ def select_campus(session, response, campus_name):
             '__EVENTVALIDATION': eventvalidation,
             'ddlXiaoQu': campus_name
         }
+        if form_values is not None:
+            form_values.clear()
+            form_values['ddlXiaoQu'] = campus_name
         
         # 发送POST请求，选择校区
         electricity_url = "https://webvpn.ujs.edu.cn/http/77726476706e69737468656265737421f8e6429b3e296c1e6b029ae29d51367b6885/"
@@ -277,8 +278,9 @@ def select_campus(session, response, campus_name):
         print(f"选择校区失败：{str(e)}")
         return None
 
-def select_community(session, response, community_name):
+def select_community(session, response, community_name, form_values=None):
     # 选择社区
+    from bs4 import BeautifulSoup
     print(f"\n正在选择社区：{community_name}")
     
     try:
@@ -313,13 +315,15 @@ def select_community(session, response, community_name):
             print("未找到社区选择下拉框")
             return None
         
-        # 构建表单数据
+        # 构建表单数据，带上已选择的校区
+        form_values = {} if form_values is None else form_values
+        form_values['ddlQuYu'] = community_value
         data = {
             '__EVENTTARGET': 'ddlQuYu',
             '__EVENTARGUMENT': '',
             '__VIEWSTATE': viewstate,
             '__EVENTVALIDATION': eventvalidation,
-            'ddlXiaoQu': '校本部',
+            'ddlXiaoQu': form_values.get('ddlXiaoQu', '校本部'),
             'ddlQuYu': community_value
         }
         
@@ -349,8 +353,9 @@ def select_community(session, response, community_name):
         traceback.print_exc()
         return None
 
-def select_building(session, response, building_number):
+def select_building(session, response, building_number, form_values=None):
     # 选择楼栋
+    from bs4 import BeautifulSoup
     print(f"\n正在选择楼栋：{building_number}")
     
     try:
@@ -385,14 +390,16 @@ def select_building(session, response, building_number):
             print("未找到楼栋选择下拉框")
             return None
         
-        # 构建表单数据
+        # 构建表单数据，带上已选择的校区和社区（社区值是下拉框中带空格填充的完整值）
+        form_values = {} if form_values is None else form_values
+        form_values['ddlLouDong'] = building_value
         data = {
             '__EVENTTARGET': 'ddlLouDong',
             '__EVENTARGUMENT': '',
             '__VIEWSTATE': viewstate,
             '__EVENTVALIDATION': eventvalidation,
-            'ddlXiaoQu': '校本部',
-            'ddlQuYu': 'A区                                               ',  # 使用完整的社区值
+            'ddlXiaoQu': form_values.get('ddlXiaoQu', '校本部'),
+            'ddlQuYu': form_values.get('ddlQuYu', ''),
             'ddlLouDong': building_value
         }
         
@@ -434,8 +441,10 @@ def select_building(session, response, building_number):
         traceback.print_exc()
         return None
 
-def query_electricity(session, response, room_number, password, start_date, end_date):
-    # 查询电费
+def query_electricity(session, response, room_number, password, start_date, end_date, csv_filename=None,
+                      form_values=None):
+    # 查询电费，返回写入CSV文件的记录数；没有进入用电信息页面（登录失败、没有框架页面或找不到'用电信息'链接）时返回None
+    from bs4 import BeautifulSoup
     print(f"\n正在查询房间 {room_number} 的电费")
     
     try:
@@ -487,13 +496,14 @@ def query_electricity(session, response, room_number, password, start_date, end_
             print("未找到房间选择下拉框")
             return None
         
-        # 构建表单数据
+        # 构建表单数据，校区、社区和楼栋使用之前选择的下拉框值
+        form_values = form_values or {}
         data = {
             '__VIEWSTATE': viewstate,
             '__EVENTVALIDATION': eventvalidation,
-            'ddlXiaoQu': '校本部',
-            'ddlQuYu': 'A区                                               ',  # 使用完整的社区值
-            'ddlLouDong': '1',  # 楼栋为1栋
+            'ddlXiaoQu': form_values.get('ddlXiaoQu', '校本部'),
+            'ddlQuYu': form_values.get('ddlQuYu', ''),
+            'ddlLouDong': form_values.get('ddlLouDong', ''),
             'ddlFangJian': room_value,
             'txtStuPwd': password,
             'btnEnter.x': '1',
@@ -520,6 +530,7 @@ def query_electricity(session, response, room_number, password, start_date, end_
         
         # 分析响应内容，提取电费信息
         soup = BeautifulSoup(response.text, 'html.parser')
+        result = None
         
         # 检查是否为框架页面
         frameset = soup.find('frameset')
@@ -624,12 +635,20 @@ def query_electricity(session, response, room_number, password, start_date, end_
                         f.write(electricity_info_response.text)
                     print(f"用电信息页面已保存到：{os.path.abspath(output_file)}")
                     
-                    # 分析用电信息页面的内容
-                    electricity_info_soup = BeautifulSoup(electricity_info_response.text, 'html.parser')
+                    # 每个月份的查询都复用用电信息页面的表单参数，只提取一次
+                    info_fields = extract_hidden_fields(electricity_info_response.text)
+                    electricity_info_response = None
                     
-                    # 初始化存储所有用电记录的列表
-                    all_electricity_records = []
+                    # 记录逐页写入CSV文件，内存中只保留条数和总用电量
+                    record_count = 0
+                    total_electricity = 0
                     headers = []
+                    # 同一读数日期的记录只计入一次（分页异常时同一行可能出现在两页中）
+                    dedup = DedupIndex()
+                    
+                    # 每取得一页记录就写入CSV文件
+                    csv_filename = csv_filename or f"electricity_records_{start_date}_{end_date}.csv"
+                    exporter = CsvExporter(csv_filename)
                     
                     # 解析日期范围
                     start_year, start_month = map(int, start_date.split('-'))
@@ -647,13 +666,9 @@ def query_electricity(session, response, room_number, password, start_date, end_
                         print(f"\n正在处理月份：{current_date}")
                         
                         # 构建表单数据，选择当前年月
-                        page_soup = BeautifulSoup(electricity_info_response.text, 'html.parser')
-                        viewstate = page_soup.find('input', {'name': '__VIEWSTATE'})['value']
-                        eventvalidation = page_soup.find('input', {'name': '__EVENTVALIDATION'})['value']
-                        
                         data = {
-                            '__VIEWSTATE': viewstate,
-                            '__EVENTVALIDATION': eventvalidation,
+                            '__VIEWSTATE': info_fields['__VIEWSTATE'],
+                            '__EVENTVALIDATION': info_fields['__EVENTVALIDATION'],
                             'ddlYear': str(current_year),
                             'ddlMonth': f"{current_month:02d}",
                             'btnSelect': '查 看'
@@ -665,11 +680,13 @@ def query_electricity(session, response, room_number, password, start_date, end_
                         
                         # 处理当前月份的分页
                         current_page_response = month_response
+                        month_response = None
                         has_next_page = True
                         
                         while has_next_page:
-                            # 分析当前页面的内容
+                            # 分析当前页面的内容，解析后立即释放响应
                             page_soup = BeautifulSoup(current_page_response.text, 'html.parser')
+                            current_page_response = None
                             
                             # 查找用电信息表格
                             table = page_soup.find('table', {'id': 'gvElecInfo'})
@@ -679,6 +696,7 @@ def query_electricity(session, response, room_number, password, start_date, end_
                                     headers = [th.text.strip() for th in table.find('tr').find_all('th')]
                                 
                                 # 提取数据行
+                                page_records = []
                                 rows = table.find_all('tr')[1:]
                                 for row in rows:
                                     # 检查是否是分页行
@@ -690,7 +708,17 @@ def query_electricity(session, response, room_number, password, start_date, end_
                                         record = [cell.text.strip() for cell in cells]
                                         # 过滤掉日用电量为空的记录
                                         if record[3] not in ['', ' ']:
-                                            all_electricity_records.append(record)
+                                            page_records.append(record)
+                                
+                                page_records = dedup.filter(room_number, page_records)
+                                record_count += len(page_records)
+                                for record in page_records:
+                                    if len(record) > 3 and record[3].strip():
+                                        try:
+                                            total_electricity += float(record[3])
+                                        except ValueError:
+                                            pass
+                                exporter.write_batch(headers, page_records, room_number)
                             
                             # 检查是否有下一页
                             has_next_page = False
@@ -708,6 +736,7 @@ def query_electricity(session, response, room_number, password, start_date, end_
                                 # 提取表单参数
                                 viewstate = page_soup.find('input', {'name': '__VIEWSTATE'})['value']
                                 eventvalidation = page_soup.find('input', {'name': '__EVENTVALIDATION'})['value']
+                                page_soup.decompose()
                                 
                                 # 构建分页请求数据
                                 pagination_data = {
@@ -722,6 +751,8 @@ def query_electricity(session, response, room_number, password, start_date, end_
                                 # 发送POST请求，获取下一页
                                 current_page_response = session.post("https://webvpn.ujs.edu.cn/http/77726476706e69737468656265737421f8e6429b3e296c1e6b029ae29d51367b6885/HouseElec.aspx", 
                                                                    data=pagination_data, verify=False)
+                            else:
+                                page_soup.decompose()
                         
                         # 移动到下一个月
                         current_month += 1
@@ -729,43 +760,16 @@ def query_electricity(session, response, room_number, password, start_date, end_
                             current_month = 1
                             current_year += 1
                     
-                    # 计算总用电量
-                    total_electricity = 0
-                    for record in all_electricity_records:
-                        if len(record) > 3 and record[3].strip():
-                            try:
-                                total_electricity += float(record[3])
-                            except ValueError:
-                                pass
+                    exporter.close()
+                    result = record_count
                     
-                    # 整理数据到txt文件
-                    if all_electricity_records:
-                        print(f"\n成功收集到{len(all_electricity_records)}条电费记录")
+                    if dedup.duplicates:
+                        print(f"\n⚠️ 跳过了{dedup.duplicates}条重复记录")
+                    if record_count:
+                        print(f"\n成功收集到{record_count}条电费记录")
                         print(f"周期内总用电量：{total_electricity} 度")
-                        
-                        # 生成文件名
-                        txt_filename = f"electricity_records_{start_date}_{end_date}.txt"
-                        
-                        # 写入数据到txt文件
-                        with open(txt_filename, 'w', encoding='utf-8') as f:
-                            f.write(f"电费记录 ({start_date} 到 {end_date})\n")
-                            f.write("=" * 80 + "\n")
-                            
-                            # 写入表头
-                            if headers:
-                                f.write(' | '.join(headers) + "\n")
-                                f.write("-" * 80 + "\n")
-                            
-                            # 写入记录
-                            for record in all_electricity_records:
-                                f.write(' | '.join(record) + "\n")
-                            
-                            f.write("=" * 80 + "\n")
-                            f.write(f"总记录数：{len(all_electricity_records)}\n")
-                            f.write(f"周期内总用电量：{total_electricity} 度\n")
-                        
-                        print(f"\n电费记录已保存到：{os.path.abspath(txt_filename)}")
-                        print(f"共保存了{len(all_electricity_records)}条记录")
+                        print(f"\n电费记录已保存到：{os.path.abspath(csv_filename)}")
+                        print(f"共保存了{record_count}条记录")
                     else:
                         print(f"\n在{start_date}到{end_date}范围内未找到电费记录")
                 else:
@@ -789,7 +793,7 @@ def query_electricity(session, response, room_number, password, start_date, end_
             else:
                 print("\n未找到电费信息，请手动检查查询结果文件。")
         
-        return response
+        return result
         
     except Exception as e:
         print(f"查询电费失败：{str(e)}")
@@ -797,33 +801,102 @@ def query_electricity(session, response, room_number, password, start_date, end_
         traceback.print_exc()
         return None
 
-def main():
+def query_room(session, campus, community, building, room_number, password, start_date, end_date,
+               csv_filename=None):
+    """
+    依次访问系统、选择校区、社区、楼栋并查询一个房间的电费，返回写入CSV文件的记录数，失败时返回None
+    """
+    # 每一步选择的下拉框值，之后的回发都带上它们
+    form_values = {}
+    response = get_electricity_page(session)
+    for select, value in ((select_campus, campus), (select_community, community), (select_building, building)):
+        if response is None:
+            return None
+        response = select(session, response, value, form_values)
+    if response is None:
+        return None
+    return query_electricity(session, response, room_number, password, start_date, end_date, csv_filename,
+                             form_values)
+
+def run_config(config_path, summary_path):
+    """
+    依次查询配置文件（格式见room_config.py）中的所有房间，不需要任何输入
+    每个房间的记录写入单独的CSV文件，返回退出码：0为全部成功，1为有房间失败，2为配置错误
+    """
+    from batch_query import EXIT_CONFIG, EXIT_FAILED, EXIT_OK, write_summary
+    from room_config import load_config
+    
     try:
-        # 获取会话
-        session = get_session()
+        config = load_config(config_path)
+    except ValueError as e:
+        print(f"❌ {str(e)}")
+        return EXIT_CONFIG
+    
+    end_default = config.get('end') or time.strftime('%Y-%m')
+    session = get_session(config.get('vpn_cookie'), interactive=False)
+    if session is None:
+        print("❌ 配置中没有vpn_cookie，也没有vpn_cookie.json，请先运行一次交互式查询")
+        return EXIT_CONFIG
+    rooms = []
+    for room in config['rooms']:
+        start_date = room['start']
+        end_date = room['end'] or end_default
+        csv_filename = (f"electricity_records_{room['community']}{room['building']}-{room['room']}"
+                        f"_{start_date}_{end_date}.csv")
+        error = None
+        records = None
+        if not start_date:
+            error = "没有设置start（开始月份）"
+        else:
+            try:
+                records = query_room(session, room['campus'], room['community'], room['building'], room['room'],
+                                     room['password'], start_date, end_date, csv_filename)
+                if records is None:
+                    error = "查询失败"
+            except Exception as e:
+                error = str(e)
+        rooms.append({
+            'room': '/'.join((room['campus'], room['community'], room['building'], room['room'])),
+            'start': start_date,
+            'end': end_date,
+            'status': 'ok' if error is None else 'failed',
+            'records': records or 0,
+            # 没有记录时不会生成CSV文件
+            'csv': os.path.abspath(csv_filename) if records else None,
+            'error': error
+        })
+    
+    failed = sum(1 for room in rooms if room['status'] != 'ok')
+    write_summary({'config': config_path, 'total': len(rooms), 'succeeded': len(rooms) - failed,
+                   'failed': failed, 'rooms': rooms}, summary_path)
+    return EXIT_FAILED if failed else EXIT_OK
+
+def main(argv=None):
+    """
+    不带参数时输入宿舍信息和日期后查询一个房间；
+    python vpn_access.py rooms.json [摘要路径] 按配置文件查询所有房间
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        sys.exit(run_config(argv[0], argv[1] if len(argv) > 1 else "vpn_access_summary.json"))
+    
+    try:
+        # 用户输入宿舍信息，默认为校本部A区1栋404
+        campus = input("请输入校区（默认：校本部）：").strip() or "校本部"
+        community = input("请输入社区（默认：A区）：").strip() or "A区"
+        building = input("请输入楼栋（默认：1）：").strip() or "1"
+        room = input("请输入房间号（默认：404）：").strip() or "404"
+        password = input("请输入查询密码（默认：111）：").strip() or "111"
         
-        # 访问电费查询系统
-        response = get_electricity_page(session)
+        # 用户输入开始年月和结束年月
+        start_date = input("请输入开始年月（格式：YYYY-MM，例如：2026-01）：").strip()
+        end_date = input("请输入结束年月（格式：YYYY-MM，例如：2026-02）：").strip()
         
-        if response:
-            # 选择校区为校本部
-            response = select_campus(session, response, '校本部')
-            
-            if response:
-                # 选择社区为A区
-                response = select_community(session, response, 'A区')
-                
-                if response:
-                    # 选择楼栋为1栋
-                    response = select_building(session, response, '1')
-                    
-                    if response:
-                        # 用户输入开始年月和结束年月
-                        start_date = input("请输入开始年月（格式：YYYY-MM，例如：2026-01）：").strip()
-                        end_date = input("请输入结束年月（格式：YYYY-MM，例如：2026-02）：").strip()
-                        
-                        # 查询校本部A区1栋404宿舍的电费，初始密码为111
-                        query_electricity(session, response, '404', '111', start_date, end_date)
+        session = get_session()
+        if session is None:
+            print("\n❌ 没有可用的VPN cookie，程序退出")
+            return
+        query_room(session, campus, community, building, room, password, start_date, end_date)
                     
     except Exception as e:
         print(f"操作失败：{str(e)}")